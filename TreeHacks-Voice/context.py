@@ -0,0 +1,187 @@
+import re
+
+# Word pieces and punctuation, the units a BPE tokenizer rarely merges across.
+TOKEN_PIECE = re.compile(r"[A-Za-z]{1,4}|\d{1,3}|[^\sA-Za-z\d]")
+# Role and delimiter tokens every chat message costs on top of its content.
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    Local estimate of a text's token count, without a tokenizer download:
+    every run of up to four letters, up to three digits, or a punctuation
+    mark counts as one token. Errs slightly high for Llama-style tokenizers,
+    which is the safe side for a budget.
+    """
+    return len(TOKEN_PIECE.findall(text))
+
+
+def excerpt_turns(turns, words_per_message: int = 16) -> list:
+    """
+    One line per message of the folded turns: the role and the first few
+    words of what was said. This truncates rather than summarizes, so
+    anything later in a message is lost; facts that must outlive the
+    verbatim history belong in ConversationContext's `facts`.
+    """
+    lines = []
+    for turn in turns:
+        for message in turn:
+            words = message["content"].split()
+            text = " ".join(words[:words_per_message]) + (" ..." if len(words) > words_per_message else "")
+            lines.append(f"{message['role'].capitalize()}: {text}")
+    return lines
+
+
+class ConversationContext:
+    """
+    Chat history sent to the LLM, bounded by a token budget.
+
+    The system prompt is pinned, the last `keep_turns` turns (a user message
+    and the replies to it) are kept verbatim, and older turns are folded
+    into a summary message placed after the system prompt. The summary opens
+    with key facts pulled from the folded turns (say, the destination asked
+    for), newest value per fact, which are never trimmed; excerpts of the
+    folded messages fill the rest of `summary_tokens`, newest kept. However
+    long the session runs a request costs at most about `max_tokens`. If the
+    verbatim turns alone exceed the budget, fewer of them are kept, down to
+    the latest one.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        max_tokens: int = 2048,
+        keep_turns: int = 4,
+        summary_tokens: int = 256,
+        count=count_tokens,
+        summarize=excerpt_turns,
+        facts=None,
+    ):
+        """
+        :param system_prompt: Pinned first message.
+        :param max_tokens: Budget for the messages of one request.
+        :param keep_turns: Most recent turns kept verbatim.
+        :param summary_tokens: Budget for the summary of older turns.
+        :param count: Callable text -> token count.
+        :param summarize: Callable [turn, ...] -> [summary line, ...] for turns being folded.
+        :param facts: Callable [turn, ...] -> {name: value} of key facts in turns being folded, or None.
+        """
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.count = count
+        self.summarize = summarize
+        self.extract_facts = facts
+        # Each turn is a list of messages starting (except maybe the first) with the user's.
+        self.turns = []
+        self.summary = []
+        self.facts = {}
+        self.folded_turns = 0
+        self.system = None
+        self.set_system(system_prompt)
+
+    def _message(self, role, content):
+        return {"role": role, "content": content, "tokens": self.count(content) + MESSAGE_OVERHEAD}
+
+    def set_system(self, system_prompt: str):
+        """Replace the pinned system prompt, e.g. once the destination is known."""
+        self.system = self._message("system", system_prompt)
+        # A longer prompt leaves less room for the turns.
+        self._fold()
+
+    def add(self, role: str, content: str):
+        """Append a message; a user message starts a new turn."""
+        if role == "user" or not self.turns:
+            self.turns.append([])
+        self.turns[-1].append(self._message(role, content))
+        self._fold()
+
+    def _turn_tokens(self, turn):
+        return sum(message["tokens"] for message in turn)
+
+    def _fact_lines(self):
+        return [f"{name}: {value}" for name, value in self.facts.items()]
+
+    def _summary_message(self):
+        parts = []
+        if self.facts:
+            parts.append("Known so far:\n" + "\n".join(self._fact_lines()))
+        if self.summary:
+            parts.append("Earlier in this conversation:\n" + "\n".join(self.summary))
+        if not parts:
+            return None
+        return self._message("system", "\n\n".join(parts))
+
+    def _fold(self):
+        """Fold the oldest turns into the summary until the turn count and the budget are respected."""
+        verbatim = sum(self._turn_tokens(turn) for turn in self.turns)
+        budget = self.max_tokens - self.system["tokens"] - self.summary_tokens
+        while len(self.turns) > 1 and (len(self.turns) > self.keep_turns or verbatim > budget):
+            turn = self.turns.pop(0)
+            verbatim -= self._turn_tokens(turn)
+            self.summary.extend(self.summarize([turn]))
+            if self.extract_facts is not None:
+                self.facts.update(self.extract_facts([turn]))
+            self.folded_turns += 1
+
+        # Keep the newest summary lines within what the facts leave of their budget.
+        budget = self.summary_tokens - sum(self.count(line) + 1 for line in self._fact_lines())
+        line_tokens = [self.count(line) + 1 for line in self.summary]
+        total = sum(line_tokens)
+        drop = 0
+        while total > budget and drop < len(self.summary):
+            total -= line_tokens[drop]
+            drop += 1
+        del self.summary[:drop]
+
+    def messages(self):
+        """The messages to send: system prompt, summary of older turns, then the recent turns verbatim."""
+        pinned = [self.system]
+        summary = self._summary_message()
+        if summary is not None:
+            pinned.append(summary)
+        return [
+            {"role": message["role"], "content": message["content"]}
+            for message in pinned + [message for turn in self.turns for message in turn]
+        ]
+
+    def tokens(self):
+        """Estimated token count of messages()."""
+        summary = self._summary_message()
+        return (
+            self.system["tokens"]
+            + (summary["tokens"] if summary is not None else 0)
+            + sum(self._turn_tokens(turn) for turn in self.turns)
+        )
+
+    def stats(self):
+        return {
+            "tokens": self.tokens(),
+            "verbatim_turns": len(self.turns),
+            "folded_turns": self.folded_turns,
+            "summary_lines": len(self.summary),
+            "facts": len(self.facts),
+        }
+
+
+if __name__ == "__main__":
+    def destination(turns):
+        """The last room the user asked to go to."""
+        facts = {}
+        for turn in turns:
+            for message in turn:
+                match = re.search(r"take me to (room \w+)", message["content"], re.I)
+                if message["role"] == "user" and match:
+                    facts["Destination"] = match.group(1)
+        return facts
+
+    context = ConversationContext("You are a navigation assistant. " * 20, max_tokens=1024, facts=destination)
+    context.add("assistant", "Hey Michael! Where do you want to go?")
+    context.add("user", "Take me to room 252 please.")
+    context.add("assistant", "Sure, heading to room 252.")
+    for turn in range(1, 201):
+        context.add("user", f"Question {turn}: how far is it to room 2{turn:02d} from here, and which way should I turn?")
+        context.add("assistant", f"Answer {turn}: keep walking straight for about {turn % 30 + 5} meters, then turn left. " * 3)
+        if turn in (1, 5, 10, 50, 200):
+            print(f"turn {turn:>3}: {context.stats()}")
+    print(context.messages()[1]["content"].split("\n\n")[0])
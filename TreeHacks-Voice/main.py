@@ -1,10 +1,13 @@
 import time
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from groq import Groq
 from stt import SpeechRecognizer
-from tts import TextToSpeech
-from tools import find_destination
+from tts import TextToSpeech, DIRECTION_PHRASES
+from tools import find_destination, lookup_route
+from streaming import GroqChat, speak_reply
+from context import ConversationContext
 
 # Load API keys
 with open("api_keys.txt", "r") as f:
@@ -23,6 +26,14 @@ with open("locations.json", "r") as f:
 
 # Debugging flag
 DEBUG_MODE = True
+# Speak replies sentence by sentence while they are generated, instead of after the full completion.
+STREAM_REPLIES = True
+
+# Fixed lines spoken by the assistant; synthesized once at startup and played from the cache.
+GREETING = "Hey Michael! Where do you want to go?"
+LOOK_AROUND = "Alright, can you look around for a few seconds so I can get a sense of our location?"
+LOCATION_FOUND = "I think I've found the location. I've sent the instructions to your belt."
+SYSTEM_PHRASES = [GREETING, LOOK_AROUND, LOCATION_FOUND]
 
 # Initialize variables
 current_location = "Terman Library"  # Example default location
@@ -30,10 +41,15 @@ destination = None
 
 # Initialize Groq client
 client = Groq(api_key=groq_api_key)
+chat = GroqChat(client, model="llama-3.3-70b-versatile", temperature=1, max_completion_tokens=1024, top_p=1)
 
 # Initialize STT and TTS
 recognizer = SpeechRecognizer(api_key=groq_api_key)
 tts_engine = TextToSpeech(api_key=elevenlabs_api_key)
+tts_engine.warm_up(SYSTEM_PHRASES + DIRECTION_PHRASES)
+
+# Route lookups run in the background so they can start on a partial transcript.
+route_lookups = ThreadPoolExecutor(max_workers=1, thread_name_prefix="route-lookup")
 
 
 def log_debug(message):
@@ -50,40 +66,73 @@ def format_system_prompt():
     return formatted_prompt
 
 
+def destination_facts(turns):
+    """Destinations the user asked for in turns folded out of the history, so they are not forgotten."""
+    facts = {}
+    for turn in turns:
+        for message in turn:
+            detected = find_destination(message["content"]) if message["role"] == "user" else None
+            if detected:
+                facts["Destination the user asked for"] = detected
+    return facts
+
+
 def chat_loop():
     """Main loop for continuous voice interaction."""
     global destination
 
     system_prompt = format_system_prompt()
-    conversation_history = [
-        {"role": "system", "content": system_prompt},
-        {"role": "assistant", "content": "Hey Michael! Where do you want to go?"}
-    ]
+    # Bounded history: pinned system prompt, recent turns verbatim, older turns summarized.
+    conversation_history = ConversationContext(
+        system_prompt, max_tokens=2048, keep_turns=4, facts=destination_facts
+    )
+    conversation_history.add("assistant", GREETING)
 
-    tts_engine.speak("Hey Michael! Where do you want to go?")
+    tts_engine.speak(GREETING)
 
     while True:
         print("Listening for user input...")
-        user_text = recognizer.listen_once()
+        # Destination matched in a partial transcript and its route lookup, started while the user is still talking.
+        early_lookup = {}
+
+        def on_partial(partial_text):
+            log_debug(f"Partial: {partial_text}")
+            if destination is None:
+                detected = find_destination(partial_text)
+                if detected and detected != early_lookup.get("destination"):
+                    if "route" in early_lookup:
+                        early_lookup["route"].cancel()
+                    log_debug(f"Looking up route to {detected} early")
+                    early_lookup.update(destination=detected, route=route_lookups.submit(lookup_route, detected))
+
+        user_text = recognizer.listen_once(on_partial=on_partial)
         if not user_text:
             continue
 
         log_debug(f"User said: {user_text}")
-        conversation_history.append({"role": "user", "content": user_text})
+        conversation_history.add("user", user_text)
 
-        # Check for destination
+        # Check for destination; the final transcript decides, an early lookup is only kept if it agrees.
         if destination is None:
             detected_destination = find_destination(user_text)
+            route = early_lookup.get("route")
+            if route is not None and early_lookup["destination"] != detected_destination:
+                log_debug(f"Dropping early route to {early_lookup['destination']}")
+                route.cancel()
+                route = None
             if detected_destination:
                 destination = detected_destination
                 log_debug(f"Destination set to: {destination}")
                 system_prompt = format_system_prompt()
-                conversation_history[0] = {"role": "system", "content": system_prompt}
+                conversation_history.set_system(system_prompt)
+                if route is None:
+                    route = route_lookups.submit(lookup_route, destination)
 
                 # Speak fixed messages
-                tts_engine.speak("Alright, can you look around for a few seconds so I can get a sense of our location?")
+                tts_engine.speak(LOOK_AROUND)
                 time.sleep(2.5)
-                tts_engine.speak("I think I've found the location. I've sent the instructions to your belt.")
+                log_debug(f"Route: {route.result()}")
+                tts_engine.speak(LOCATION_FOUND)
 
                 continue  # Go back to listening
 
@@ -91,9 +140,17 @@ def chat_loop():
         log_debug(f"Destination: {destination if destination else 'None'}")
 
         # Get AI response
+        if STREAM_REPLIES:
+            ai_response, timings = speak_reply(chat, conversation_history.messages(), tts_engine)
+            log_debug(f"AI Response: {ai_response}")
+            log_debug(f"Reply timings: {timings}")
+            log_debug(f"Context: {conversation_history.stats()}")
+            conversation_history.add("assistant", ai_response)
+            continue
+
         completion = client.chat.completions.create(
             model="llama-3.3-70b-versatile",
-            messages=conversation_history,
+            messages=conversation_history.messages(),
             temperature=1,
             max_completion_tokens=1024,
             top_p=1,
@@ -103,7 +160,7 @@ def chat_loop():
         ai_response = completion.choices[0].message.content.strip()
         log_debug(f"AI Response: {ai_response}")
 
-        conversation_history.append({"role": "assistant", "content": ai_response})
+        conversation_history.add("assistant", ai_response)
 
         # Convert AI response to speech
         tts_engine.speak(ai_response)
@@ -0,0 +1,275 @@
+import queue
+import re
+import threading
+import time
+
+# End of a sentence: terminal punctuation (plus closing quotes or brackets) followed by whitespace.
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+# Abbreviations whose period does not end a sentence, as in "Dr. Smith" or "Serra St. entrance".
+ABBREVIATION = re.compile(r"\b(?:Dr|St|Mr|Mrs|Ms|Prof|Ave|Rd|Blvd|Bldg|Rm|vs|e\.g|i\.e)$")
+
+
+def split_sentences(tokens, min_chars: int = 12):
+    """
+    Cut a stream of text fragments into sentences as soon as each one ends.
+
+    :param tokens: Iterable of text fragments, e.g. streamed LLM tokens.
+    :param min_chars: Sentences shorter than this are joined with the next one,
+                      so "Sure." is not synthesized on its own.
+    """
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        start = 0
+        for match in SENTENCE_END.finditer(buffer):
+            if buffer[match.start()] == "." and ABBREVIATION.search(buffer, start, match.start()):
+                continue
+            if match.end() - start >= min_chars:
+                sentence = buffer[start:match.end()].strip()
+                start = match.end()
+                if sentence:
+                    yield sentence
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+class ChatBackend:
+    """Streams a chat completion as text fragments."""
+
+    def stream(self, messages):
+        raise NotImplementedError
+
+
+class GroqChat(ChatBackend):
+    """Groq chat completions with stream=True."""
+
+    def __init__(self, client, model: str = "llama-3.3-70b-versatile", **params):
+        """
+        :param client: A groq.Groq client.
+        :param model: Chat model name.
+        :param params: Sampling parameters passed through, e.g. temperature.
+        """
+        self.client = client
+        self.model = model
+        self.params = params
+
+    def stream(self, messages):
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            **self.params
+        )
+        for chunk in completion:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class FakeChat(ChatBackend):
+    """
+    Local stand-in for latency measurements: streams a scripted reply word
+    by word at a fixed rate after a fixed time to first token.
+    """
+
+    def __init__(self, reply: str, tokens_per_second: float = 50.0, first_token_delay: float = 0.3):
+        """
+        :param reply: Text every completion returns.
+        :param tokens_per_second: Generation rate; each word (with its trailing space) is one token.
+        :param first_token_delay: Seconds before the first token, to stand in for the network and prefill.
+        """
+        self.tokens = re.findall(r"\S+\s*", reply)
+        self.tokens_per_second = tokens_per_second
+        self.first_token_delay = first_token_delay
+
+    def stream(self, messages):
+        time.sleep(self.first_token_delay)
+        for i, token in enumerate(self.tokens):
+            if i:
+                time.sleep(1 / self.tokens_per_second)
+            yield token
+
+
+class FakeTextToSpeech:
+    """
+    Local stand-in for TextToSpeech with the same audio()/play() interface:
+    synthesis yields silent chunks after a fixed delay, playback takes as
+    long as the text would take to say.
+    """
+
+    def __init__(self, first_chunk_delay: float = 0.25, chars_per_second: float = 15.0, chunk_size: int = 4096):
+        """
+        :param first_chunk_delay: Seconds until synthesis yields its first chunk.
+        :param chars_per_second: Speaking rate that sets playback duration.
+        :param chunk_size: Bytes per audio chunk.
+        """
+        self.first_chunk_delay = first_chunk_delay
+        self.chars_per_second = chars_per_second
+        self.chunk_size = chunk_size
+        self.spoken = []
+
+    def audio(self, text: str):
+        time.sleep(self.first_chunk_delay)
+        self.spoken.append(text)
+        duration = len(text) / self.chars_per_second
+        # One chunk per 100 ms of speech, produced as fast as it is consumed.
+        for _ in range(max(1, int(duration * 10))):
+            yield bytes(self.chunk_size)
+
+    def play(self, audio_stream):
+        for _ in audio_stream:
+            time.sleep(0.1)
+
+    def speak(self, text: str, play_audio: bool = True):
+        if play_audio:
+            self.play(self.audio(text))
+        else:
+            list(self.audio(text))
+
+
+class StreamingReply:
+    """
+    Speaks a streamed completion sentence by sentence while it is still
+    being generated.
+
+    Completed sentences go into a queue drained by a synthesizer thread,
+    which hands each sentence's audio to a player thread through a small
+    bounded queue. The first sentence is playing while later ones are still
+    being generated, the next sentence is synthesized while the current one
+    plays, and sentences play in order. Timestamps of each stage are kept
+    for measuring time to first audio.
+    """
+
+    def __init__(self, tts, min_chars: int = 12, lookahead: int = 2):
+        """
+        :param tts: A TextToSpeech (or FakeTextToSpeech): audio(text) yields chunks, play(chunks) plays them.
+        :param min_chars: Shortest sentence synthesized on its own; see split_sentences.
+        :param lookahead: Sentences synthesized ahead of the one playing.
+        """
+        self.tts = tts
+        self.min_chars = min_chars
+        self.sentences = queue.Queue()
+        # Per-sentence chunk queues, in playing order; each ends with None.
+        self.clips = queue.Queue(maxsize=lookahead)
+        self.started = None
+        self.first_token = None
+        self.first_sentence = None
+        self.first_audio = None
+        self.generated = None
+        self.finished = None
+
+    def _synthesizer(self):
+        while (sentence := self.sentences.get()) is not None:
+            chunks = queue.Queue()
+            self.clips.put(chunks)
+            try:
+                for chunk in self.tts.audio(sentence):
+                    chunks.put(chunk)
+            except Exception as e:
+                print("TTS failed for sentence:", e)
+            finally:
+                chunks.put(None)
+        self.clips.put(None)
+
+    def _player(self):
+        while (chunks := self.clips.get()) is not None:
+            try:
+                self.tts.play(self._timed(iter(chunks.get, None)))
+            except Exception as e:
+                print("Playback failed for sentence:", e)
+                # Drain the rest so the synthesizer is never left waiting on this clip.
+                for _ in iter(chunks.get, None):
+                    pass
+
+    def _timed(self, audio_stream):
+        for chunk in audio_stream:
+            if self.first_audio is None:
+                self.first_audio = time.monotonic()
+            yield chunk
+
+    def _tokens(self, tokens):
+        for token in tokens:
+            if self.first_token is None:
+                self.first_token = time.monotonic()
+            yield token
+
+    def speak(self, tokens) -> str:
+        """
+        Speak a stream of text fragments; returns once everything has been
+        played, with the full text.
+        """
+        self.started = time.monotonic()
+        synthesizer = threading.Thread(target=self._synthesizer, name="tts-synthesizer", daemon=True)
+        player = threading.Thread(target=self._player, name="tts-player", daemon=True)
+        synthesizer.start()
+        player.start()
+        spoken = []
+        try:
+            for sentence in split_sentences(self._tokens(tokens), self.min_chars):
+                if self.first_sentence is None:
+                    self.first_sentence = time.monotonic()
+                spoken.append(sentence)
+                self.sentences.put(sentence)
+        finally:
+            self.generated = time.monotonic()
+            self.sentences.put(None)
+            synthesizer.join()
+            player.join()
+            self.finished = time.monotonic()
+        return " ".join(spoken)
+
+    def timings(self):
+        """Seconds from the start of speak() to each stage, or None for stages not reached."""
+        def since(mark):
+            return None if mark is None or self.started is None else mark - self.started
+
+        return {
+            "first_token": since(self.first_token),
+            "first_sentence": since(self.first_sentence),
+            "first_audio": since(self.first_audio),
+            "generated": since(self.generated),
+            "finished": since(self.finished),
+        }
+
+
+def speak_reply(chat, messages, tts, min_chars: int = 12):
+    """Stream a reply from `chat` into `tts`; returns (text, timings)."""
+    reply = StreamingReply(tts, min_chars)
+    text = reply.speak(chat.stream(messages))
+    return text, reply.timings()
+
+
+def _whole(tokens):
+    yield "".join(tokens)
+
+
+def speak_reply_sequential(chat, messages, tts):
+    """The unpipelined path, for comparison: wait for the full reply, then synthesize and play it."""
+    reply = StreamingReply(tts, min_chars=float("inf"))
+    text = reply.speak(_whole(chat.stream(messages)))
+    return text, reply.timings()
+
+
+def benchmark(reply=None, **fake):
+    """
+    Time to first audio for the sequential and pipelined paths with local
+    fake backends. Keyword arguments override FakeChat/FakeTextToSpeech
+    settings (tokens_per_second, first_token_delay, first_chunk_delay, chars_per_second).
+    """
+    reply = reply or (
+        "Head straight down the hallway past the elevators. "
+        "At the end, turn left and keep going for about twenty meters. "
+        "Room 226 will be the second door on your right."
+    )
+    chat_options = {k: fake[k] for k in ("tokens_per_second", "first_token_delay") if k in fake}
+    tts_options = {k: fake[k] for k in ("first_chunk_delay", "chars_per_second") if k in fake}
+    results = {}
+    for name, run in (("sequential", speak_reply_sequential), ("pipelined", speak_reply)):
+        _, timings = run(FakeChat(reply, **chat_options), [], FakeTextToSpeech(**tts_options))
+        results[name] = timings
+    return results
+
+
+if __name__ == "__main__":
+    for name, timings in benchmark().items():
+        print(f"{name:>10}: " + ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in timings.items()))
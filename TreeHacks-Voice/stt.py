@@ -1,28 +1,204 @@
-import os
+import io
 import queue
+import threading
 import time
 import torch
 import torchaudio
 import pyaudio
 import numpy as np
 import wave
+from concurrent.futures import ThreadPoolExecutor
 from groq import Groq
 from silero_vad import load_silero_vad
 
 
+class TranscriptionBackend:
+    """Turns in-memory 16 kHz mono int16 audio into text."""
+
+    def transcribe(self, audio: np.ndarray, rate: int = 16000, prompt: str = None, offset: float = 0.0) -> str:
+        """
+        :param audio: One segment of an utterance.
+        :param rate: Sample rate.
+        :param prompt: Transcript of the utterance before this segment, for continuity.
+        :param offset: Seconds of the utterance before this segment.
+        """
+        raise NotImplementedError
+
+
+class GroqWhisperBackend(TranscriptionBackend):
+    """Groq Whisper; audio is uploaded as an in-memory WAV, nothing touches the disk."""
+
+    def __init__(self, api_key: str, model: str = "whisper-large-v3-turbo"):
+        self.client = Groq(api_key=api_key)
+        self.model = model
+
+    def transcribe(self, audio: np.ndarray, rate: int = 16000, prompt: str = None, offset: float = 0.0) -> str:
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(rate)
+            wf.writeframes(audio.astype(np.int16).tobytes())
+        options = {"prompt": prompt} if prompt else {}
+        transcription = self.client.audio.transcriptions.create(
+            file=("audio.wav", buffer.getvalue()),
+            model=self.model,
+            response_format="verbose_json",
+            **options,
+        )
+        return transcription.text.strip()
+
+
+class FakeBackend(TranscriptionBackend):
+    """
+    Local stand-in for tests and latency measurements: returns the words of
+    a scripted transcript spoken during the segment it was given, at a fixed
+    speaking rate.
+    """
+
+    def __init__(
+        self,
+        transcript: str,
+        words_per_second: float = 2.5,
+        delay: float = 0.0,
+        seconds_per_audio_second: float = 0.0,
+    ):
+        """
+        :param transcript: Text the full utterance transcribes to.
+        :param words_per_second: Speaking rate used to decide which words a segment holds.
+        :param delay: Seconds each call takes, to stand in for the network round trip.
+        :param seconds_per_audio_second: Extra seconds per second of audio, for upload and inference.
+        """
+        self.words = transcript.split()
+        self.words_per_second = words_per_second
+        self.delay = delay
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.calls = 0
+        self.audio_seconds = 0.0
+
+    def transcribe(self, audio: np.ndarray, rate: int = 16000, prompt: str = None, offset: float = 0.0) -> str:
+        duration = len(audio) / rate
+        self.calls += 1
+        self.audio_seconds += duration
+        time.sleep(self.delay + duration * self.seconds_per_audio_second)
+        # Words whose start falls inside [offset, offset + duration); consecutive segments partition the transcript.
+        first = int(offset * self.words_per_second)
+        last = int((offset + duration) * self.words_per_second)
+        return " ".join(self.words[first:last])
+
+
+class EnergyVAD:
+    """
+    Stand-in for the Silero model in latency measurements: a window is speech
+    when its mean absolute amplitude exceeds `threshold`.
+    """
+
+    def __init__(self, threshold: float = 0.1):
+        self.threshold = threshold
+
+    def __call__(self, window, rate):
+        return torch.full((1, 1), float(window.abs().mean() > self.threshold))
+
+    def to(self, device):
+        return self
+
+
+class VoiceActivityDetector:
+    """
+    Silero VAD over 512-sample int16 chunks without per-chunk allocations.
+
+    Chunks are converted into rows of a preallocated float32 window array
+    that a torch tensor shares memory with, and probabilities are written
+    into a preallocated output tensor that is read back once per batch.
+    Silero keeps recurrent state between calls, so the rows of a batch go
+    through the model in order; batching saves the per-chunk conversions,
+    allocations and reads, not the forward passes.
+    """
+
+    def __init__(self, model, rate: int = 16000, chunk: int = 512, max_batch: int = 32):
+        self.model = model
+        self.rate = rate
+        self.chunk = chunk
+        self.max_batch = max_batch
+        self.windows = np.zeros((max_batch, chunk), dtype=np.float32)
+        self.input = torch.from_numpy(self.windows)
+        self.probabilities = np.zeros(max_batch, dtype=np.float32)
+        self.output = torch.from_numpy(self.probabilities)
+
+        # Counters
+        self.cpu_seconds = 0.0
+        self.samples = 0
+        self.batches = 0
+
+    def process(self, chunks):
+        """
+        Speech probability of each chunk (at most max_batch of them).
+
+        :return: A view into a reused array; valid until the next call.
+        """
+        started = time.thread_time()
+        n = len(chunks)
+        for i, chunk in enumerate(chunks):
+            np.multiply(np.frombuffer(chunk, dtype=np.int16), 1 / 32768.0, out=self.windows[i], casting="unsafe")
+        with torch.inference_mode():
+            for i in range(n):
+                self.output[i:i + 1] = self.model(self.input[i:i + 1], self.rate).view(-1)
+        self.cpu_seconds += time.thread_time() - started
+        self.samples += n * self.chunk
+        self.batches += 1
+        return self.probabilities[:n]
+
+    def stats(self):
+        """VAD CPU seconds per second of audio, plus totals."""
+        audio_seconds = self.samples / self.rate
+        return {
+            "audio_seconds": audio_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "cpu_per_audio_second": self.cpu_seconds / audio_seconds if audio_seconds else 0.0,
+            "mean_batch": self.samples / self.chunk / self.batches if self.batches else 0.0,
+        }
+
+
 class SpeechRecognizer:
-    """Modular Speech Recognition using Silero VAD & Groq Whisper."""
+    """
+    Modular Speech Recognition using Silero VAD & a streaming transcription backend.
 
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        self.client = Groq(api_key=self.api_key)
+    While the user talks, each new `partial_interval` of speech is cut at its
+    quietest recent chunk and sent on its own, with the transcript so far as
+    context. The transcripts of the sent segments make up the partial
+    hypothesis, so nothing is uploaded twice. Once the utterance ends only
+    the remaining tail is transcribed, which keeps final latency independent
+    of how long the user spoke.
+    """
+
+    def __init__(
+        self,
+        api_key: str = None,
+        backend: TranscriptionBackend = None,
+        partial_interval: float = 1.0,
+        open_stream: bool = True,
+        max_utterance: float = 30.0,
+        vad_model=None,
+    ):
+        """
+        :param api_key: Groq API key, used when no backend is given.
+        :param backend: Where audio is transcribed; defaults to Groq Whisper.
+        :param partial_interval: Seconds of new speech per segment sent while the user talks; None sends
+                                 the whole utterance once it ends.
+        :param open_stream: Capture from the microphone; False to feed audio_queue yourself.
+        :param max_utterance: Seconds of speech kept per utterance; older audio is overwritten.
+        :param vad_model: Voice activity model; Silero VAD by default.
+        """
+        self.backend = backend if backend is not None else GroqWhisperBackend(api_key)
+        self.partial_interval = partial_interval
+        # One request at a time; the next segment goes out once the previous one is back.
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt-backend")
 
         self.audio_queue = queue.Queue()
         self.running = True
-        self.pyaudio_instance = pyaudio.PyAudio()
 
         # Load Silero VAD model
-        self.model = load_silero_vad()
+        self.model = vad_model if vad_model is not None else load_silero_vad()
         self.device = torch.device("cpu")  # Run on CPU
         self.model.to(self.device)
 
@@ -32,88 +208,252 @@ class SpeechRecognizer:
         self.RATE = 16000  # Silero VAD requires 16kHz
         self.CHUNK = 512  # Silero VAD only supports 512 for 16kHz
 
-        # Set up PyAudio input stream
-        self.stream = self.pyaudio_instance.open(
-            format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.RATE,
-            input=True,
-            frames_per_buffer=self.CHUNK,
-            stream_callback=self.audio_callback
-        )
+        self.vad = VoiceActivityDetector(self.model, self.RATE, self.CHUNK)
+        self._stream = None
+        # Speech of the current utterance, in a preallocated ring of whole chunks.
+        self.ring = np.zeros(int(max_utterance * self.RATE) // self.CHUNK * self.CHUNK, dtype=np.int16)
+        # Speech probability of each chunk in the ring, for choosing where to cut segments.
+        self.ring_probabilities = np.zeros(len(self.ring) // self.CHUNK, dtype=np.float32)
+        self.utterance_samples = 0
+
+        self.pyaudio_instance = None
+        self.stream = None
+        if open_stream:
+            # Set up PyAudio input stream
+            self.pyaudio_instance = pyaudio.PyAudio()
+            self.stream = self.pyaudio_instance.open(
+                format=self.FORMAT,
+                channels=self.CHANNELS,
+                rate=self.RATE,
+                input=True,
+                frames_per_buffer=self.CHUNK,
+                stream_callback=self.audio_callback
+            )
 
     def audio_callback(self, in_data, frame_count, time_info, status):
         """Callback function to receive and queue audio chunks."""
         self.audio_queue.put(in_data)
         return (in_data, pyaudio.paContinue)
 
-    def save_audio(self, filename, audio_data):
-        """Save recorded audio to a .m4a file for transcription."""
-        with wave.open(filename, "wb") as wf:
-            wf.setnchannels(self.CHANNELS)
-            wf.setsampwidth(self.pyaudio_instance.get_sample_size(self.FORMAT))
-            wf.setframerate(self.RATE)
-            wf.writeframes(b''.join(audio_data))
-
-    def transcribe_audio(self, filename):
-        """Send recorded audio file to Groq Whisper for transcription."""
-        with open(filename, "rb") as file:
-            transcription = self.client.audio.transcriptions.create(
-                file=(filename, file.read()),
-                model="whisper-large-v3-turbo",
-                response_format="verbose_json",
-            )
-        return transcription.text
+    def utterance_audio(self, start=0, end=None):
+        """
+        Copy of samples [start, end) of the current utterance's speech, oldest
+        first; samples already overwritten in the ring are left out.
+        """
+        size = len(self.ring)
+        end = self.utterance_samples if end is None else end
+        start = max(start, end - size, self.utterance_samples - size, 0)
+        if start >= end:
+            return np.zeros(0, dtype=np.int16)
+        first, last = start % size, end % size
+        if first < last or last == 0:
+            return self.ring[first:last or size].copy()
+        # Wrapped around the end of the ring.
+        return np.concatenate((self.ring[first:], self.ring[:last]))
+
+    def transcribe_audio(self, audio, prompt=None, offset=0.0):
+        """Transcribe int16 samples straight from memory."""
+        return self.backend.transcribe(audio, self.RATE, prompt=prompt, offset=offset)
 
-    def listen_once(self):
+    def _cut_point(self, start, end):
         """
-        Waits until speech is detected, records until silence,
-        ensures at least 1s of recording, then transcribes and returns text.
+        Where to end a segment of [start, end): after the chunk least likely to
+        be speech among the newest third, so cuts tend to fall between words.
+        """
+        first = (start + 2 * (end - start) // 3) // self.CHUNK
+        last = end // self.CHUNK
+        if first >= last:
+            return end
+        chunks = np.arange(first, last)
+        quietest = chunks[np.argmin(self.ring_probabilities[chunks % len(self.ring_probabilities)])]
+        return int(quietest + 1) * self.CHUNK
+
+    def _submit_segment(self, start, end, committed):
+        context = " ".join(committed)[-200:] or None
+        return self.executor.submit(self.transcribe_audio, self.utterance_audio(start, end), context, start / self.RATE)
+
+    def _next_batch(self):
+        """Block for one chunk, then take whatever else is already queued, up to the VAD batch size."""
+        batch = [self.audio_queue.get()]
+        while batch[-1] is not None and len(batch) < self.vad.max_batch:
+            try:
+                batch.append(self.audio_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def listen_stream(self):
+        """
+        Waits until speech is detected and yields (text, is_final) while the
+        user talks: the transcript so far each time another segment of about
+        `partial_interval` seconds comes back, then the final transcript once
+        0.75 s of silence ends an utterance of at least 1 s.
         """
-        audio_buffer = []
         speech_detected = False
-        silence_start = None
-        start_time = None  # Track total recording duration
+        silence_samples = 0
+        # Texts of the segments transcribed so far, the segment in flight with its
+        # start, and the first sample not yet sent.
+        committed = []
+        pending = None
+        segment_start = 0
 
         while self.running:
-            in_data = self.audio_queue.get()
-            audio_chunk = np.frombuffer(in_data, dtype=np.int16)
-            audio_tensor = torch.from_numpy(audio_chunk).float() / 32768.0  # Normalize audio
-            audio_tensor = audio_tensor.unsqueeze(0).to(self.device)
-
-            # Compute VAD probability
-            with torch.no_grad():
-                vad_prob = self.model(audio_tensor, sr=16000).item()
-
-            if vad_prob > 0.5:
-                if not speech_detected:
-                    speech_detected = True
-                    audio_buffer = []  # Reset buffer
-                    silence_start = None  # Reset silence timer
-                    start_time = time.time()  # Start recording time
-
-                audio_buffer.append(in_data)  # Collect audio data
-
-            elif speech_detected:  # If silence starts
-                if silence_start is None:
-                    silence_start = time.time()  # Start silence timer
-
-                elif time.time() - silence_start > 0.75:  # 0.75s of silence
-                    duration = time.time() - start_time  # Total recording duration
-
-                    if duration >= 1.0:  # Ensure at least 1s recording
-                        filename = os.path.dirname(__file__) + "/audio.m4a"
-                        self.save_audio(filename, audio_buffer)
-                        return self.transcribe_audio(filename)
-                    else:
-                        # Ignore short recordings, reset
+            batch = self._next_batch()
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+
+            for in_data, vad_prob in zip(batch, self.vad.process(batch)):
+                if vad_prob > 0.5:
+                    if not speech_detected:
+                        speech_detected = True
+                        self.utterance_samples = 0  # Reset buffer
+                        committed, pending, segment_start = [], None, 0
+                    silence_samples = 0  # Reset silence timer
+                    # Collect audio data
+                    offset = self.utterance_samples % len(self.ring)
+                    self.ring[offset:offset + self.CHUNK] = np.frombuffer(in_data, dtype=np.int16)
+                    self.ring_probabilities[offset // self.CHUNK] = vad_prob
+                    self.utterance_samples += self.CHUNK
+
+                elif speech_detected:  # If silence starts
+                    silence_samples += self.CHUNK
+
+                    if silence_samples > 0.75 * self.RATE:  # 0.75s of silence
+                        duration = (self.utterance_samples + silence_samples) / self.RATE
+
                         speech_detected = False
-                        audio_buffer = []
-                        silence_start = None
+                        silence_samples = 0
+                        if duration >= 1.0:  # Ensure at least 1s recording
+                            yield self._final_transcript(committed, pending, segment_start), True
+                        # Ignore short recordings, reset
+                        pending = None
+                        self.utterance_samples = 0
+
+            # Hand back a finished segment, and send the next one once enough new speech came in.
+            if pending is not None and pending[0].done():
+                future, start = pending
+                pending = None
+                if future.exception() is not None:
+                    segment_start = start  # Send that audio again with the next segment
+                elif future.result():
+                    committed.append(future.result())
+                    yield " ".join(committed), False
+            if (
+                speech_detected
+                and self.partial_interval is not None
+                and pending is None
+                and self.utterance_samples - segment_start >= self.partial_interval * self.RATE
+            ):
+                cut = self._cut_point(segment_start, self.utterance_samples)
+                pending = (self._submit_segment(segment_start, cut, committed), segment_start)
+                segment_start = cut
+
+            if stopping:
+                return
+
+    def _final_transcript(self, committed, pending, segment_start):
+        """The sent segments' texts plus a transcript of the speech after them."""
+        if pending is not None:
+            future, start = pending
+            try:
+                text = future.result()
+                if text:
+                    committed.append(text)
+            except Exception:
+                segment_start = start
+        if self.utterance_samples - segment_start >= 0.1 * self.RATE:
+            try:
+                tail = self._submit_segment(segment_start, self.utterance_samples, committed).result()
+            except Exception as e:
+                print("Transcription failed:", e)
+                tail = ""
+            if tail:
+                committed.append(tail)
+        return " ".join(committed)
+
+    def listen_once(self, on_partial=None):
+        """
+        Waits until speech is detected, records until silence,
+        ensures at least 1s of recording, then transcribes and returns text.
+
+        :param on_partial: Called with each partial hypothesis while the user is still talking.
+        """
+        # One long-lived stream, so audio drained in the same batch as the end of this utterance is not lost.
+        if self._stream is None:
+            self._stream = self.listen_stream()
+        for text, is_final in self._stream:
+            if is_final:
+                return text
+            if on_partial is not None:
+                on_partial(text)
 
     def stop(self):
         """Stop listening and close the stream."""
         self.running = False
-        self.stream.stop_stream()
-        self.stream.close()
-        self.pyaudio_instance.terminate()
+        self.audio_queue.put(None)
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.pyaudio_instance.terminate()
+        self.executor.shutdown(wait=False)
+
+    def vad_stats(self):
+        """VAD CPU time per second of audio processed; see VoiceActivityDetector.stats."""
+        return self.vad.stats()
+
+
+def benchmark(utterance_seconds: float = 6.0, partial_interval: float = 1.0, delay: float = 0.3,
+              seconds_per_audio_second: float = 0.1):
+    """
+    Final-transcript latency with segments sent while the user talks, against
+    sending the whole utterance once it ends, using FakeBackend and EnergyVAD
+    on synthetic audio fed in real time.
+
+    :return: {mode: {"final_latency_s", "uploaded_audio_s", "calls", "correct"}}; the latency
+             runs from the silence chunk that ends the utterance to the final transcript.
+    """
+    rate, chunk = 16000, 512
+    chunk_seconds = chunk / rate
+    words = " ".join(f"word{i}" for i in range(int(utterance_seconds * 2.5)))
+    speech = np.full(chunk, 8000, dtype=np.int16).tobytes()
+    silence = bytes(2 * chunk)
+    # Silence chunk whose arrival ends the utterance (more than 0.75 s of silence).
+    ending_chunk = int(0.75 * rate // chunk) + 1
+
+    results = {}
+    for mode, interval in (("whole", None), ("segmented", partial_interval)):
+        backend = FakeBackend(words, delay=delay, seconds_per_audio_second=seconds_per_audio_second)
+        recognizer = SpeechRecognizer(
+            backend=backend, partial_interval=interval, open_stream=False, vad_model=EnergyVAD()
+        )
+        finals = queue.Queue()
+        threading.Thread(target=lambda: finals.put((recognizer.listen_once(), time.monotonic())), daemon=True).start()
+
+        started = time.monotonic()
+        sent = 0
+        ended_at = None
+        while finals.empty():
+            time.sleep(max(0.0, started + sent * chunk_seconds - time.monotonic()))
+            is_speech = sent * chunk_seconds < utterance_seconds
+            recognizer.audio_queue.put(speech if is_speech else silence)
+            sent += 1
+            if ended_at is None and not is_speech:
+                silent_chunks = sent - int(np.ceil(utterance_seconds / chunk_seconds))
+                if silent_chunks == ending_chunk:
+                    ended_at = time.monotonic()
+        text, finished = finals.get()
+        recognizer.stop()
+        results[mode] = {
+            "final_latency_s": finished - ended_at,
+            "uploaded_audio_s": backend.audio_seconds,
+            "calls": backend.calls,
+            "correct": text == words,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    for mode, result in benchmark().items():
+        print(f"{mode:>9}: " + ", ".join(f"{key} {value:.3f}" if isinstance(value, float) else f"{key} {value}"
+                                         for key, value in result.items()))
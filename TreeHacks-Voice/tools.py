@@ -1,12 +1,29 @@
 import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
 
 # Load locations
 with open("locations.json", "r") as f:
     LOCATIONS = json.load(f)["locations"]
 
+# Navigation server (api/server.py) that plans routes over the building map.
+ROUTE_SERVER = os.getenv("ROUTE_SERVER", "http://localhost:4000")
+
 def find_destination(user_text):
     """Check if user text contains a valid location."""
     for location in LOCATIONS:
         if location.lower() in user_text.lower():
             return location
     return None
+
+def lookup_route(destination, timeout=5.0):
+    """Next step towards `destination` from the latest position, via the server's /route; None if unavailable."""
+    url = f"{ROUTE_SERVER}/route?" + urllib.parse.urlencode({"destination": destination})
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return json.load(response)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        print(f"Route lookup for {destination} failed:", e)
+        return None
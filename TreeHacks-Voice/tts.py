@@ -1,38 +1,249 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from elevenlabs import stream
 from elevenlabs.client import ElevenLabs
 
+# Directional instructions spoken while guiding, synthesized ahead of time.
+DIRECTION_PHRASES = [
+    "Go forward.",
+    "Turn left.",
+    "Turn right.",
+    "Go backward.",
+]
+
+
+class PhraseCache:
+    """
+    Synthesized audio on disk, one file per (text, voice_id, model_id).
+
+    Files are named by the SHA-256 of their key, so a phrase is found
+    without an index and the same text spoken by another voice or model is
+    cached separately. Once the directory holds more than `max_bytes`, the
+    least recently played phrases are deleted; recency survives restarts
+    through the files' modification times, which a hit refreshes. Pinned
+    phrases, the ones warmed up at startup, are never evicted, so a long
+    conversation cannot push them out.
+    """
+
+    def __init__(
+        self,
+        directory: str = ".tts_cache",
+        max_bytes: int = 64 * 1024 * 1024,
+        chunk_size: int = 4096,
+        stale_after: float = 600.0,
+    ):
+        """
+        :param directory: Where audio files are kept; created if missing.
+        :param max_bytes: Total size above which the least recently used phrases are evicted.
+        :param chunk_size: Bytes per chunk when streaming a cached phrase.
+        :param stale_after: Seconds after which an unfinished write is taken to be abandoned and deleted.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # {key: size}, least recently used first.
+        self.entries = OrderedDict()
+        # Keys exempt from eviction.
+        self.pinned = set()
+        files = []
+        now = time.time()
+        for name in os.listdir(directory):
+            try:
+                info = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue  # Renamed or removed by another process meanwhile.
+            if name.endswith(".part"):
+                # Another process sharing the cache may still be writing a recent one.
+                if now - info.st_mtime > stale_after:
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        pass
+            elif name.endswith(".mp3"):
+                files.append((info.st_mtime, name[:-4], info.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+        self.total_bytes = sum(self.entries.values())
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str, voice_id: str, model_id: str) -> str:
+        return hashlib.sha256("\0".join((voice_id, model_id, text)).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".mp3")
+
+    def pin(self, key: str):
+        """Exempt a phrase from eviction, whether or not it is cached yet."""
+        with self.lock:
+            self.pinned.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def open(self, key: str):
+        """
+        Iterator over a cached phrase's audio chunks, read from disk as they
+        are consumed, or None on a miss.
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        path = self.path(key)
+        try:
+            os.utime(path)
+            file = open(path, "rb")
+        except FileNotFoundError:
+            # Deleted behind our back.
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+        return self._chunks(file)
+
+    def _chunks(self, file):
+        with file:
+            while chunk := file.read(self.chunk_size):
+                yield chunk
+
+    def put(self, key: str, audio: bytes):
+        """Store a phrase's audio, written to a temporary file first so readers never see half of it."""
+        if not audio:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        with os.fdopen(fd, "wb") as file:
+            file.write(audio)
+        os.replace(tmp, self.path(key))
+        with self.lock:
+            self.total_bytes += len(audio) - self.entries.pop(key, 0)
+            self.entries[key] = len(audio)
+            evicted = []
+            for old in list(self.entries):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if old == key or old in self.pinned:
+                    continue
+                self.total_bytes -= self.entries.pop(old)
+                self.evictions += 1
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(self.path(old))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                "phrases": len(self.entries),
+                "pinned": len(self.pinned),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
 class TextToSpeech:
     """Handles Text-to-Speech (TTS) using ElevenLabs API."""
 
-    def __init__(self, api_key: str, voice_id: str = "JBFqnCBsd6RMkjVDRZzb", model_id: str = "eleven_multilingual_v2"):
+    def __init__(
+        self,
+        api_key: str,
+        voice_id: str = "JBFqnCBsd6RMkjVDRZzb",
+        model_id: str = "eleven_multilingual_v2",
+        cache: PhraseCache = None,
+    ):
         """
         Initialize the TTS client.
 
         :param api_key: ElevenLabs API key
         :param voice_id: Default voice ID
         :param model_id: TTS model ID
+        :param cache: Where synthesized phrases are kept; defaults to a PhraseCache in .tts_cache.
         """
         self.client = ElevenLabs(api_key=api_key)
         self.voice_id = voice_id
         self.model_id = model_id
+        self.cache = cache if cache is not None else PhraseCache()
+
+    def _synthesize(self, text: str):
+        return self.client.text_to_speech.convert_as_stream(
+            text=text,
+            voice_id=self.voice_id,
+            model_id=self.model_id
+        )
+
+    def _tee(self, key: str, audio_stream):
+        """Pass chunks through while collecting them; the phrase is cached once the stream completes."""
+        chunks = []
+        for chunk in audio_stream:
+            if isinstance(chunk, bytes):
+                chunks.append(chunk)
+                yield chunk
+        self.cache.put(key, b"".join(chunks))
+
+    def audio(self, text: str):
+        """Iterator over the audio chunks of `text`, from the cache when possible."""
+        key = self.cache.key(text, self.voice_id, self.model_id)
+        cached = self.cache.open(key)
+        if cached is not None:
+            return cached
+        return self._tee(key, self._synthesize(text))
+
+    def warm_up(self, phrases, max_workers: int = 4):
+        """Synthesize every phrase not cached yet, without playing it, and pin them all in the cache."""
+        for text in phrases:
+            self.cache.pin(self.cache.key(text, self.voice_id, self.model_id))
+        missing = [
+            text for text in dict.fromkeys(phrases)
+            if self.cache.key(text, self.voice_id, self.model_id) not in self.cache
+        ]
+
+        def synthesize(text):
+            for _ in self._tee(self.cache.key(text, self.voice_id, self.model_id), self._synthesize(text)):
+                pass
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-warm-up") as executor:
+            for text, future in [(text, executor.submit(synthesize, text)) for text in missing]:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"TTS warm-up failed for {text!r}:", e)
+        return len(missing)
 
     def speak(self, text: str, play_audio: bool = True):
         """
-        Convert text to speech and stream it.
+        Convert text to speech and stream it. Cached phrases are streamed
+        from disk; others are synthesized and cached as they play.
 
         :param text: The text to convert to speech
         :param play_audio: If True, play the streamed audio locally
         """
-        audio_stream = self.client.text_to_speech.convert_as_stream(
-            text=text,
-            voice_id=self.voice_id,
-            model_id=self.model_id
-        )
+        audio_stream = self.audio(text)
 
         if play_audio:
-            stream(audio_stream)
+            self.play(audio_stream)
         else:
             for chunk in audio_stream:
                 if isinstance(chunk, bytes):
                     print(chunk)  # Process audio bytes manually
 
+    def play(self, audio_stream):
+        """Play audio chunks locally as they arrive."""
+        stream(audio_stream)
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+from metrics import span
+
+# Directions understood by embedded.ino's pressure()
+FORWARD, FORWARD_LEFT, FORWARD_RIGHT, LEFT, RIGHT = range(5)
+DIRECTIONS = (FORWARD, FORWARD_LEFT, FORWARD_RIGHT, LEFT, RIGHT)
+
+# pressure() holds each actuator for 250 ms before reading the next command.
+ACTUATION_TIME = 0.25
+
+
+class BeltWriter:
+    """
+    Sends direction commands to the haptic belt without blocking the event loop.
+
+    send() only records the wanted direction; a single writer task turns it
+    into serial writes. Commands that arrive faster than the belt can actuate
+    collapse into the newest one, a direction equal to the one just sent is
+    not re-sent until `repeat_interval` has passed, and writes run on a
+    dedicated thread so a stuck port never stalls a websocket.
+    """
+
+    def __init__(self, port, baudrate=9600, min_interval=ACTUATION_TIME, repeat_interval=3.0):
+        """
+        :param port: Serial device, e.g. /dev/cu.usbmodem2101 (or a pty for testing).
+        :param baudrate: Must match Serial.begin() in embedded.ino.
+        :param min_interval: Minimum seconds between writes.
+        :param repeat_interval: Re-send the current direction this often; None to never repeat.
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.min_interval = min_interval
+        self.repeat_interval = repeat_interval
+
+        self.serial = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="belt-writer")
+        self.wanted = None
+        self.last_sent = None
+        self.last_sent_at = float("-inf")
+        self.changed = asyncio.Event()
+        self.task = None
+
+        # Counters
+        self.requested = 0
+        self.written = 0
+        self.coalesced = 0
+        self.failed = 0
+
+    async def start(self):
+        """Open the port and start the writer task."""
+        loop = asyncio.get_running_loop()
+        self.serial = await loop.run_in_executor(
+            self.executor, lambda: serial.Serial(self.port, self.baudrate, timeout=0, write_timeout=1)
+        )
+        print(f"Connected to {self.serial.name}")
+        self.task = asyncio.create_task(self._run())
+
+    def send(self, direction):
+        """
+        Ask the belt to point in `direction`, one of DIRECTIONS. Returns immediately.
+
+        :raises ValueError: For anything pressure() would not understand.
+        """
+        direction = int(direction)
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown belt direction: {direction}")
+        self.requested += 1
+        if direction == self.last_sent or (self.wanted is not None and self.wanted != self.last_sent):
+            # Either a repeat of what the belt already shows, or it replaces a request never written.
+            self.coalesced += 1
+        self.wanted = direction
+        self.changed.set()
+
+    def stats(self):
+        return {
+            "requested": self.requested,
+            "written": self.written,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "last_sent": self.last_sent,
+        }
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.serial is not None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.serial.close)
+        self.executor.shutdown(wait=False)
+
+    def _due(self):
+        if self.wanted is None:
+            return False
+        if self.wanted != self.last_sent:
+            return True
+        return self.repeat_interval is not None and time.monotonic() - self.last_sent_at >= self.repeat_interval
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._due():
+                self.changed.clear()
+                timeout = None
+                if self.repeat_interval is not None and self.wanted is not None:
+                    timeout = max(0.0, self.last_sent_at + self.repeat_interval - time.monotonic())
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            direction = self.wanted
+            try:
+                with span("belt_write"):
+                    await loop.run_in_executor(self.executor, self.serial.write, f"{direction}\n".encode())
+                self.written += 1
+            except serial.SerialException as e:
+                self.failed += 1
+                print("Belt write failed:", e)
+            self.last_sent = direction
+            self.last_sent_at = time.monotonic()
+            # Give pressure() time to finish before the next command.
+            await asyncio.sleep(self.min_interval)
+
+
+def handle_button(belt, message):
+    """
+    Pass a /ws-for-buttons message ({"index": direction}) on to a BeltWriter.
+
+    :return: The direction sent.
+    :raises KeyError, TypeError, ValueError: For a malformed message or an unknown direction.
+    """
+    direction = int(message["index"])
+    belt.send(direction)
+    return direction
+
+
+class FakeBelt:
+    """
+    A pty standing in for the belt's serial port. Pass `port` to a BeltWriter
+    and read back what it wrote with `commands`; see check().
+    """
+
+    def __init__(self):
+        self.master, slave = os.openpty()
+        self.port = os.ttyname(slave)
+        self.slave = slave
+        os.set_blocking(self.master, False)
+        self.buffer = b""
+        # (time.monotonic(), direction) for every command received
+        self.commands = []
+
+    def read(self):
+        """Collect any complete commands written so far."""
+        try:
+            self.buffer += os.read(self.master, 4096)
+        except BlockingIOError:
+            pass
+        *lines, self.buffer = self.buffer.split(b"\n")
+        now = time.monotonic()
+        self.commands.extend((now, int(line)) for line in lines if line.strip())
+        return self.commands
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+async def check(repeat_interval=0.5):
+    """
+    Drive a BeltWriter against a FakeBelt and check what reaches the port:
+    one newline-terminated integer per command, bursts collapsed into their
+    newest direction, and the current direction repeated while idle.
+    """
+    fake = FakeBelt()
+    writer = BeltWriter(fake.port, min_interval=0.05, repeat_interval=repeat_interval)
+    await writer.start()
+    try:
+        writer.send(FORWARD)
+        await asyncio.sleep(0.02)
+        # A burst while the first command actuates: only RIGHT should be written.
+        for direction in (LEFT, FORWARD_LEFT, RIGHT):
+            writer.send(direction)
+        await asyncio.sleep(0.2)
+        sent = [direction for _, direction in fake.read()]
+        assert sent == [FORWARD, RIGHT], sent
+        assert fake.buffer == b"", fake.buffer
+
+        await asyncio.sleep(repeat_interval)
+        sent = [direction for _, direction in fake.read()]
+        assert sent == [FORWARD, RIGHT, RIGHT], sent
+        return writer.stats()
+    finally:
+        await writer.close()
+        fake.close()
+
+
+if __name__ == "__main__":
+    print("BeltWriter OK:", asyncio.run(check()))
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+
+class Subscription:
+    """
+    One client's view of a BroadcastHub.
+
+    Holds only the latest state: updates published while the client is still
+    sending the previous one overwrite each other, so a slow client skips
+    ahead instead of building a backlog.
+    """
+
+    def __init__(self, hub, min_interval):
+        self.hub = hub
+        self.min_interval = min_interval
+        self.state = None
+        self.version = -1
+        self.sent_version = -1
+        self.last_sent = float("-inf")
+        self.changed = asyncio.Event()
+
+    def offer(self, state, version):
+        self.state = state
+        self.version = version
+        self.changed.set()
+
+    async def get(self):
+        """Wait for a state newer than the last one returned, at most max_rate times a second."""
+        while self.version == self.sent_version:
+            self.changed.clear()
+            await self.changed.wait()
+        wait = self.last_sent + self.min_interval - time.monotonic()
+        if wait > 0:
+            # Anything published meanwhile is folded into this send.
+            await asyncio.sleep(wait)
+        self.sent_version = self.version
+        self.last_sent = time.monotonic()
+        return self.state
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class BroadcastHub:
+    """
+    Fans one producer's state out to many websocket clients.
+
+    publish() merges changes into the shared state and hands every subscriber
+    a reference to the new snapshot, which is O(clients) pointer updates and no
+    I/O. Each client's sender task awaits its own subscription, so the cost of
+    an idle viewer is one sleeping task.
+    """
+
+    def __init__(self, initial=None, max_rate=20.0):
+        """
+        :param initial: Starting state dict.
+        :param max_rate: Maximum messages per second per client.
+        """
+        self.state = dict(initial or {})
+        self.version = 0
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.subscriptions = set()
+
+    def publish(self, **changes):
+        """Merge `changes` into the state and notify subscribers if anything changed. Call from the event loop."""
+        if all(self.state.get(key) == value for key, value in changes.items()):
+            return
+        self.state = {**self.state, **changes}
+        self.version += 1
+        for subscription in self.subscriptions:
+            subscription.offer(self.state, self.version)
+
+    def subscribe(self):
+        """New subscription that starts with the current state."""
+        subscription = Subscription(self, self.min_interval)
+        subscription.offer(self.state, self.version)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
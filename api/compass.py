@@ -0,0 +1,133 @@
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+# timestamp (seconds since epoch), heading in degrees
+LOG_RECORD = struct.Struct("<dd")
+
+
+class CompassBuffer:
+    """
+    The last `capacity` compass samples, in preallocated arrays.
+
+    Appending is O(1) and never allocates; the oldest sample is overwritten
+    once the buffer is full. Samples must arrive in timestamp order, which
+    they do from a single phone. Safe to use from several threads.
+    """
+
+    def __init__(self, capacity=1024, log=None):
+        """
+        :param capacity: Number of samples kept.
+        :param log: Optional CompassLog every sample is also handed to.
+        """
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity)
+        self.headings = np.zeros(capacity)
+        self.count = 0
+        self.log = log
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, heading, timestamp=None):
+        timestamp = time.time() if timestamp is None else float(timestamp)
+        with self.lock:
+            i = self.count % self.capacity
+            self.timestamps[i] = timestamp
+            self.headings[i] = float(heading) % 360
+            self.count += 1
+        if self.log is not None:
+            self.log.append(heading, timestamp)
+
+    def latest(self):
+        """(heading, timestamp) of the newest sample, or None when empty."""
+        with self.lock:
+            if self.count == 0:
+                return None
+            i = (self.count - 1) % self.capacity
+            return float(self.headings[i]), float(self.timestamps[i])
+
+    def window(self, start=float("-inf"), end=float("inf")):
+        """(timestamps, headings) copies of the samples with start <= timestamp <= end, oldest first."""
+        with self.lock:
+            timestamps, headings = self._ordered()
+        keep = (timestamps >= start) & (timestamps <= end)
+        return timestamps[keep], headings[keep]
+
+    def heading_at(self, timestamp):
+        """
+        Heading at `timestamp`, interpolated along the shorter arc between the
+        samples either side of it.
+
+        :return: Degrees in [0, 360), the nearest end sample outside the
+                 buffered span, or None when empty.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            timestamps, headings = self._ordered()
+        after = int(np.searchsorted(timestamps, timestamp))
+        if after == 0:
+            return float(headings[0])
+        if after == len(timestamps):
+            return float(headings[-1])
+        t0, t1 = timestamps[after - 1], timestamps[after]
+        h0, h1 = headings[after - 1], headings[after]
+        fraction = (timestamp - t0) / (t1 - t0) if t1 > t0 else 1.0
+        turn = (h1 - h0 + 180) % 360 - 180
+        return float((h0 + fraction * turn) % 360)
+
+    def _ordered(self):
+        if self.count <= self.capacity:
+            return self.timestamps[:self.count].copy(), self.headings[:self.count].copy()
+        start = self.count % self.capacity
+        return np.roll(self.timestamps, -start), np.roll(self.headings, -start)
+
+
+class CompassLog:
+    """
+    Appends compass samples to a binary file of LOG_RECORDs on a background
+    thread, writing every `flush_every` samples (and on close) so the caller
+    never touches the disk.
+    """
+
+    def __init__(self, path, flush_every=256):
+        self.path = path
+        self.flush_every = flush_every
+        self.queue = queue.SimpleQueue()
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, name="compass-log", daemon=True)
+        self.thread.start()
+
+    def append(self, heading, timestamp):
+        self.queue.put((timestamp, heading))
+
+    def close(self):
+        """Write what is queued and stop the thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        with open(self.path, "ab") as file:
+            batch = bytearray()
+            while True:
+                sample = self.queue.get()
+                if sample is not None:
+                    batch += LOG_RECORD.pack(*sample)
+                if batch and (sample is None or len(batch) >= self.flush_every * LOG_RECORD.size):
+                    file.write(batch)
+                    file.flush()
+                    self.written += len(batch) // LOG_RECORD.size
+                    batch.clear()
+                if sample is None:
+                    return
+
+
+def read_log(path):
+    """(timestamps, headings) arrays from a CompassLog file."""
+    records = np.fromfile(path, dtype=[("timestamp", "<f8"), ("heading", "<f8")])
+    return records["timestamp"], records["heading"]
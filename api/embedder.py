@@ -0,0 +1,221 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+
+def perceptual_hash(image, hash_size=8):
+    """
+    64-bit difference hash of a PIL image or (height, width, 3) RGB array.
+    Near-identical frames hash to values only a few bits apart.
+    """
+    if isinstance(image, np.ndarray):
+        # Sample a small grid straight from the pixel view instead of resizing the whole frame.
+        rows = np.linspace(0, image.shape[0] - 1, hash_size).astype(np.intp)
+        cols = np.linspace(0, image.shape[1] - 1, hash_size + 1).astype(np.intp)
+        small = image[np.ix_(rows, cols)].mean(axis=2)
+    else:
+        small = np.asarray(image.convert("L").resize((hash_size + 1, hash_size)), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class StageTimings:
+    """Running totals of how long each pipeline stage takes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.counts = {}
+        self.last = {}
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+            self.last[stage] = seconds
+
+    def summary(self):
+        """Return {stage: {"count", "mean_ms", "last_ms"}}."""
+        with self.lock:
+            return {
+                stage: {
+                    "count": self.counts[stage],
+                    "mean_ms": 1000 * self.totals[stage] / self.counts[stage],
+                    "last_ms": 1000 * self.last[stage],
+                }
+                for stage in self.totals
+            }
+
+
+class EmbeddingService:
+    """
+    CLIP image embeddings computed in micro-batches on a background thread.
+
+    Callers block in embed() while their frame waits for up to `max_wait`
+    seconds for others to fill a batch of `batch_size`. Frames whose perceptual
+    hash is within `hash_distance` bits of a recently embedded one reuse that
+    embedding without running the model.
+    """
+
+    def __init__(self, model, processor, batch_size=8, max_wait=0.01, cache_size=64, hash_distance=4):
+        """
+        :param model: A transformers CLIPModel.
+        :param processor: The matching CLIPProcessor.
+        :param batch_size: Maximum number of frames per forward pass.
+        :param max_wait: Seconds to wait for a batch to fill before running it anyway.
+        :param cache_size: Number of recent embeddings kept for reuse.
+        :param hash_distance: Maximum Hamming distance between hashes treated as the same frame.
+        """
+        self.model = model.eval()
+        self.processor = processor
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self.hash_distance = hash_distance
+
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batches = 0
+        self.embedded = 0
+        self.timings = StageTimings()
+
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self.thread.start()
+
+    def embed(self, image):
+        """
+        Return the normalized 512-d embedding of an image.
+
+        :param image: A PIL image, an RGB array, or a Frame.
+        :return: A float32 NumPy array.
+        """
+        return self.submit(image).result()
+
+    def submit(self, image):
+        """Queue an image and return a Future resolving to its embedding."""
+        future = Future()
+        if hasattr(image, "downsampled"):
+            # Frames go to the model as a strided view of the capture buffer.
+            image = image.downsampled()
+        started = time.perf_counter()
+        image_hash = perceptual_hash(image)
+        self.timings.add("hash", time.perf_counter() - started)
+
+        cached = self._lookup(image_hash)
+        if cached is not None:
+            future.set_result(cached)
+        else:
+            self.requests.put((image, image_hash, future))
+        return future
+
+    def embed_texts(self, texts):
+        """
+        Normalized CLIP text embeddings, computed on the caller's thread.
+        Meant for fixed label sets embedded once at startup.
+
+        :return: (len(texts), 512) float32 array.
+        """
+        inputs = self.processor(text=list(texts), return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            features = self.model.get_text_features(**inputs)
+        embeddings = features.numpy().astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+    def stats(self):
+        """Cache counters and per-stage timings."""
+        with self.cache_lock:
+            counters = {
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "batches": self.batches,
+                "embedded": self.embedded,
+            }
+        return {**counters, "stages": self.timings.summary()}
+
+    def close(self):
+        """Stop the batching thread once queued frames have been embedded."""
+        self.requests.put(None)
+        self.thread.join()
+
+    def _lookup(self, image_hash):
+        with self.cache_lock:
+            for cached_hash, embedding in reversed(self.cache.items()):
+                if (cached_hash ^ image_hash).bit_count() <= self.hash_distance:
+                    self.cache.move_to_end(cached_hash)
+                    self.cache_hits += 1
+                    return embedding
+            self.cache_misses += 1
+            return None
+
+    def _store(self, image_hash, embedding):
+        with self.cache_lock:
+            self.cache[image_hash] = embedding
+            self.cache.move_to_end(image_hash)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def _next_batch(self):
+        first = self.requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            images, hashes, futures = zip(*batch)
+            try:
+                embeddings = self._embed_batch(list(images))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            with self.cache_lock:
+                self.batches += 1
+                self.embedded += len(embeddings)
+            for image_hash, future, embedding in zip(hashes, futures, embeddings):
+                self._store(image_hash, embedding)
+                future.set_result(embedding)
+
+    def _embed_batch(self, images):
+        started = time.perf_counter()
+        inputs = self.processor(images=images, return_tensors="pt")
+        preprocessed = time.perf_counter()
+
+        with torch.inference_mode():
+            features = self.model.get_image_features(**inputs)
+        forwarded = time.perf_counter()
+
+        embeddings = features.numpy().astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        finished = time.perf_counter()
+
+        self.timings.add("preprocess", preprocessed - started)
+        self.timings.add("forward", forwarded - preprocessed)
+        self.timings.add("postprocess", finished - forwarded)
+        return list(embeddings)
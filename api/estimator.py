@@ -0,0 +1,127 @@
+import numpy as np
+
+# Scales a median absolute deviation to a standard deviation for normal data.
+MAD_TO_SIGMA = 1.4826
+# Meters per degree of latitude, close enough to turn a tolerance into degrees.
+METERS_PER_DEGREE = 111_320.0
+
+
+def _weights(points, scores):
+    if scores is None:
+        return np.ones(len(points))
+    weights = np.asarray(scores, dtype=np.float64)
+    if weights.sum() <= 0:
+        return np.ones(len(points))
+    return weights
+
+
+def _isotropic(points):
+    """
+    Offsets of (lat, lon) points from the first one in degrees of latitude,
+    longitude shrunk by cos(latitude) so both axes measure the same distance.
+    Cheaper than a LocalFrame, and distances only need to be comparable.
+
+    :return: (scaled points, origin, aspect); points = scaled / aspect + origin.
+    """
+    origin = points[0]
+    aspect = np.array([1.0, np.cos(np.radians(origin[0]))])
+    return (points - origin) * aspect, origin, aspect
+
+
+def weighted_centroid(points, scores=None):
+    """
+    Similarity-weighted mean position.
+
+    :param points: (k, 2) array of (lat, lon).
+    :param scores: (k,) similarity scores, e.g. Vespa closeness; uniform if None.
+    :return: (2,) array.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    weights = _weights(points, scores)
+    return weights @ points / weights.sum()
+
+
+def geometric_median(points, scores=None, iterations=50, tolerance=0.01):
+    """
+    Weighted geometric median by Weiszfeld's algorithm: the point minimizing the
+    weighted sum of distances, which ignores a minority of far-off hits.
+
+    :param points: (k, 2) array of (lat, lon).
+    :param scores: (k,) similarity scores; uniform if None.
+    :param iterations: Upper bound on Weiszfeld steps.
+    :param tolerance: Stop once a step moves the estimate less than this many meters.
+    :return: (2,) array.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    weights = _weights(points, scores)
+    scaled, origin, aspect = _isotropic(points)
+    tolerance = tolerance / METERS_PER_DEGREE
+    # As complex numbers, each step is a handful of vectorized calls.
+    z = scaled[:, 0] + 1j * scaled[:, 1]
+    # Starting from the coordinate-wise median, not the mean, keeps outliers from
+    # dragging the start away; a few steps then settle to well under the tolerance.
+    median = np.median(scaled, axis=0)
+    estimate = median[0] + 1j * median[1]
+    for _ in range(iterations):
+        # A hit sitting on the estimate would divide by zero; treat it as very close instead.
+        inverse = weights / np.maximum(np.abs(z - estimate), 1e-15)
+        updated = inverse @ z / inverse.sum()
+        step = abs(updated - estimate)
+        estimate = updated
+        if step < tolerance:
+            break
+    estimate = np.array([estimate.real, estimate.imag])
+    return estimate / aspect + origin
+
+
+def mad_filter(points, threshold=3.0):
+    """
+    Boolean mask of hits within `threshold` robust standard deviations of the
+    coordinate-wise median, measured as 2-D distance.
+
+    :param points: (k, 2) array of (lat, lon).
+    :param threshold: Cut-off in units of MAD-derived sigma.
+    :return: (k,) bool array.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    scaled, _, _ = _isotropic(points)
+    distances = np.linalg.norm(scaled - np.median(scaled, axis=0), axis=1)
+    mad = np.median(np.abs(distances - np.median(distances)))
+    if mad == 0:
+        # More than half the distances are equal, so there is no spread to scale a threshold by.
+        # Keep the hits at or inside the median distance; when every hit is equally far, that
+        # is all of them and nothing is rejected.
+        return distances <= np.median(distances)
+    return distances <= np.median(distances) + threshold * MAD_TO_SIGMA * mad
+
+
+def mad_centroid(points, scores=None, threshold=3.0):
+    """Weighted centroid of the hits that survive mad_filter."""
+    points = np.asarray(points, dtype=np.float64)
+    keep = mad_filter(points, threshold)
+    kept_scores = None if scores is None else np.asarray(scores)[keep]
+    return weighted_centroid(points[keep], kept_scores)
+
+
+ESTIMATORS = {
+    "centroid": weighted_centroid,
+    "geometric_median": geometric_median,
+    "mad": mad_centroid,
+}
+
+
+def estimate_position(points, scores=None, method="mad"):
+    """
+    Combine the coordinates of k retrieval hits into one position.
+
+    :param points: (k, 2) array of (lat, lon).
+    :param scores: (k,) similarity scores for the hits.
+    :param method: One of ESTIMATORS.
+    :return: (lat, lon) tuple, or None when there are no hits.
+    """
+    if len(points) == 0:
+        return None
+    if method not in ESTIMATORS:
+        raise ValueError(f"Unknown position estimator: {method}")
+    latitude, longitude = ESTIMATORS[method](points, scores)
+    return float(latitude), float(longitude)
@@ -0,0 +1,114 @@
+import base64
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+# CLIP resizes the shortest side to 224; anything beyond twice that is wasted work.
+MODEL_MIN_SIDE = 448
+
+
+class Frame:
+    """
+    A captured screen frame backed by the raw BGRA buffer from mss.
+
+    Pixel access goes through NumPy views of that buffer, so nothing is copied
+    until a consumer needs different data. Encoded bytes (for uploads or
+    debugging) are produced lazily and cached per format.
+    """
+
+    def __init__(self, raw, width, height, seq=None, timestamp=None):
+        """
+        :param raw: BGRA pixel buffer (bytes, bytearray or memoryview), 4 bytes per pixel.
+        :param width: Frame width in pixels.
+        :param height: Frame height in pixels.
+        :param seq: Optional frame sequence number.
+        :param timestamp: Capture time; defaults to now.
+        """
+        self.raw = memoryview(raw)
+        self.width = width
+        self.height = height
+        self.seq = seq
+        self.timestamp = time.time() if timestamp is None else timestamp
+        # Monotonic construction time; latency spans are measured from here.
+        self.captured = time.monotonic()
+        self.bgra = np.frombuffer(self.raw, dtype=np.uint8).reshape(height, width, 4)
+        self._encoded = {}
+
+    @classmethod
+    def from_screenshot(cls, screenshot, seq=None):
+        """Wrap an mss ScreenShot without copying its pixels."""
+        return cls(screenshot.raw, screenshot.width, screenshot.height, seq=seq)
+
+    @classmethod
+    def capture_middle(cls, seq=None):
+        """Capture the middle half of the primary monitor, full height."""
+        import mss
+
+        with mss.mss() as sct:
+            monitor = sct.monitors[1]  # Get primary monitor dimensions
+            width, height = monitor["width"], monitor["height"]
+            middle_width = width // 2
+            left = (width - middle_width) // 2
+            screenshot = sct.grab({"left": left, "top": 0, "width": middle_width, "height": height})
+        return cls.from_screenshot(screenshot, seq=seq)
+
+    @classmethod
+    def from_image(cls, image, seq=None, timestamp=None):
+        """Build a frame from a PIL image, e.g. one decoded from a recording."""
+        image = image.convert("RGB")
+        return cls(image.tobytes("raw", "BGRX"), image.width, image.height, seq=seq, timestamp=timestamp)
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def rgb(self):
+        """(height, width, 3) RGB view of the buffer."""
+        return self.bgra[..., 2::-1]
+
+    def downsampled(self, min_side=MODEL_MIN_SIDE):
+        """
+        RGB view subsampled by an integer stride so the shortest side stays at
+        least `min_side`. Still a view; used as model input.
+        """
+        step = max(1, min(self.width, self.height) // min_side)
+        return self.rgb[::step, ::step]
+
+    def to_pil(self):
+        """Decode straight from the BGRA buffer into a PIL image."""
+        return Image.frombuffer("RGB", self.size, self.raw, "raw", "BGRX", 0, 1)
+
+    def encode(self, format="PNG", quality=85, max_side=None):
+        """
+        Encode the frame, caching the result.
+
+        :param format: "PNG" or "JPEG".
+        :param quality: JPEG quality.
+        :param max_side: Downscale so the longest side is at most this many pixels.
+        :return: Encoded bytes.
+        """
+        key = (format, quality, max_side)
+        if key not in self._encoded:
+            image = self.to_pil()
+            if max_side is not None and max(self.size) > max_side:
+                image.thumbnail((max_side, max_side))
+            buffer = io.BytesIO()
+            if format == "JPEG":
+                image.save(buffer, format=format, quality=quality)
+            else:
+                image.save(buffer, format=format)
+            self._encoded[key] = buffer.getvalue()
+        return self._encoded[key]
+
+    def to_base64(self, format="PNG", **kwargs):
+        """Base64 string of the encoded frame."""
+        return base64.b64encode(self.encode(format, **kwargs)).decode("utf-8")
+
+    def save_png(self, filename):
+        """Write the frame to a PNG file; for debugging only."""
+        with open(filename, "wb") as file:
+            file.write(self.encode("PNG"))
+        return filename
@@ -0,0 +1,97 @@
+import json
+
+import numpy as np
+
+# WGS84 ellipsoid
+SEMI_MAJOR_AXIS = 6378137.0
+ECCENTRICITY_SQUARED = 6.69437999014e-3
+
+# Terman Library door; the default origin for the building frame.
+BUILDING_ORIGIN = (37.4280207092758, -122.17424679547551)
+
+
+class LocalFrame:
+    """
+    Local east/north tangent plane around an origin, in meters.
+
+    Uses the ellipsoid's radii of curvature at the origin, which is exact to
+    well under a millimeter over the tens of meters of a building. Every method
+    takes scalars or arrays of any shape whose last axis is (lat, lon) or
+    (east, north), so whole node lists convert in one call.
+    """
+
+    def __init__(self, latitude, longitude):
+        self.origin = np.array([latitude, longitude], dtype=np.float64)
+        sin_lat = np.sin(np.radians(latitude))
+        denominator = 1 - ECCENTRICITY_SQUARED * sin_lat ** 2
+        prime_vertical = SEMI_MAJOR_AXIS / np.sqrt(denominator)
+        meridian = SEMI_MAJOR_AXIS * (1 - ECCENTRICITY_SQUARED) / denominator ** 1.5
+        # meters per degree of (latitude, longitude)
+        self.scale = np.radians(1) * np.array([meridian, prime_vertical * np.cos(np.radians(latitude))])
+
+    @classmethod
+    def around(cls, coordinates):
+        """A frame centered on the mean of an (n, 2) array of (lat, lon)."""
+        latitude, longitude = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2).mean(axis=0)
+        return cls(latitude, longitude)
+
+    def to_enu(self, coordinates):
+        """(..., 2) (lat, lon) -> (..., 2) (east, north) meters."""
+        north, east = np.moveaxis((np.asarray(coordinates, dtype=np.float64) - self.origin) * self.scale, -1, 0)
+        return np.stack([east, north], axis=-1)
+
+    def to_geodetic(self, points):
+        """(..., 2) (east, north) meters -> (..., 2) (lat, lon)."""
+        east, north = np.moveaxis(np.asarray(points, dtype=np.float64), -1, 0)
+        return np.stack([north, east], axis=-1) / self.scale + self.origin
+
+    def distance(self, a, b):
+        """Meters between (lat, lon) coordinates; broadcasts over leading axes."""
+        return np.linalg.norm(self.to_enu(a) - self.to_enu(b), axis=-1)
+
+    def pairwise_distances(self, a, b=None):
+        """(n, m) matrix of meters between two (lat, lon) arrays."""
+        a = self.to_enu(a)
+        b = a if b is None else self.to_enu(b)
+        return np.linalg.norm(a[:, None, :] - b[None, :, :], axis=-1)
+
+    def bearing(self, a, b):
+        """Compass bearing in degrees (0 = north, clockwise) from a to b."""
+        east, north = np.moveaxis(self.to_enu(b) - self.to_enu(a), -1, 0)
+        return np.degrees(np.arctan2(east, north)) % 360
+
+
+def building_frame():
+    """The frame every server-side component shares."""
+    return LocalFrame(*BUILDING_ORIGIN)
+
+
+def load_nodes(path="nodes.json"):
+    """
+    Read nodes.json.
+
+    :return: (ids, names, (n, 2) array of (lat, lon))
+    """
+    with open(path) as file:
+        nodes = json.load(file)
+    ids = [node["id"] for node in nodes]
+    names = [node["name"] for node in nodes]
+    coordinates = np.array([node["coordinates"] for node in nodes], dtype=np.float64).reshape(-1, 2)
+    return ids, names, coordinates
+
+
+def project_map(frame, nodes_path="nodes.json", index_path=None):
+    """
+    Convert every map node, and optionally every image in an index file, into
+    `frame` in a single batch.
+
+    :return: {"node_ids", "nodes": (n, 2) ENU, and with an index "image_ids", "images": (m, 2) ENU}
+    """
+    ids, _, coordinates = load_nodes(nodes_path)
+    projected = {"node_ids": ids, "nodes": frame.to_enu(coordinates)}
+    if index_path is not None:
+        records = np.load(index_path, mmap_mode="r")
+        images = np.stack([records["coordinate_x"], records["coordinate_y"]], axis=-1)
+        projected["image_ids"] = [str(image_id) for image_id in records["id"]]
+        projected["images"] = frame.to_enu(images)
+    return projected
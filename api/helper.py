@@ -1,17 +1,12 @@
-import json
-import re
+import itertools
 import threading
 import time
 from datetime import datetime
 
-import mss
-import mss.tools
 import openai
 from dotenv import load_dotenv
-import base64
 import keyboard
 
-from openai import OpenAI
 import os
 
 from vespa.package import (
@@ -29,7 +24,18 @@ from vespa.package import (
 )
 from vespa.deployment import VespaCloud
 import numpy as np
-import geopy.distance
+
+from embedder import EmbeddingService
+from estimator import estimate_position
+from frame import Frame
+from geo import building_frame
+from metrics import MetricsPublisher, observe, span
+from position_bus import BusPublisher, HeadingListener, PositionBus
+from scheduler import FrameScheduler
+from tracker import ParticleTracker
+from vector_search import VespaSearch, load_index
+from zone_classifier import ZONE_DATA, LocalZoneClassifier, ZoneClassifier, classify_frame, parse_zone_data
+from zones import AdjacentZoneStateMachine, ZoneGraph
 
 # Replace with your tenant name from the Vespa Cloud Console
 tenant_name = "michaelyu"
@@ -162,44 +168,8 @@ app_large = vespa_cloud_large.deploy()
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-zone_data = """
-zone_2=terrace entrance,stairs,elevator,red wall,floor map,Terman Library,library
-zone_3=deans sign,deans portraits,Jensen Huang sign,hallway with red wall
-zone_4=red chairs,couches,tables,large space with yellow lights
-zone_5=recycling bins,trash cans,water fountain,hallway
-zone_6=posters on side of wall,white hallway
-zone_7=bathroom,bench,bathroom sign,man and female on sign, railing,white walls
-zone_8=stairwell sign,plants,glass walls,
-"""
-
-transition_direction_map = {
-    "2": {"s": "3"},
-    "3": {"n": "2", "s": "4"},
-    "4": {"n": "3", "e": "7", "w": "5"},
-    "5": {"e": "4", "w": "6"},
-    "6": {"e": "5"},
-    "7": {"w": 4, "e": "8"},
-    "8": {"w": "7"},
-}
-
-room_number_map = {
-    "226": "8",
-    "243": "8",
-    "219": "4",
-    "218": "4",
-    "203": "3",
-    "201": "2",
-    "202": "2",
-    "214": "5",
-    "215": "5",
-    "210": "6",
-    "209": "6",
-    "208": "6",
-    "207": "6",
-    "206": "6",
-    "212": "6",
-    "212A": "6",
-}
+# Zone graph, compass sectors and room numbers for this building.
+zone_graph = ZoneGraph.load(os.getenv("ZONE_CONFIG", "zones.json"))
 
 # zone_coord_map = {
 #     "2": [
@@ -216,289 +186,137 @@ previous_zone_lock = threading.Lock()
 zone_history = []
 zone_history_lock = threading.Lock()
 
-imu_data = 0
-
-class AdjacentZoneStateMachine:
-    north = 60
-    east = north + 90
-    west = north + 270
-    south = north + 180
-
-    def wrap_value_in_circle(self, value):
-        """
-        Wraps a value to its equivalent within a circle of given size.
-
-        :param value: The value to wrap.
-        :param circle_size: The size of the circle.
-        :return: The wrapped value.
-        """
-        return value % 360
-
-    def __init__(self, zones, initial_zone):
-        """
-        Initialize the state machine.
-
-        :param zones: A list of zones in order (e.g., ["2", "3", "4", ...]).
-        :param initial_zone: The starting zone. Must be one of the zones.
-        """
-        if initial_zone not in zones:
-            raise ValueError("Initial zone must be in the list of zones.")
-        self.zones = zones
-        self.current_zone = initial_zone
-        self.lock = threading.RLock()  # Use a reentrant lock for thread safety
-
-    def allowed_transition(self, next_zone):
-        """
-        Check if transitioning to the next_zone is allowed.
-        Only adjacent zones in the list are permitted, except for the special case
-        allowing transitions between '7' and '4'. Additionally, if the current zone is '7',
-        transitioning to '6' is not allowed.
-
-        :param next_zone: The zone to transition to.
-        :return: True if allowed; False otherwise.
-        """
-        with self.lock:
-
-
-            # Allow the special exception between Zone 7 and Zone 4 (both directions)
-            if (self.current_zone == "7" and next_zone == "4") or \
-               (self.current_zone == "4" and next_zone == "7"):
-                return True
-
-            if self.current_zone == "7" and next_zone == "6":
-                return False
-
-            try:
-                currMap = transition_direction_map[self.current_zone]
-                keys = currMap.keys()
-                if "n" in keys and "e" in keys:
-                    north_range_low = self.wrap_value_in_circle(self.north - 60)
-                    north_range_high = self.wrap_value_in_circle(self.north + 60)
-
-                    west_range_low = self.wrap_value_in_circle(self.west - 60)
-                    west_range_high = self.wrap_value_in_circle(self.west + 60)
-
-                    east_range_low = self.wrap_value_in_circle(self.south + 60)
-                    east_range_high = self.wrap_value_in_circle(self.south + 60)
-
-                    if north_range_low < imu_data < north_range_high:
-                        if "n" in currMap and next_zone == currMap["n"]:
-                            return True
-
-                    if west_range_low < imu_data < west_range_high:
-                        if "w" in currMap and next_zone == currMap["w"]:
-                            return True
-
-                    if east_range_low < imu_data < east_range_high:
-                        if "e" in currMap and next_zone == currMap["e"]:
-                            return True
-                    return False
-
-                if "n" in keys or "s" in keys:
-                    north_range_low = self.wrap_value_in_circle(self.north - 90)
-                    north_range_high = self.wrap_value_in_circle(self.north + 90)
-
-                    south_range_low = self.wrap_value_in_circle(self.south + 90)
-                    south_range_high = self.wrap_value_in_circle(self.south + 90)
-
-                    if north_range_low < imu_data < north_range_high:
-                        if "n" in currMap and next_zone == currMap["n"]:
-                            return True
-
-                    if south_range_low < imu_data < south_range_high:
-                         if "s" in currMap and next_zone == currMap["s"]:
-                            return True
-                    return False
-
-                if "w" in keys or "e" in keys:
-                    west_range_low = self.wrap_value_in_circle(self.west - 90)
-                    west_range_high = self.wrap_value_in_circle(self.west + 90)
-
-                    east_range_low = self.wrap_value_in_circle(self.east + 90)
-                    east_range_high = self.wrap_value_in_circle(self.east + 90)
-
-                    if west_range_low < imu_data < west_range_high:
-                        if "w" in currMap and next_zone == currMap["w"]:
-                            return True
-
-                    if east_range_low < imu_data < east_range_high:
-                        if "e" in currMap and next_zone == currMap["e"]:
-                            return True
-                    return False
-
-                current_index = self.zones.index(self.current_zone)
-                next_index = self.zones.index(next_zone)
-            except ValueError:
-                return False
-
-            # Transition is allowed only if next_zone is exactly one position away.
-            return abs(next_index - current_index) == 1
-
-    def transition(self, next_zone):
-        """
-        Transition to the next_zone if it's allowed.
-        """
-        with self.lock:
-            if self.allowed_transition(next_zone):
-                # print(f"Transitioning from {self.current_zone} to {next_zone}.")
-                self.current_zone = next_zone
-            else:
-                pass
-                # print(f"Invalid transition: Cannot move from {self.current_zone} to {next_zone}.")
-                # Optionally, you can raise an error or log the invalid transition.
-
-    def forced_transition(self, next_zone):
-        """
-        Force a transition to the next_zone in a thread-safe manner,
-        bypassing the usual allowed_transition checks.
-        """
-        with self.lock:
-            print(f"Forced transition from {self.current_zone} to {next_zone}.")
-            self.current_zone = next_zone
-
-def capture_middle_screenshot():
-    """Capture the middle portion of the primary monitor."""
-    with mss.mss() as sct:
-        monitor = sct.monitors[1]  # Get primary monitor dimensions
-        width, height = monitor["width"], monitor["height"]
+# How many retrieval hits to combine, and how (see estimator.ESTIMATORS).
+position_top_k = 20
+position_estimator = "mad"
 
-        # Define middle portion dimensions (adjust as needed)
-        middle_width = width // 2
-        left = (width - middle_width) // 2
+# Write every captured frame to screenshot.png for debugging.
+save_debug_frames = os.getenv("SAVE_DEBUG_FRAMES") == "1"
 
-        # Capture only the middle portion
-        screenshot = sct.grab({"left": left, "top": 0, "width": middle_width, "height": height})
+# Ids carried by captured frames through every latency span.
+frame_ids = itertools.count()
 
-    return screenshot
+def capture_middle_screenshot():
+    """Capture the middle portion of the primary monitor."""
+    started = time.monotonic()
+    # Keep the raw BGRA buffer; it is only encoded if a consumer needs bytes.
+    frame = Frame.capture_middle(seq=next(frame_ids))
+    observe("capture", frame.captured - started, frame.seq)
+    return frame
 
 def save_screenshot(screenshot, filename="screenshot.png"):
     """Save the screenshot to a PNG file."""
-    mss.tools.to_png(screenshot.rgb, screenshot.size, output=filename)
-    return filename
-
-def encode_image_to_base64(image_path):
-    """Encodes an image file to a base64 string."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+    return screenshot.save_png(filename)
+
+# Built once; sent with every frame the zone classifier uploads.
+zone_prompt = (
+    f"Zone Data:\n{ZONE_DATA}\n\n"
+    "Be concise. Double and triple check your work. You are given zone_data which contains key landmarks in each space. "
+    "Using the zone data respond with what zone you think we are in. "
+    "Respond in a json format: { zone: number, room_number: number }"
+)
 
-def send_to_openai_zones(image_path, state_machine):
+def apply_zone_answer(state_machine, new_zone, room_number):
     """
-    Send the image as a base64 string along with a prompt that includes the zone data.
-    Based on the response, update the zone either via normal or forced transition if a matching room number is found.
+    Update the zone from a classifier answer, either via normal or forced transition if a matching room number is found.
     """
     global previous_zone_response
 
-    try:
-        img_b64_str = encode_image_to_base64(image_path)
-        img_type = "image/png"  # Adjust accordingly if the image format differs
-
-        # Build the prompt text including both the static zone data.
-        prompt_text = (
-            f"Zone Data:\n{zone_data}\n\n"
-            "Be concise. Double and triple check your work. You are given zone_data which contains key landmarks in each space. "
-            "Using the zone data respond with what zone you think we are in. "
-            "Respond in a json format: { zone: number, room_number: number }"
-        )
-
-        client = OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),  # This is the default and can be omitted
-        )
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt_text},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:{img_type};base64,{img_b64_str}"},
-                        },
-                    ],
-                }
-            ],
-        )
-
-        # Extract the response content
-        response_content = response.choices[0].message.content
-
-        # Remove code block markers if present.
-        pattern = r"^```json\s*|```$"
-        cleaned_message = re.sub(pattern, "", response_content, flags=re.MULTILINE)
-
-        # Parse the response to extract the zone number and room number.
-        parsed_response = json.loads(cleaned_message)
-        new_zone = parsed_response.get("zone", None)
-        room_number = parsed_response.get("room_number", None)
-
+    if room_number is not None:
         print(room_number)
 
-        old_zone = state_machine.current_zone
+    old_zone = state_machine.current_zone
 
-        # If there's a matching room number, force the transition to the mapped zone.
-        if room_number is not None and str(room_number) in room_number_map:
-            forced_zone = room_number_map[str(room_number)]
-            print(f"Matching room found for room {room_number}. Forcing transition to zone {forced_zone}.")
-            state_machine.forced_transition(forced_zone)
-            new_zone = forced_zone  # update new_zone for history and logging if needed
-        else:
-            # Otherwise, attempt a normal transition.
-            state_machine.transition(str(new_zone))
+    # If there's a matching room number, force the transition to the mapped zone.
+    forced_zone = zone_graph.zone_for_room(room_number) if room_number is not None else None
+    if forced_zone is not None:
+        print(f"Matching room found for room {room_number}. Forcing transition to zone {forced_zone}.")
+        state_machine.forced_transition(forced_zone)
+        new_zone = forced_zone  # update new_zone for history and logging if needed
+    else:
+        # Otherwise, attempt a normal transition.
+        state_machine.transition(str(new_zone))
 
-        # Update the previous zone response in a thread-safe way.
-        with previous_zone_lock:
-            previous_zone_response = new_zone
+    # Update the previous zone response in a thread-safe way.
+    with previous_zone_lock:
+        previous_zone_response = new_zone
 
-        # Record the new zone in the zone history.
-        with zone_history_lock:
-            zone_history.append(new_zone)
-            if len(zone_history) > 3:
-                zone_history.pop(0)  # Remove the oldest zone if more than 3 are stored
+    # Record the new zone in the zone history.
+    with zone_history_lock:
+        zone_history.append(new_zone)
+        if len(zone_history) > 3:
+            zone_history.pop(0)  # Remove the oldest zone if more than 3 are stored
 
-        if state_machine.current_zone != old_zone:
-            print("Current Zone:", state_machine.current_zone)
+    if state_machine.current_zone != old_zone:
+        print("Current Zone:", state_machine.current_zone)
 
-    except Exception as e:
-        print("Error:", e)
+def send_to_openai_zones(frame, state_machine):
+    """
+    Ask the vision model which zone the frame shows and apply the answer to the state machine.
+    Returns immediately; see ZoneClassifier for when a frame is actually sent.
+    """
+    return zone_classifier.submit(
+        frame, lambda new_zone, room_number: apply_zone_answer(state_machine, new_zone, room_number)
+    )
 
 from transformers import CLIPProcessor, CLIPModel
-from PIL import Image
 
 model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
 processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+embedding_service = EmbeddingService(model, processor, batch_size=4, max_wait=0.01)
 
-def find_nearest_images(query_image_path, top_k=3):
+# One pooled client for every zone request, with at most two in flight.
+zone_classifier = ZoneClassifier(zone_prompt, max_in_flight=2, embed=embedding_service.embed)
+
+# Zero-shot CLIP over the ZONE_DATA landmarks, embedded once; answers most frames without a network call.
+local_zone_classifier = LocalZoneClassifier.from_service(parse_zone_data(ZONE_DATA), embedding_service)
+
+def classify_zone(frame, state_machine, embedding=None):
     """
-    Given a path to a local image, return the top K nearest images from Vespa.
+    Update the zone from the local classifier when it is confident, and
+    fall back to the remote vision model otherwise.
+
+    :param embedding: The frame's CLIP embedding, if the caller already has one
+                      (e.g. from localization); otherwise the frame is embedded here.
     """
-    # 1. Compute CLIP embedding
-    image = Image.open(query_image_path)
-    inputs = processor(images=image, return_tensors="pt")
-    # Obtain embedding, then convert to a list (shape: [1,512] → list of 512 floats)
-    embedding = model.get_image_features(**inputs).detach().numpy().tolist()[0]
+    with span("zone_local", frame.seq):
+        return classify_frame(
+            frame,
+            local_zone_classifier,
+            lambda new_zone, room_number: apply_zone_answer(state_machine, new_zone, room_number),
+            remote=zone_classifier,
+            embedding=embedding,
+            embed=embedding_service.embed,
+        )
 
-    # 2. Build YQL for nearest neighbor
-    #    [ {"targetHits": K} ] is an optional parameter to set how many neighbors to retrieve
-    yql = 'select * from doc where ([{"targetHits":' + str(top_k) + '}]nearestNeighbor(embedding, q));'
+# Search a local copy of the image index when one exists; otherwise query Vespa Cloud.
+image_index_path = os.getenv("IMAGE_INDEX_PATH", "image_index.npy")
+if os.path.exists(image_index_path):
+    image_search = load_index(image_index_path)
+else:
+    image_search = VespaSearch(app_large)
 
-    # 3. Perform the query
-    query_body = {
-        "yql": yql,
-        "hits": top_k,
-        "ranking": "image_search",
-        "ranking.features.query(q)": embedding,
-    }
+def find_nearest_images(image, top_k=3):
+    """
+    Given a captured frame (or PIL image), return the coordinates and similarity
+    scores of the top K nearest images from the image index, and the frame's
+    embedding so the zone classifier can reuse it.
+    """
+    frame_id = getattr(image, "seq", None)
 
-    result = app_large.query(body=query_body)
+    # 1. Compute CLIP embedding
+    # Batched with other workers' frames; near-duplicate frames come from the cache.
+    with span("embed", frame_id):
+        embedding = embedding_service.embed(image)
 
-    # 4. Extract top hits
-    hits = result.hits
+    # 2. Nearest neighbour search (local index or Vespa)
+    with span("search", frame_id):
+        hits = image_search.search(embedding, top_k=top_k)
 
-    # Return the IDs (or anything else you want)
-    nearest_ids_x = [float(hit["fields"]["coordinate_x"]) for hit in hits if "fields" in hit]
-    nearest_ids_y = [float(hit["fields"]["coordinate_y"]) for hit in hits if "fields" in hit]
-    return [nearest_ids_x, nearest_ids_y]
+    # Hit coordinates as a (k, 2) array of (lat, lon), plus their closeness scores
+    points = np.array([[hit.coordinate_x, hit.coordinate_y] for hit in hits]).reshape(-1, 2)
+    scores = np.array([hit.relevance for hit in hits])
+    return points, scores, embedding
 
 def most_common_first_character(ids):
     """
@@ -522,16 +340,17 @@ def photo_shooter():
         time.sleep(1/5.0)
 
 def location_finder_openai():
-    # Instantiate the state machine once so that all threads share the same instance.
-    state_machine = AdjacentZoneStateMachine(["2", "3", "4", "5", "6", "7", "8"], "2")
+    # Share the localization loop's state machine, so both update the same zone.
+    state_machine = zone_state_machine
     #
     while True:
     #     # Capture and save one screenshot.
         screenshot = capture_middle_screenshot()
-        filename = save_screenshot(screenshot)
+        if save_debug_frames:
+            save_screenshot(screenshot)
     #
-    #     # Send the screenshot to OpenAI in a separate thread.
-        threading.Thread(target=send_to_openai_zones, args=(filename, state_machine,)).start()
+    #     # Classify locally; only uncertain frames go to OpenAI.
+        classify_zone(screenshot, state_machine)
         time.sleep(0.1)
 
 # def location_finder_vespa_zone():
@@ -549,71 +368,118 @@ def location_finder_openai():
 #     if state_machine.current_zone != old_zone:
 #         print("Current Zone:", state_machine.current_zone)
 #
-def location_finder_vespa_big():
-    # while True:
-    screenshot = capture_middle_screenshot()
-    filename = save_screenshot(screenshot)
-
-    top_hits = find_nearest_images(filename, top_k=3)
-
-    if top_hits is None:
-        return
-
-    # Extract x and y coordinates
-    x_coords = top_hits[0]
-    y_coords = top_hits[1]
+def estimate_location(screenshot):
+    """Estimate a (lat, lon) position from a single screenshot; returns it with the screenshot's embedding."""
+    if save_debug_frames:
+        save_screenshot(screenshot)
 
-    def calculate_iqr(data):
-        q1 = np.percentile(data, 25)
-        q3 = np.percentile(data, 75)
-        iqr = q3 - q1
-        return q1, q3, iqr
+    points, scores, embedding = find_nearest_images(screenshot, top_k=position_top_k)
 
-    def filter_outliers(data):
-        q1, q3, iqr = calculate_iqr(data)
-        lower_bound = q1 - 1.5 * iqr
-        upper_bound = q3 + 1.5 * iqr
-        return [x for x in data if lower_bound <= x <= upper_bound]
+    with span("estimate", screenshot.seq):
+        return estimate_position(points, scores, method=position_estimator), embedding
 
-    filtered_x_coords = filter_outliers(x_coords)
-    filtered_y_coords = filter_outliers(y_coords)
+def locate_frame(frame):
+    """
+    Scheduler handler: (frame id, capture time, (lat, lon), frame, embedding),
+    or None without a position.
+    """
+    coordinates, embedding = estimate_location(frame)
+    if coordinates is None:
+        return None
+    return frame.seq, frame.captured, coordinates, frame, embedding
 
-    # Sort and take the 5 middle values
-    def get_middle_values(data, n=5):
-        sorted_data = sorted(data)
-        mid_index = len(sorted_data) // 2
-        start = max(0, mid_index - n // 2)
-        end = start + n
-        return sorted_data[start:end]
+# Last published position, the channel to server.py, and the compass heading it forwards back.
+position_bus = PositionBus(37.4280207092758, -122.17424679547551)
+position_publisher = BusPublisher()
+heading_listener = HeadingListener()
 
-    middle_x_coords = np.mean(get_middle_values(filtered_x_coords))
-    middle_y_coords = np.mean(get_middle_values(filtered_y_coords))
+# The zone, updated from every committed visual fix; transitions are checked against the live compass heading.
+zone_state_machine = AdjacentZoneStateMachine(zone_graph, heading=heading_listener.latest)
 
-    with open("coordinates.txt", "r") as file:
-        old_coords = file.read().split()
-        old_coords = list(map(float, old_coords))
+# Fuses visual fixes with the compass; replaces the old 5 m hard reject.
+tracker = ParticleTracker(37.4280207092758, -122.17424679547551, frame=building_frame())
 
-    new_coords = (middle_x_coords, middle_y_coords)
+# Ask for a new visual fix once the tracker is less sure than this, in meters.
+tracker_max_std = 2.0
 
-    distance = geopy.distance.distance(old_coords, new_coords).meters
+def commit_location(seq, result):
+    """
+    Feed a visual fix to the tracker, publish the fused position, and update
+    the zone from the retrieval embedding, so a confident local answer costs
+    no second embedding or remote call.
+    Called by the scheduler in frame order, so stale frames never get here.
+    """
+    frame_id, captured, new_coords, frame, embedding = result
+    with span("track", frame_id):
+        tracker.update(*new_coords)
+    publish_tracked_position(frame_id=frame_id, captured=captured)
+    classify_zone(frame, zone_state_machine, embedding)
 
-    if distance > 5.0:
-        print(f"Distance: {distance}m")
+def publish_tracked_position(min_move=0.2, frame_id=-1, captured=float("nan")):
+    """
+    Publish the tracker estimate if it moved at least `min_move` meters.
+    `frame_id` and `captured` tag a position that comes from a visual fix.
+    """
+    estimate = tracker.estimate()
+    old_position = position_bus.latest()
+    moved = tracker.frame.distance(
+        (estimate.latitude, estimate.longitude),
+        (old_position.latitude, old_position.longitude),
+    )
+    if moved < min_move:
         return
 
-    with open("coordinates.txt", "w") as file:
-        file.write(f"{middle_x_coords}\n{middle_y_coords}")
-    # print(f"x: {middle_x_coords} y: {middle_y_coords}")
-    # return [middle_x_coords, middle_y_coords]
+    (east, east_north), (_, north) = estimate.covariance
+    position = position_bus.publish(
+        estimate.latitude, estimate.longitude,
+        covariance=(east, north, east_north), frame_id=frame_id, captured=captured,
+    )
+    position_publisher.publish(
+        position.latitude, position.longitude, position.timestamp,
+        position.covariance, position.frame_id, position.captured,
+    )
+    if frame_id >= 0:
+        observe("capture_to_publish", time.monotonic() - captured, frame_id)
+    # print(f"x: {estimate.latitude} y: {estimate.longitude} std: {estimate.std}m")
 
-def main():
+def location_finder_vespa_big():
+    screenshot = capture_middle_screenshot()
+    result = locate_frame(screenshot)
+    if result is not None:
+        commit_location(None, result)
 
-    coord = [37.4280207092758, -122.17424679547551]
-    with open("coordinates.txt", "w") as file:
-        file.write(f"{coord[0]}\n{coord[1]}")
-    while True:
-        threading.Thread(target=location_finder_vespa_big, args=()).start()
-        time.sleep(0.1)
+def main():
+    initial = position_bus.latest()
+    position_publisher.publish(initial.latitude, initial.longitude)
+
+    # A fixed pool of workers; when inference falls behind, the oldest queued frame is dropped.
+    scheduler = FrameScheduler(locate_frame, commit_location, workers=2, max_pending=2)
+    scheduler.start()
+    # Histograms go to server.py's /metrics about once a second.
+    metrics_publisher = MetricsPublisher()
+    metrics_interval = 1.0
+    last_metrics = time.monotonic()
+    interval = 0.1
+    try:
+        while True:
+            started = time.monotonic()
+            with span("tick"):
+                tracker.predict(heading=heading_listener.latest())
+                publish_tracked_position()
+            # Only pay for a retrieval when dead reckoning has drifted too far.
+            if tracker.needs_fix(tracker_max_std):
+                scheduler.submit(capture_middle_screenshot())
+            if started - last_metrics >= metrics_interval:
+                metrics_publisher.publish()
+                last_metrics = started
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        print(scheduler.stats())
+        print(embedding_service.stats())
+        scheduler.stop()
+        metrics_publisher.close()
+        position_publisher.close()
+        heading_listener.close()
         # threading.Thread(target=location_finder_vespa_zone, args=()).start()
 
 if __name__ == "__main__":
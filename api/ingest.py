@@ -0,0 +1,451 @@
+"""
+Build the geotagged image embedding index from a directory of photos.
+
+    python ingest.py photos/ --output image_index.npy --dtype float16
+    python ingest.py photos/ --coordinates photos.csv --vespa-url https://...
+
+Coordinates come from a sidecar CSV (filename, latitude, longitude) or, failing
+that, from the photo's EXIF GPS tags. Runs are incremental: files whose size
+and modification time match the previous run keep their stored embedding, and
+progress is checkpointed so an interrupted run resumes where it stopped. Images
+that cannot be decoded or have no coordinates are logged, skipped and remembered,
+so later runs only retry them once they change. HEIC photos are read when
+pillow_heif is installed.
+
+With --vespa-url, every entry Vespa has not acknowledged yet is fed and every
+pending delete is sent, whichever run produced them, so documents from an
+interrupted run or a failed feed are sent again until Vespa accepts them.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from vector_search import EMBEDDING_DIM, dequantize, save_index
+
+MODEL_NAME = "openai/clip-vit-base-patch32"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+
+try:
+    from pillow_heif import register_heif_opener
+except ImportError:
+    pass
+else:
+    register_heif_opener()
+    IMAGE_EXTENSIONS.add(".heic")
+
+GPS_IFD = 0x8825
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+
+
+def find_images(root):
+    """Relative paths of every image under `root`, sorted."""
+    paths = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(paths)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_coordinates_csv(path):
+    """
+    Read a sidecar CSV mapping image filenames to coordinates.
+
+    Accepts `filename`, `latitude`/`coordinate_x` and `longitude`/`coordinate_y` columns.
+    :return: {filename: (latitude, longitude)}
+    """
+    coordinates = {}
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            latitude = row.get("latitude", row.get("coordinate_x"))
+            longitude = row.get("longitude", row.get("coordinate_y"))
+            coordinates[row["filename"]] = (float(latitude), float(longitude))
+    return coordinates
+
+
+def _degrees(value, ref):
+    degrees, minutes, seconds = (float(part) for part in value)
+    decimal = degrees + minutes / 60 + seconds / 3600
+    return -decimal if ref in ("S", "W") else decimal
+
+
+def read_exif_coordinates(image):
+    """(latitude, longitude) from a PIL image's EXIF GPS tags, or None."""
+    gps = image.getexif().get_ifd(GPS_IFD)
+    if GPS_LATITUDE not in gps or GPS_LONGITUDE not in gps:
+        return None
+    return (
+        _degrees(gps[GPS_LATITUDE], gps.get(GPS_LATITUDE_REF, "N")),
+        _degrees(gps[GPS_LONGITUDE], gps.get(GPS_LONGITUDE_REF, "E")),
+    )
+
+
+def load_image(root, relative_path, csv_coordinates):
+    """Decode an image and find its coordinates. Runs on the loader threads."""
+    with Image.open(os.path.join(root, relative_path)) as image:
+        coordinates = csv_coordinates.get(relative_path) or csv_coordinates.get(os.path.basename(relative_path))
+        if coordinates is None:
+            coordinates = read_exif_coordinates(image)
+        return image.convert("RGB"), coordinates
+
+
+def image_id(relative_path):
+    """Index and Vespa document id of an image: its path with the extension, so a.jpg and a.png stay apart."""
+    return relative_path.replace(os.sep, "/")
+
+
+class Manifest:
+    """
+    What the index currently holds: id, coordinates, file signature and
+    embedding per image path, plus the signature and reason of every image
+    skipped. Each entry also records the signature Vespa last acknowledged
+    ("fed"), and document ids still to be deleted from Vespa are kept until
+    a delete succeeds. Loaded from and saved next to the index file.
+    """
+
+    def __init__(self, index_path, embedding_dtype, model_name=MODEL_NAME):
+        self.index_path = index_path
+        self.metadata_path = os.path.splitext(index_path)[0] + ".json"
+        self.embedding_dtype = np.dtype(embedding_dtype)
+        self.model_name = model_name
+        self.entries = {}
+        self.skipped = {}
+        # {path: entry as stored} for entries loaded under an outdated id.
+        self.renamed = {}
+        # Vespa document ids to delete, in the order they were dropped.
+        self.deletes = []
+
+    def load(self):
+        """Load entries from a previous run, if it used the same model."""
+        if not (os.path.exists(self.index_path) and os.path.exists(self.metadata_path)):
+            return
+        with open(self.metadata_path) as file:
+            metadata = json.load(file)
+        if metadata.get("model") != self.model_name:
+            print(f"Index was built with {metadata.get('model')}; re-embedding everything.")
+            return
+        records = np.load(self.index_path, mmap_mode="r")
+        embeddings = dequantize(records)
+        rows = {str(record_id): row for row, record_id in enumerate(records["id"])}
+        for path, entry in metadata["files"].items():
+            row = rows.get(entry["id"])
+            if row is not None:
+                self.entries[path] = {**entry, "id": image_id(path), "embedding": embeddings[row]}
+                if entry["id"] != image_id(path):
+                    # Fed again under the new id, and the old document deleted.
+                    self.renamed[path] = entry
+                    self.entries[path].pop("fed", None)
+                    self.deletes.append(entry["id"])
+        self.skipped = metadata.get("skipped", {})
+        self.deletes = metadata.get("deletes", []) + self.deletes
+
+    def is_current(self, path, signature, has_coordinates=False):
+        """
+        Whether `path` needs no work: embedded with this signature, or skipped
+        with this signature for a reason that still holds.
+        """
+        entry = self.entries.get(path)
+        if entry is not None:
+            return entry["signature"] == signature
+        skipped = self.skipped.get(path)
+        if skipped is None or skipped["signature"] != signature:
+            return False
+        return not (skipped["reason"] == "no coordinates" and has_coordinates)
+
+    def add(self, path, signature, coordinates, embedding):
+        self.entries[path] = {
+            "id": image_id(path),
+            "signature": signature,
+            "coordinate_x": coordinates[0],
+            "coordinate_y": coordinates[1],
+            "embedding": embedding,
+        }
+        self.skipped.pop(path, None)
+
+    def skip(self, path, signature, reason):
+        """Remember a skipped image; returns its previous entry, now stale, if it had one."""
+        self.skipped[path] = {"signature": signature, "reason": reason}
+        stale = self.entries.pop(path, None)
+        if stale is not None:
+            self.deletes.append(stale["id"])
+        return stale
+
+    def prune(self, paths):
+        """Drop entries for files that no longer exist. Returns the removed entries."""
+        keep = set(paths)
+        removed = {path: entry for path, entry in self.entries.items() if path not in keep}
+        for path, entry in removed.items():
+            del self.entries[path]
+            self.deletes.append(entry["id"])
+        for path in [path for path in self.skipped if path not in keep]:
+            del self.skipped[path]
+        return removed
+
+    def unfed(self):
+        """Entries Vespa has not acknowledged in their current version."""
+        return [entry for entry in self.entries.values() if entry.get("fed") != entry["signature"]]
+
+    def pending_deletes(self):
+        """Document ids still to be deleted from Vespa; an id in use again is fed instead."""
+        current = {entry["id"] for entry in self.entries.values()}
+        return [document_id for document_id in dict.fromkeys(self.deletes) if document_id not in current]
+
+    def mark_fed(self, fed, deleted):
+        """
+        Record what Vespa accepted.
+
+        :param fed: Entries fed successfully.
+        :param deleted: Document ids deleted successfully.
+        """
+        for entry in fed:
+            entry["fed"] = entry["signature"]
+        deleted = set(deleted)
+        current = {entry["id"] for entry in self.entries.values()}
+        self.deletes = [
+            document_id for document_id in self.deletes if document_id not in deleted and document_id not in current
+        ]
+
+    def save(self):
+        paths = sorted(self.entries)
+        entries = [self.entries[path] for path in paths]
+        if entries:
+            embeddings = np.stack([entry["embedding"] for entry in entries])
+        else:
+            embeddings = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        save_index(
+            self.index_path,
+            [entry["id"] for entry in entries],
+            [entry["coordinate_x"] for entry in entries],
+            [entry["coordinate_y"] for entry in entries],
+            embeddings,
+            embedding_dtype=self.embedding_dtype,
+        )
+        self.save_metadata()
+
+    def save_metadata(self):
+        """Write the metadata file alone, e.g. after a feed changed only what Vespa holds."""
+        paths = sorted(self.entries)
+        metadata = {
+            "model": self.model_name,
+            "dtype": self.embedding_dtype.name,
+            "count": len(paths),
+            "files": {
+                path: {key: value for key, value in self.entries[path].items() if key != "embedding"}
+                for path in paths
+            },
+            "skipped": self.skipped,
+            "deletes": self.deletes,
+        }
+        temporary = f"{self.metadata_path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(metadata, file, indent=1)
+        os.replace(temporary, self.metadata_path)
+
+
+def embed_images(model, processor, images):
+    """Normalized float32 CLIP embeddings for a list of PIL images."""
+    import torch
+
+    inputs = processor(images=images, return_tensors="pt")
+    with torch.inference_mode():
+        features = model.get_image_features(**inputs)
+    embeddings = features.numpy().astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def vespa_documents(entries):
+    """Feed operations for the `doc` schema."""
+    for entry in entries:
+        yield {
+            "id": entry["id"],
+            "fields": {
+                "id": entry["id"],
+                "coordinate_x": str(entry["coordinate_x"]),
+                "coordinate_y": str(entry["coordinate_y"]),
+                "embedding": [float(value) for value in entry["embedding"]],
+            },
+        }
+
+
+def feed_vespa(url, namespace, changed, deletes, cert=None, key=None):
+    """
+    Bulk-feed entries to Vespa and delete documents.
+
+    :param changed: Entries to feed.
+    :param deletes: Document ids to delete.
+    :return: Set of document ids whose operation failed.
+    """
+    from vespa.application import Vespa
+
+    app = Vespa(url=url, cert=cert, key=key)
+    failures = set()
+
+    def callback(response, document_id):
+        if not response.is_successful():
+            failures.add(document_id)
+
+    app.feed_iterable(vespa_documents(changed), schema="doc", namespace=namespace, callback=callback)
+    app.feed_iterable(
+        ({"id": document_id} for document_id in deletes),
+        schema="doc",
+        namespace=namespace,
+        operation_type="delete",
+        callback=callback,
+    )
+    print(f"Fed {len(changed)} and deleted {len(deletes)} Vespa documents, {len(failures)} failed.")
+    return failures
+
+
+def sync_vespa(manifest, url, namespace, cert=None, key=None, feed=feed_vespa):
+    """
+    Send Vespa everything it has not acknowledged: unfed entries and pending
+    deletes, from this run or an earlier one. Only operations Vespa accepted
+    are marked done, so failures are retried on the next run.
+
+    :param feed: Callable with feed_vespa's signature, returning the failed ids.
+    :return: Set of document ids that failed.
+    """
+    unfed = manifest.unfed()
+    deletes = manifest.pending_deletes()
+    if not unfed and not deletes:
+        print("Vespa is up to date.")
+        return set()
+    failures = feed(url, namespace, unfed, deletes, cert, key)
+    manifest.mark_fed(
+        [entry for entry in unfed if entry["id"] not in failures],
+        [document_id for document_id in deletes if document_id not in failures],
+    )
+    manifest.save_metadata()
+    return failures
+
+
+def ingest(
+    root,
+    output="image_index.npy",
+    coordinates_csv=None,
+    embedding_dtype="float16",
+    batch_size=32,
+    workers=4,
+    checkpoint_every=10,
+):
+    """
+    Embed every geotagged image under `root` that changed since the last run.
+
+    :param root: Image directory.
+    :param output: Index file to create or update.
+    :param coordinates_csv: Optional sidecar CSV with coordinates.
+    :param embedding_dtype: float32, float16 or int8.
+    :param batch_size: Images per CLIP forward pass.
+    :param workers: Threads decoding images ahead of the model.
+    :param checkpoint_every: Save the index after this many batches.
+    :return: The saved Manifest.
+    """
+    from transformers import CLIPModel, CLIPProcessor
+
+    manifest = Manifest(output, embedding_dtype)
+    manifest.load()
+
+    csv_coordinates = read_coordinates_csv(coordinates_csv) if coordinates_csv else {}
+    paths = find_images(root)
+    removed = len(manifest.prune(paths)) + len(manifest.renamed)
+    signatures = {path: file_signature(os.path.join(root, path)) for path in paths}
+    pending = [
+        path for path in paths
+        if not manifest.is_current(
+            path,
+            signatures[path],
+            has_coordinates=path in csv_coordinates or os.path.basename(path) in csv_coordinates,
+        )
+    ]
+    print(f"{len(paths)} images, {len(pending)} to embed, {removed} removed.")
+    if not pending:
+        if removed:
+            manifest.save()
+        return manifest
+
+    model = CLIPModel.from_pretrained(MODEL_NAME).eval()
+    processor = CLIPProcessor.from_pretrained(MODEL_NAME)
+
+    skipped = 0
+    failed = 0
+    started = time.time()
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Decode the next batch while the model runs on the current one.
+        next_batch = [pool.submit(load_image, root, path, csv_coordinates) for path in batches[0]]
+        for number, batch in enumerate(batches):
+            loaded = next_batch
+            if number + 1 < len(batches):
+                next_batch = [pool.submit(load_image, root, path, csv_coordinates) for path in batches[number + 1]]
+
+            geotagged = []
+            for path, future in zip(batch, loaded):
+                try:
+                    image, coords = future.result()
+                except Exception as e:
+                    # A truncated or undecodable file only costs itself.
+                    print(f"Skipping {path}: {e}")
+                    failed += 1
+                    reason = "unreadable"
+                else:
+                    if coords is not None:
+                        geotagged.append((path, image, coords))
+                        continue
+                    skipped += 1
+                    reason = "no coordinates"
+                manifest.skip(path, signatures[path], reason)
+            if geotagged:
+                embeddings = embed_images(model, processor, [image for _, image, _ in geotagged])
+                for (path, _, coords), embedding in zip(geotagged, embeddings):
+                    manifest.add(path, signatures[path], coords, embedding)
+
+            if (number + 1) % checkpoint_every == 0:
+                manifest.save()
+            done = min((number + 1) * batch_size, len(pending))
+            print(f"Embedded {done}/{len(pending)} ({done / (time.time() - started):.1f} images/s)")
+
+    manifest.save()
+    if skipped or failed:
+        print(f"Skipped {skipped} images without coordinates and {failed} unreadable images.")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the geotagged image embedding index.")
+    parser.add_argument("root", help="Directory of images")
+    parser.add_argument("--output", default="image_index.npy", help="Index file to create or update")
+    parser.add_argument("--coordinates", help="Sidecar CSV with filename, latitude, longitude")
+    parser.add_argument("--dtype", default="float16", choices=["float32", "float16", "int8"])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--vespa-url", help="Also feed changes to this Vespa endpoint")
+    parser.add_argument("--vespa-namespace", default="treehacks")
+    parser.add_argument("--vespa-cert")
+    parser.add_argument("--vespa-key")
+    args = parser.parse_args()
+
+    manifest = ingest(
+        args.root,
+        output=args.output,
+        coordinates_csv=args.coordinates,
+        embedding_dtype=args.dtype,
+        batch_size=args.batch_size,
+        workers=args.workers,
+    )
+    if args.vespa_url:
+        sync_vespa(manifest, args.vespa_url, args.vespa_namespace, args.vespa_cert, args.vespa_key)
+
+
+if __name__ == "__main__":
+    main()
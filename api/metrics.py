@@ -0,0 +1,228 @@
+import asyncio
+import bisect
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+# helper.py sends its histograms here, server.py merges them into its own.
+DEFAULT_METRICS_ADDRESS = ("127.0.0.1", 4003)
+
+# Histogram bucket upper bounds in seconds: 50 us to about 13 s, sqrt(2) apart.
+BUCKETS = tuple(5e-5 * 2 ** (i / 2) for i in range(37))
+
+
+class Histogram:
+    """Counts of observed durations in fixed buckets, with their sum."""
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.bounds, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile, or None if empty."""
+        with self.lock:
+            counts, total = list(self.counts), self.count
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        with self.lock:
+            return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+    def restore(self, snapshot):
+        with self.lock:
+            self.counts = list(snapshot["counts"])
+            self.sum = snapshot["sum"]
+            self.count = snapshot["count"]
+
+
+class Span:
+    """Times a block with time.monotonic() and reports it to a Registry on exit."""
+
+    __slots__ = ("registry", "stage", "frame_id", "started")
+
+    def __init__(self, registry, stage, frame_id):
+        self.registry = registry
+        self.stage = stage
+        self.frame_id = frame_id
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.stage, time.monotonic() - self.started, self.frame_id)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Registry:
+    """
+    In-process histograms of stage durations, one per stage name.
+
+    Spans tagged with a frame id are also kept in a short ring of recent
+    traces, so a single frame can be followed from capture to the frontend.
+    A disabled registry hands out a shared no-op span and records nothing.
+    """
+
+    def __init__(self, enabled=True, trace_size=512):
+        self.enabled = enabled
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.traces = deque(maxlen=trace_size)
+        # Traces ever recorded, so a publisher can tell which ones are new.
+        self.traced = 0
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds, frame_id=None):
+        if not self.enabled:
+            return
+        self.histogram(stage).observe(seconds)
+        if frame_id is not None:
+            self.traces.append((frame_id, stage, seconds))
+            self.traced += 1
+
+    def span(self, stage, frame_id=None):
+        """Context manager timing one stage, optionally for one frame."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, frame_id)
+
+    def snapshot(self):
+        return {stage: histogram.snapshot() for stage, histogram in list(self.histograms.items())}
+
+    def merge(self, snapshot, prefix=""):
+        """Replace histograms with another process's cumulative snapshot, renamed with `prefix`."""
+        for stage, state in snapshot.get("histograms", {}).items():
+            self.histogram(prefix + stage).restore(state)
+        for frame_id, stage, seconds in snapshot.get("traces", []):
+            self.traces.append((frame_id, prefix + stage, seconds))
+
+    def frames(self):
+        """{frame id: {stage: milliseconds}} for the recent traces."""
+        frames = {}
+        for frame_id, stage, seconds in list(self.traces):
+            frames.setdefault(frame_id, {})[stage] = 1000 * seconds
+        return frames
+
+    def summary(self):
+        """{stage: {"count", "mean_ms", "p50_ms", "p99_ms"}}; percentiles are bucket upper bounds."""
+        summary = {}
+        for stage, histogram in sorted(self.histograms.items()):
+            if histogram.count:
+                summary[stage] = {
+                    "count": histogram.count,
+                    "mean_ms": 1000 * histogram.sum / histogram.count,
+                    "p50_ms": 1000 * histogram.quantile(0.5),
+                    "p99_ms": 1000 * histogram.quantile(0.99),
+                }
+        return summary
+
+    def render(self):
+        """Prometheus text exposition of every histogram as miru_stage_seconds{stage=...}."""
+        lines = [
+            "# HELP miru_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE miru_stage_seconds histogram",
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            state = histogram.snapshot()
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + (float("inf"),), state["counts"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                lines.append(f'miru_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'miru_stage_seconds_sum{{stage="{stage}"}} {state["sum"]}')
+            lines.append(f'miru_stage_seconds_count{{stage="{stage}"}} {state["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry. METRICS=0 turns every span into a no-op.
+registry = Registry(enabled=os.getenv("METRICS", "1") != "0")
+span = registry.span
+observe = registry.observe
+
+
+class MetricsPublisher:
+    """Sends a registry's histograms and the traces recorded since the last send to a server over UDP."""
+
+    def __init__(self, registry=registry, address=DEFAULT_METRICS_ADDRESS, max_traces=64):
+        self.registry = registry
+        self.address = address
+        self.max_traces = max_traces
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sent_traces = 0
+
+    def publish(self):
+        if not self.registry.enabled:
+            return
+        new = min(self.registry.traced - self.sent_traces, self.max_traces)
+        traces = list(self.registry.traces)[-new:] if new > 0 else []
+        self.sent_traces = self.registry.traced
+        packet = json.dumps({"histograms": self.registry.snapshot(), "traces": traces}).encode()
+        try:
+            self.sock.sendto(packet, self.address)
+        except OSError:
+            # No server listening; metrics are only useful live.
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class _MetricsProtocol(asyncio.DatagramProtocol):
+    def __init__(self, registry, prefix):
+        self.registry = registry
+        self.prefix = prefix
+
+    def datagram_received(self, data, addr):
+        try:
+            snapshot = json.loads(data)
+        except ValueError:
+            return
+        self.registry.merge(snapshot, self.prefix)
+
+
+async def serve_metrics(registry=registry, address=DEFAULT_METRICS_ADDRESS, prefix="helper_"):
+    """Merge snapshots from a MetricsPublisher into `registry`. Returns the transport; close it to stop."""
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _MetricsProtocol(registry, prefix), local_addr=address
+    )
+    return transport
@@ -0,0 +1,221 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+from typing import NamedTuple
+
+from compass import CompassBuffer
+
+# helper.py publishes here, server.py listens here.
+DEFAULT_BUS_ADDRESS = ("127.0.0.1", 4001)
+
+# server.py forwards compass headings to helper.py here.
+DEFAULT_HEADING_ADDRESS = ("127.0.0.1", 4002)
+
+# latitude, longitude, timestamp (seconds since epoch), covariance (east var, north var, east-north),
+# id of the frame behind the fix (-1 for dead reckoning), its capture time (time.monotonic())
+PACKET = struct.Struct("<ddddddqd")
+
+# heading in degrees, timestamp (seconds since epoch)
+HEADING_PACKET = struct.Struct("<dd")
+
+
+class Position(NamedTuple):
+    version: int
+    latitude: float
+    longitude: float
+    timestamp: float
+    # (east variance, north variance, east-north covariance) in square meters
+    covariance: tuple = (0.0, 0.0, 0.0)
+    # Frame whose fix produced this position and when it was captured, for latency spans
+    frame_id: int = -1
+    captured: float = float("nan")
+
+
+class PositionBus:
+    """
+    Holds the latest position under a version number.
+
+    publish() replaces the whole position at once, so readers never see a half
+    written value. Subscribers wait for a version newer than the last one they
+    saw instead of polling, either from a thread (wait) or from asyncio
+    (wait_async / subscribe).
+    """
+
+    def __init__(self, latitude=0.0, longitude=0.0):
+        self.cond = threading.Condition()
+        self.position = Position(0, latitude, longitude, time.time())
+        self.async_waiters = []
+
+    def latest(self):
+        """Return the current position."""
+        with self.cond:
+            return self.position
+
+    def publish(self, latitude, longitude, timestamp=None, covariance=(0.0, 0.0, 0.0), frame_id=-1, captured=float("nan")):
+        """
+        Atomically replace the current position and wake every subscriber.
+
+        :return: The new Position.
+        """
+        with self.cond:
+            position = Position(
+                self.position.version + 1,
+                float(latitude),
+                float(longitude),
+                time.time() if timestamp is None else timestamp,
+                tuple(map(float, covariance)),
+                int(frame_id),
+                float(captured),
+            )
+            self.position = position
+            waiters, self.async_waiters = self.async_waiters, []
+            self.cond.notify_all()
+
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future, position)
+        return position
+
+    def wait(self, after_version=0, timeout=None):
+        """
+        Block until a position newer than `after_version` is published.
+
+        :return: The newest Position, or None on timeout.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.position.version > after_version, timeout):
+                return None
+            return self.position
+
+    async def wait_async(self, after_version=0):
+        """Wait without blocking the event loop for a position newer than `after_version`."""
+        loop = asyncio.get_running_loop()
+        with self.cond:
+            if self.position.version > after_version:
+                return self.position
+            future = loop.create_future()
+            waiter = (loop, future)
+            self.async_waiters.append(waiter)
+        try:
+            return await future
+        finally:
+            with self.cond:
+                if waiter in self.async_waiters:
+                    self.async_waiters.remove(waiter)
+
+    async def subscribe(self, after_version=0):
+        """Yield every new position as it is published. Slow readers skip to the latest one."""
+        while True:
+            position = await self.wait_async(after_version)
+            after_version = position.version
+            yield position
+
+
+def _resolve(future, position):
+    if not future.done():
+        future.set_result(position)
+
+
+class BusPublisher:
+    """Sends positions from another process (helper.py) to a bus served by serve_bus."""
+
+    def __init__(self, address=DEFAULT_BUS_ADDRESS):
+        self.address = address
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def publish(self, latitude, longitude, timestamp=None, covariance=(0.0, 0.0, 0.0), frame_id=-1, captured=float("nan")):
+        packet = PACKET.pack(
+            latitude, longitude, time.time() if timestamp is None else timestamp, *covariance, frame_id, captured
+        )
+        try:
+            self.sock.sendto(packet, self.address)
+        except OSError as e:
+            # The server may not be up yet; the next fix will go through.
+            print("Position bus send failed:", e)
+
+    def close(self):
+        self.sock.close()
+
+
+class _BusProtocol(asyncio.DatagramProtocol):
+    def __init__(self, bus):
+        self.bus = bus
+
+    def datagram_received(self, data, addr):
+        if len(data) != PACKET.size:
+            return
+        latitude, longitude, timestamp, *covariance, frame_id, captured = PACKET.unpack(data)
+        self.bus.publish(latitude, longitude, timestamp, covariance, frame_id, captured)
+
+
+async def serve_bus(bus, address=DEFAULT_BUS_ADDRESS):
+    """
+    Receive positions sent by a BusPublisher and publish them on `bus`.
+
+    :return: The datagram transport; close it on shutdown.
+    """
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(lambda: _BusProtocol(bus), local_addr=address)
+    return transport
+
+
+class HeadingPublisher:
+    """Forwards compass headings from server.py to a HeadingListener."""
+
+    def __init__(self, address=DEFAULT_HEADING_ADDRESS):
+        self.address = address
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def publish(self, heading, timestamp=None):
+        packet = HEADING_PACKET.pack(heading, time.time() if timestamp is None else timestamp)
+        try:
+            self.sock.sendto(packet, self.address)
+        except OSError:
+            # Nobody is tracking yet; headings are only useful live.
+            pass
+
+    def close(self):
+        self.sock.close()
+
+
+class HeadingListener:
+    """
+    Collects compass headings received from a HeadingPublisher on a daemon
+    thread, into `compass` (a CompassBuffer) for lookups by time.
+    """
+
+    def __init__(self, address=DEFAULT_HEADING_ADDRESS, max_age=1.0, capacity=1024):
+        """
+        :param address: Address to listen on.
+        :param max_age: Seconds after which a heading is considered stale.
+        :param capacity: Number of samples kept in `compass`.
+        """
+        self.max_age = max_age
+        self.compass = CompassBuffer(capacity)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        self.heading = None
+        self.received = float("-inf")
+        self.thread = threading.Thread(target=self._run, name="heading-listener", daemon=True)
+        self.thread.start()
+
+    def latest(self):
+        """The latest heading in degrees, or None if none arrived within `max_age`."""
+        if time.monotonic() - self.received > self.max_age:
+            return None
+        return self.heading
+
+    def _run(self):
+        while True:
+            try:
+                data = self.sock.recv(HEADING_PACKET.size)
+            except OSError:
+                return
+            if len(data) == HEADING_PACKET.size:
+                self.heading, timestamp = HEADING_PACKET.unpack(data)
+                self.received = time.monotonic()
+                self.compass.append(self.heading, timestamp)
+
+    def close(self):
+        self.sock.close()
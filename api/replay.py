@@ -0,0 +1,320 @@
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from belt import BeltWriter, handle_button
+from compass import CompassBuffer
+from estimator import estimate_position
+from geo import building_frame
+from session import Session, load_session, decode_frame
+from tracker import ParticleTracker
+from vector_search import EMBEDDING_DIM, load_index, save_index
+from zone_classifier import ZONE_DATA, LocalZoneClassifier, parse_zone_data
+from zones import AdjacentZoneStateMachine, ZoneGraph
+
+# Same cadence as helper.main().
+TICK_INTERVAL = 0.1
+
+
+def _percentiles(values, percentiles=(50, 90, 99)):
+    if len(values) == 0:
+        return {f"p{p}": None for p in percentiles}
+    return {f"p{p}": float(np.percentile(values, p)) for p in percentiles}
+
+
+def replay(
+    session,
+    embed,
+    search,
+    top_k=20,
+    method="mad",
+    max_std=2.0,
+    every_frame=False,
+    realtime=False,
+    zone_graph=None,
+    zone_classifier=None,
+    seed=0,
+):
+    """
+    Drive a recorded session through capture -> embed -> search -> estimate
+    -> tracker (-> zone state machine) on a virtual clock that ticks like
+    helper.main(): every TICK_INTERVAL the tracker is advanced with the
+    compass heading, and the newest recorded frame is run through the
+    pipeline whenever the tracker asks for a fix. With a zone graph and
+    classifier, each fix's embedding is also classified and confident
+    answers are fed to an AdjacentZoneStateMachine facing the replayed
+    compass heading, as helper.classify_zone does live. Button presses go
+    through server.py's button handler to a BeltWriter that is never
+    started, so nothing reaches a port but every command is validated and
+    coalesced as it would be live.
+
+    With a fixed seed and realtime=False the result depends only on the
+    session and the stages, so two runs give the same positions.
+
+    :param session: A session.Session.
+    :param embed: Callable frame -> embedding, e.g. EmbeddingService.embed.
+    :param search: A vector_search.VectorSearch.
+    :param top_k: Retrieval hits per frame.
+    :param method: One of estimator.ESTIMATORS.
+    :param max_std: Tracker uncertainty in meters that triggers a fix.
+    :param every_frame: Run every recorded frame instead of only when a fix is needed.
+    :param realtime: Pace ticks to the wall clock as they were recorded.
+    :param zone_graph: Optional zones.ZoneGraph to track the zone through.
+    :param zone_classifier: Classifier with classify(embedding) -> (zone, margin, confident),
+                            e.g. a zone_classifier.LocalZoneClassifier; needed with zone_graph.
+    :param seed: Tracker random seed.
+    :return: dict with latency percentiles, per-stage means, positional error against the labels, counts,
+             and the belt commands with the direction sent or the error for each button press.
+    """
+    first, last = session.span()
+    frames = session.frames
+    compass_times, compass_headings = session.compass
+    buttons = session.buttons
+    truth_times, truth_points = session.truth
+
+    frame = building_frame()
+    start_position = truth_points[0] if len(truth_points) else frame.to_geodetic([0.0, 0.0])
+    tracker = ParticleTracker(*start_position, seed=seed, frame=frame)
+    compass = CompassBuffer(max(len(compass_times), 1))
+    # Stand-in for the serial belt: send() runs, the writer task that would write to the port does not.
+    belt = BeltWriter(None)
+    belt_commands = []
+
+    stages = {"capture": [], "embed": [], "search": [], "estimate": [], "track": []}
+    state_machine = None
+    zone_counts = {"confident": 0, "uncertain": 0, "accepted": 0, "rejected": 0}
+    zone_track = []
+    if zone_graph is not None:
+        if zone_classifier is None:
+            raise ValueError("A zone graph needs a zone classifier.")
+        def latest_heading():
+            latest = compass.latest()
+            return None if latest is None else latest[0]
+
+        state_machine = AdjacentZoneStateMachine(zone_graph, heading=latest_heading)
+        stages["zone"] = []
+    latencies, errors, track = [], [], []
+    next_frame = next_compass = next_button = next_truth = 0
+    processed = skipped = 0
+    wall_start = time.perf_counter()
+
+    now = first
+    while now <= last + TICK_INTERVAL:
+        if realtime:
+            time.sleep(max(0.0, (now - first) - (time.perf_counter() - wall_start)))
+        tick_started = time.perf_counter()
+
+        while next_compass < len(compass_times) and compass_times[next_compass] <= now:
+            compass.append(compass_headings[next_compass], compass_times[next_compass])
+            next_compass += 1
+        while next_button < len(buttons) and buttons[next_button][0] <= now:
+            timestamp, index = buttons[next_button]
+            try:
+                belt_commands.append((timestamp, index, handle_button(belt, {"index": index})))
+            except (KeyError, TypeError, ValueError) as e:
+                belt_commands.append((timestamp, index, str(e)))
+            next_button += 1
+
+        # Newest frame captured by now; older ones were never seen by the live loop either.
+        newest = None
+        while next_frame < len(frames) and frames[next_frame][0] <= now:
+            if newest is not None:
+                skipped += 1
+            newest = next_frame
+            next_frame += 1
+
+        latest = compass.latest()
+        tracker.predict(heading=None if latest is None else latest[0], now=now)
+
+        if newest is not None and (every_frame or tracker.needs_fix(max_std)):
+            timestamp, jpeg = frames[newest]
+            timings = {}
+
+            started = time.perf_counter()
+            image = decode_frame(jpeg, seq=newest, timestamp=timestamp)
+            timings["capture"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            embedding = embed(image)
+            timings["embed"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            hits = search.search(embedding, top_k=top_k)
+            timings["search"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            points = np.array([[hit.coordinate_x, hit.coordinate_y] for hit in hits]).reshape(-1, 2)
+            scores = np.array([hit.relevance for hit in hits])
+            coordinates = estimate_position(points, scores, method=method)
+            timings["estimate"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            if coordinates is not None:
+                tracker.update(*coordinates)
+            timings["track"] = time.perf_counter() - started
+
+            if state_machine is not None:
+                started = time.perf_counter()
+                zone, _, confident = zone_classifier.classify(embedding)
+                if confident:
+                    zone_counts["confident"] += 1
+                    old_zone = state_machine.current_zone
+                    state_machine.transition(zone)
+                    if state_machine.current_zone != old_zone:
+                        zone_counts["accepted"] += 1
+                        zone_track.append((now, state_machine.current_zone))
+                    elif zone != old_zone:
+                        zone_counts["rejected"] += 1
+                else:
+                    zone_counts["uncertain"] += 1
+                timings["zone"] = time.perf_counter() - started
+
+            for stage, seconds in timings.items():
+                stages[stage].append(seconds)
+            # From the moment the tick should have started (the frame was available) to the committed position.
+            lateness = (tick_started - wall_start) - (now - first) if realtime else 0.0
+            latencies.append(max(lateness, 0.0) + sum(timings.values()))
+            processed += 1
+        elif newest is not None:
+            skipped += 1
+
+        estimate = tracker.estimate()
+        track.append((now, estimate.latitude, estimate.longitude, estimate.std))
+        while next_truth < len(truth_times) and truth_times[next_truth] <= now:
+            errors.append(frame.distance((estimate.latitude, estimate.longitude), truth_points[next_truth]))
+            next_truth += 1
+
+        now += TICK_INTERVAL
+
+    latencies_ms = 1000 * np.array(latencies)
+    errors = np.array(errors)
+    report = {
+        "frames": len(frames),
+        "processed": processed,
+        "skipped": skipped,
+        "compass_samples": len(compass_times),
+        "buttons": len(buttons),
+        "duration_s": last - first,
+        "wall_s": time.perf_counter() - wall_start,
+        "latency_ms": {**_percentiles(latencies_ms), "mean": float(latencies_ms.mean()) if len(latencies_ms) else None},
+        "stage_mean_ms": {stage: 1000 * float(np.mean(times)) for stage, times in stages.items() if times},
+        "error_m": {
+            "labels": len(errors),
+            "mean": float(errors.mean()) if len(errors) else None,
+            **_percentiles(errors, (50, 90)),
+            "max": float(errors.max()) if len(errors) else None,
+        },
+        "belt": {**belt.stats(), "commands": belt_commands},
+        "track": track,
+    }
+    if state_machine is not None:
+        report["zones"] = {**zone_counts, "final": state_machine.current_zone, "track": zone_track}
+    return report
+
+
+def check():
+    """
+    Replay a synthetic session: frames of four colored places along a hallway,
+    a steady compass and two button presses, one of them an unknown
+    direction. Checks that the walk is tracked and that both presses reach
+    the belt handler, the valid one sent and the invalid one rejected.
+    """
+    from PIL import Image
+
+    frame = building_frame()
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 255, (4, 3))
+    basis = rng.normal(size=(3, EMBEDDING_DIM))
+    places = frame.to_geodetic(np.stack([np.arange(4) * 10.0, np.zeros(4)], axis=1))
+
+    def embed(image):
+        vector = image.rgb.reshape(-1, 3).mean(axis=0) @ basis
+        return vector / np.linalg.norm(vector)
+
+    frames, truth = [], []
+    for step in range(40):
+        timestamp, place = step * 0.5, min(step // 10, 3)
+        jpeg = io.BytesIO()
+        Image.new("RGB", (32, 24), tuple(int(c) for c in colors[place])).save(jpeg, format="JPEG")
+        frames.append((timestamp, jpeg.getvalue()))
+        truth.append((timestamp, *places[place]))
+    truth = np.array(truth)
+    times = np.arange(0.0, 20.0, 0.1)
+    session = Session(frames, (times, np.full(len(times), 90.0)), [(3.0, 2), (7.0, 9)], (truth[:, 0], truth[:, 1:]))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "index.npy")
+        save_index(path, [str(i) for i in range(4)], places[:, 0], places[:, 1], colors @ basis)
+        report = replay(session, embed, load_index(path), top_k=1, every_frame=True)
+
+    assert report["processed"] > 0 and report["error_m"]["max"] < 15, report["error_m"]
+    (first_time, first_index, sent), (second_time, second_index, error) = report["belt"]["commands"]
+    assert (first_time, first_index, sent) == (3.0, 2, 2), report["belt"]
+    assert (second_time, second_index) == (7.0, 9) and "Unknown belt direction" in error, report["belt"]
+    assert report["belt"]["requested"] == 1, report["belt"]
+    return {"error_m": report["error_m"], "belt": report["belt"]}
+
+
+def clip_embedder(batch_size=4):
+    """Local CLIP embeddings, the same model helper.py uses."""
+    from transformers import CLIPModel, CLIPProcessor
+
+    from embedder import EmbeddingService
+
+    model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
+    processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    return EmbeddingService(model, processor, batch_size=batch_size, max_wait=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the localization pipeline.")
+    parser.add_argument("session", nargs="?", help="File written by session.py")
+    parser.add_argument("--index", default="image_index.npy", help="Local image index standing in for Vespa")
+    parser.add_argument("--backend", default="auto", help="Index backend: auto, exact, ivf or hnsw")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--method", default="mad", help="Position estimator")
+    parser.add_argument("--max-std", type=float, default=2.0, help="Tracker uncertainty that triggers a fix")
+    parser.add_argument("--every-frame", action="store_true", help="Run every frame, not only when a fix is needed")
+    parser.add_argument("--realtime", action="store_true", help="Replay at recorded speed instead of as fast as possible")
+    parser.add_argument("--track", help="Write the tracked positions to this JSON file")
+    parser.add_argument("--zones", default="zones.json", help="Zone config to replay the zone state machine on")
+    parser.add_argument("--no-zones", action="store_true", help="Skip zone classification")
+    parser.add_argument("--check", action="store_true", help="Replay a synthetic session and check the report")
+    args = parser.parse_args()
+    if args.check:
+        print("replay OK:", json.dumps(check(), indent=2))
+        return
+    if args.session is None:
+        parser.error("a session file is required")
+
+    session = load_session(args.session)
+    search = load_index(args.index, backend=args.backend)
+    embedding_service = clip_embedder()
+    zone_graph = zone_classifier = None
+    if not args.no_zones:
+        zone_graph = ZoneGraph.load(args.zones)
+        zone_classifier = LocalZoneClassifier.from_service(parse_zone_data(ZONE_DATA), embedding_service)
+    try:
+        report = replay(
+            session, embedding_service.embed, search,
+            top_k=args.top_k, method=args.method, max_std=args.max_std,
+            every_frame=args.every_frame, realtime=args.realtime,
+            zone_graph=zone_graph, zone_classifier=zone_classifier,
+        )
+    finally:
+        embedding_service.close()
+
+    track = report.pop("track")
+    if args.track:
+        with open(args.track, "w") as file:
+            json.dump(track, file)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
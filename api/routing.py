@@ -0,0 +1,173 @@
+import json
+
+import numpy as np
+
+from geo import building_frame, load_nodes
+from spatial_index import GridIndex
+
+
+class RouteGraph:
+    """
+    The walkable map from nodes.json/edges.json with every shortest path
+    precomputed.
+
+    Edges are held as a CSR adjacency (indptr/indices/lengths). distances[i, j]
+    is the shortest walking distance in meters and next_hop[i, j] the node to
+    go to from i on the way to j (-1 when unreachable), so a route step is two
+    table lookups.
+    """
+
+    def __init__(self, ids, names, coordinates, edges, frame=None):
+        """
+        :param ids: Node ids.
+        :param names: Node names.
+        :param coordinates: (n, 2) array of node (lat, lon).
+        :param edges: Pairs of node ids.
+        :param frame: geo.LocalFrame for metric math; defaults to the building frame.
+        """
+        self.frame = building_frame() if frame is None else frame
+        self.ids = list(ids)
+        self.names = list(names)
+        self.coordinates = np.asarray(coordinates, dtype=np.float64)
+        self.points = self.frame.to_enu(self.coordinates)
+        self.index = {node_id: i for i, node_id in enumerate(self.ids)}
+        self.name_index = {}
+        for i, name in enumerate(self.names):
+            self.name_index.setdefault(name.lower(), i)
+
+        self._build_csr(edges)
+        self._all_pairs()
+        self.spatial = GridIndex(self.points, self.points[self.edge_pairs])
+
+    @classmethod
+    def load(cls, nodes_path="nodes.json", edges_path="edges.json", frame=None):
+        ids, names, coordinates = load_nodes(nodes_path)
+        with open(edges_path) as file:
+            edges = [edge["nodes"] for edge in json.load(file)]
+        return cls(ids, names, coordinates, edges, frame)
+
+    def _build_csr(self, edges):
+        n = len(self.ids)
+        pairs = np.array(
+            [(self.index[a], self.index[b]) for a, b in edges if a in self.index and b in self.index],
+            dtype=np.int32,
+        ).reshape(-1, 2)
+        self.edge_pairs = pairs
+        # Walkable both ways
+        sources = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        targets = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        order = np.argsort(sources, kind="stable")
+        self.indices = targets[order]
+        self.lengths = np.linalg.norm(self.points[sources[order]] - self.points[self.indices], axis=1)
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=n)))).astype(np.int32)
+
+    def neighbors(self, i):
+        """Indices and edge lengths of the nodes adjacent to node i."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.lengths[start:end]
+
+    def _all_pairs(self):
+        # Floyd-Warshall, one vectorized relaxation per intermediate node.
+        n = len(self.ids)
+        distances = np.full((n, n), np.inf)
+        next_hop = np.full((n, n), -1, dtype=np.int32)
+        sources = np.repeat(np.arange(n), np.diff(self.indptr))
+        distances[sources, self.indices] = np.minimum(distances[sources, self.indices], self.lengths)
+        next_hop[sources, self.indices] = self.indices
+        np.fill_diagonal(distances, 0.0)
+        np.fill_diagonal(next_hop, np.arange(n))
+
+        for k in range(n):
+            through = distances[:, k, None] + distances[None, k, :]
+            better = through < distances
+            distances = np.where(better, through, distances)
+            next_hop = np.where(better, next_hop[:, k, None], next_hop)
+
+        self.distances = distances
+        self.next_hop = next_hop
+
+    def node(self, key):
+        """
+        Index of a node given its id or name (case-insensitive; the first node wins for shared names).
+
+        :raises KeyError: If no node matches.
+        """
+        if key in self.index:
+            return self.index[key]
+        if key.lower() in self.name_index:
+            return self.name_index[key.lower()]
+        raise KeyError(f"Unknown node: {key}")
+
+    def nearest_node(self, latitude, longitude):
+        """Index of the node closest to a position."""
+        index, _ = self.spatial.nearest_node(self.frame.to_enu([latitude, longitude]))
+        return index
+
+    def snap(self, latitude, longitude):
+        """
+        Map a position onto the graph.
+
+        :return: dict with the nearest node and the nearest edge (its two node ids,
+                 the closest point on it and the distance to it).
+        """
+        point = self.frame.to_enu([latitude, longitude])
+        node, node_distance = self.spatial.nearest_node(point)
+        edge, edge_distance, closest, along = self.spatial.nearest_segment(point)
+        start, end = self.edge_pairs[edge]
+        on_edge = self.frame.to_geodetic(closest)
+        return {
+            "node": self.ids[node],
+            "node_distance": node_distance,
+            "edge": [self.ids[start], self.ids[end]],
+            "edge_distance": edge_distance,
+            "edge_position": along,
+            "coordinates": [float(on_edge[0]), float(on_edge[1])],
+        }
+
+    def path(self, source, destination):
+        """Node ids along the shortest path, or None if unreachable."""
+        i, j = self.node(source), self.node(destination)
+        if self.next_hop[i, j] < 0:
+            return None
+        path = [i]
+        while i != j:
+            i = int(self.next_hop[i, j])
+            path.append(i)
+        return [self.ids[k] for k in path]
+
+    def next_step(self, latitude, longitude, destination, arrival_radius=1.5):
+        """
+        Where to walk next from a position on the way to `destination`.
+
+        :param latitude: Current latitude.
+        :param longitude: Current longitude.
+        :param destination: Destination node id or name.
+        :param arrival_radius: Meters within which a node counts as reached.
+        :return: dict with next_node, name, bearing (compass degrees), distance to it,
+                 remaining distance to the destination and whether we arrived; None if unreachable.
+        """
+        target = self.node(destination)
+        point = self.frame.to_enu([latitude, longitude])
+        nearest = self.nearest_node(latitude, longitude)
+        if self.next_hop[nearest, target] < 0:
+            return None
+
+        # Either walk to the snapped node first or cut straight to its next hop, whichever is shorter.
+        candidates = [nearest, int(self.next_hop[nearest, target])]
+        offsets = np.linalg.norm(self.points[candidates] - point, axis=1)
+        costs = offsets + self.distances[candidates, target]
+        choice = int(np.argmin(costs))
+        if choice == 0 and offsets[0] < arrival_radius and nearest != target:
+            # Already standing on the snapped node; head on to the next one.
+            choice = 1
+        step = candidates[choice]
+
+        east, north = self.points[step] - point
+        return {
+            "next_node": self.ids[step],
+            "name": self.names[step],
+            "bearing": float(np.degrees(np.arctan2(east, north)) % 360),
+            "distance": float(offsets[choice]),
+            "remaining": float(costs[choice]),
+            "arrived": bool(step == target and offsets[choice] < arrival_radius),
+        }
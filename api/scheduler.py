@@ -0,0 +1,134 @@
+import threading
+from collections import deque
+
+
+class FrameScheduler:
+    """
+    Runs a per-frame handler on a fixed pool of worker threads.
+
+    Frames wait in a bounded queue; when it is full the oldest pending frame is
+    dropped so workers always pick up the freshest view. Every frame gets a
+    sequence number, and results are only committed when they are newer than
+    the last committed one, so a slow, stale frame can never overwrite a newer
+    position.
+    """
+
+    def __init__(self, handler, on_result, workers=2, max_pending=2, name="frame-worker"):
+        """
+        :param handler: Called as handler(frame) on a worker thread. Returns a result or None.
+        :param on_result: Called as on_result(seq, result) for every result that is not stale.
+        :param workers: Number of worker threads.
+        :param max_pending: Maximum number of frames waiting for a worker.
+        :param name: Prefix for the worker thread names.
+        """
+        if workers < 1 or max_pending < 1:
+            raise ValueError("workers and max_pending must be at least 1.")
+        self.handler = handler
+        self.on_result = on_result
+        self.workers = workers
+        self.name = name
+
+        self.pending = deque(maxlen=max_pending)
+        self.cond = threading.Condition()
+        self.commit_lock = threading.Lock()
+        self.threads = []
+        self.running = False
+
+        self.next_seq = 0
+        self.last_committed_seq = -1
+
+        # Counters
+        self.in_flight = 0
+        self.dropped = 0
+        self.completed = 0
+        self.stale = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the worker threads."""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the workers. Pending frames that were not picked up are discarded."""
+        with self.cond:
+            self.running = False
+            self.pending.clear()
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def submit(self, frame):
+        """
+        Queue a frame for processing, dropping the oldest pending frame if the queue is full.
+
+        :param frame: The frame to pass to the handler.
+        :return: The sequence number assigned to the frame.
+        """
+        with self.cond:
+            seq = self.next_seq
+            self.next_seq += 1
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append((seq, frame))
+            self.cond.notify()
+        return seq
+
+    def stats(self):
+        """Return a snapshot of the scheduler counters."""
+        with self.cond:
+            return {
+                "in_flight": self.in_flight,
+                "pending": len(self.pending),
+                "dropped": self.dropped,
+                "completed": self.completed,
+                "stale": self.stale,
+                "failed": self.failed,
+                "last_committed_seq": self.last_committed_seq,
+            }
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                seq, frame = self.pending.popleft()
+                self.in_flight += 1
+
+            try:
+                result = self.handler(frame)
+            except Exception as e:
+                print(f"Frame {seq} failed:", e)
+                with self.cond:
+                    self.in_flight -= 1
+                    self.failed += 1
+                continue
+
+            self._commit(seq, result)
+
+    def _commit(self, seq, result):
+        with self.commit_lock:
+            is_stale = seq <= self.last_committed_seq
+            if not is_stale and result is not None:
+                self.last_committed_seq = seq
+                try:
+                    self.on_result(seq, result)
+                except Exception as e:
+                    print(f"Committing frame {seq} failed:", e)
+
+        with self.cond:
+            self.in_flight -= 1
+            if is_stale:
+                self.stale += 1
+            else:
+                self.completed += 1
+
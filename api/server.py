@@ -1,31 +1,54 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, HTTPException, WebSocket
 from fastapi.concurrency import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.websockets import WebSocketState
 import asyncio
-import serial
-
-degrees: float = 0
-last_degrees: float = None
-
-ser = serial.Serial('/dev/cu.usbmodem2101', 9600, timeout=1)
-print(f"Connected to {ser.name}")
-ser.write(b'Hello, serial port!')
-
-
-async def send_zero():
-    while True:
-        v = open("value.txt", "r").read()
-        print(f"Sending {v} to serial")
-        ser.write(str(v).encode())
-        await asyncio.sleep(3)
+import os
+import time
+
+from belt import BeltWriter, handle_button
+from broadcast import BroadcastHub
+from compass import CompassBuffer, CompassLog
+from metrics import observe, registry, serve_metrics, span
+from position_bus import HeadingPublisher, PositionBus, serve_bus
+from routing import RouteGraph
+from wire import SUBPROTOCOL, WireError, decode, encode, state_sample
+
+belt = BeltWriter(os.getenv("BELT_PORT", "/dev/cu.usbmodem2101"), 9600)
+
+
+async def forward_positions():
+    """The hub's single position producer: relay every bus update to the frontends."""
+    async for position in position_bus.subscribe():
+        if position.frame_id >= 0:
+            # Same host, so helper.py's monotonic capture time is comparable with ours.
+            observe("capture_to_server", time.monotonic() - position.captured, position.frame_id)
+        update = {
+            "coordinates": [position.latitude, position.longitude],
+            "covariance": list(position.covariance),
+            "timestamp": position.timestamp,
+        }
+        # Stamp the position with the heading at the moment it was published, not whatever arrived last.
+        heading = compass.heading_at(position.timestamp)
+        if heading is not None:
+            update["degrees"] = heading
+        frontend_hub.publish(**update)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    asyncio.create_task(send_zero())
+    await belt.start()
+    bus_transport = await serve_bus(position_bus)
+    metrics_transport = await serve_metrics(registry)
+    forwarder = asyncio.create_task(forward_positions())
     yield
-    ser.close()
+    forwarder.cancel()
+    bus_transport.close()
+    metrics_transport.close()
+    await belt.close()
+    if compass.log is not None:
+        compass.log.close()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -39,10 +62,27 @@ app.add_middleware(
 )
 
 # Global variables
-coords = [37.4280207092758, -122.17424679547551]
-last_coords = [0, 0]
+position_bus = PositionBus(37.4280207092758, -122.17424679547551)
+heading_publisher = HeadingPublisher()
+route_graph = RouteGraph.load()
 degrees: float = 0
-last_degrees: float = None
+
+# Recent compass samples; set COMPASS_LOG to also append them to a binary file.
+compass = CompassBuffer(log=CompassLog(os.environ["COMPASS_LOG"]) if os.getenv("COMPASS_LOG") else None)
+
+# Latest heading and position, fanned out to every /ws-for-frontend client. `timestamp` is
+# when the newest of the two was taken; a position carries the heading interpolated to its time.
+# Each client gets at most FRONTEND_MAX_RATE messages a second.
+FRONTEND_MAX_RATE = 20.0
+initial_position = position_bus.latest()
+frontend_hub = BroadcastHub(
+    {
+        "degrees": degrees,
+        "coordinates": [initial_position.latitude, initial_position.longitude],
+        "covariance": list(initial_position.covariance),
+    },
+    max_rate=FRONTEND_MAX_RATE,
+)
 
 # ser = serial.Serial('/dev/cu.usbmodem1101', 9600, timeout=1)
 # print(f"Connected to {ser.name}")
@@ -54,17 +94,88 @@ async def root():
     return {"message": "lmfao"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latency histograms from this process and helper.py, in Prometheus text format."""
+    return registry.render()
+
+
+@app.get("/metrics/frames")
+async def metrics_frames():
+    """Per-stage milliseconds for recently traced frames, plus a summary of every stage."""
+    return {"frames": registry.frames(), "stages": registry.summary()}
+
+
+@app.get("/route")
+async def route(destination: str, latitude: float = None, longitude: float = None):
+    """Next node and bearing towards `destination` (node id or name), from the given or latest position."""
+    if latitude is None or longitude is None:
+        position = position_bus.latest()
+        latitude, longitude = position.latitude, position.longitude
+    try:
+        step = route_graph.next_step(latitude, longitude, destination)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if step is None:
+        raise HTTPException(status_code=404, detail=f"No path to {destination}")
+    return step
+
+
+@app.get("/snap")
+async def snap(latitude: float = None, longitude: float = None):
+    """Nearest map node and edge to the given or latest position."""
+    if latitude is None or longitude is None:
+        position = position_bus.latest()
+        latitude, longitude = position.latitude, position.longitude
+    return route_graph.snap(latitude, longitude)
+
+
+@app.get("/path")
+async def path(source: str, destination: str):
+    """Node ids along the shortest path between two nodes (ids or names)."""
+    try:
+        nodes = route_graph.path(source, destination)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if nodes is None:
+        raise HTTPException(status_code=404, detail=f"No path from {source} to {destination}")
+    return {"path": nodes}
+
+
+async def accept(websocket: WebSocket):
+    """Accept a connection, choosing the binary protocol if the client offered it. Returns True for binary."""
+    if SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+        await websocket.accept(subprotocol=SUBPROTOCOL)
+        return True
+    await websocket.accept()
+    return False
+
+
+async def receive_headings(websocket: WebSocket, binary):
+    """Next batch of (heading, timestamp or None) from the phone: one per JSON message, several per binary frame."""
+    if not binary:
+        return [(await websocket.receive_json(), None)]
+    try:
+        samples = decode(await websocket.receive_bytes())
+    except WireError as e:
+        print("Dropping bad frame:", e)
+        return []
+    return [(float(sample["heading"]), float(sample["timestamp"])) for sample in samples]
+
+
 @app.websocket("/ws-for-ios")
 async def websocket_endpoint_for_ios(websocket: WebSocket):
     global degrees
-    global coords
-    await websocket.accept()
-    print("IOS connection accepted")
+    binary = await accept(websocket)
+    print("IOS connection accepted" + (" (binary)" if binary else ""))
     try:
         while True:
-            degrees = await websocket.receive_json()
-            with open("degrees.txt", "w") as f:
-                f.write(str(degrees))
+            headings = await receive_headings(websocket, binary)
+            for degrees, timestamp in headings:
+                compass.append(degrees, timestamp)
+                heading_publisher.publish(degrees, timestamp)
+            if headings:
+                frontend_hub.publish(degrees=degrees, timestamp=compass.latest()[1])
     except Exception as e:
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.close()
@@ -74,36 +185,24 @@ async def websocket_endpoint_for_ios(websocket: WebSocket):
 
 @app.websocket("/ws-for-frontend")
 async def websocket_endpoint(websocket: WebSocket):
-    global last_degrees
-    global last_coords
-    await websocket.accept()
-    await websocket.send_json({"data": {
-        "degrees": degrees,
-        "coordinates": [0, 0]
-    }})
-    print("Frontend connection accepted")
+    binary = await accept(websocket)
+    subscription = frontend_hub.subscribe()
+    print("Frontend connection accepted" + (" (binary)" if binary else ""))
     try:
-        while True:
-            coords = open("./coordinates.txt", "r").read().split()
-            coords = list(map(float, coords))
-            if coords != last_coords:
-                await websocket.send_json({"data": {
-                    "degrees": degrees,
-                    "coordinates": coords
-                }})
-                last_coords = coords
-            if degrees != last_degrees:
-                await websocket.send_json({"data": {
-                    "degrees": degrees,
-                    "coordinates": coords
-                }})
-                last_degrees = degrees
-            await asyncio.sleep(0.1)
+        # Sends the current state right away, then each change as it is published.
+        async for state in subscription:
+            with span("frontend_send"):
+                if binary:
+                    await websocket.send_bytes(encode(state_sample(state, subscription.sent_version)))
+                else:
+                    await websocket.send_json({"data": state})
     except Exception as e:
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.close()
         print(e)
         print("Frontend connection closed")
+    finally:
+        subscription.close()
 
 
 @app.websocket("/ws-for-buttons")
@@ -114,8 +213,11 @@ async def websocket_endpoint_buttons(websocket: WebSocket):
         while True:
             message = await websocket.receive_json()
             print(f"Received message: {message}")
-            with open("value.txt", "w") as f:
-                f.write(str(message["index"]))
+            try:
+                handle_button(belt, message)
+            except (KeyError, TypeError, ValueError) as e:
+                # One malformed button press should not drop the connection.
+                print("Ignoring belt command:", e)
     except Exception as e:
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.close()
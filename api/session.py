@@ -0,0 +1,245 @@
+import argparse
+import io
+import queue
+import struct
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+from frame import Frame
+
+MAGIC = b"MIRUSES1"
+
+# kind, timestamp (seconds since epoch), payload length
+RECORD = struct.Struct("<BdI")
+
+# Record kinds and their payloads
+FRAME = 1  # JPEG bytes
+COMPASS = 2  # heading in degrees
+BUTTON = 3  # belt direction index
+TRUTH = 4  # labelled latitude, longitude
+
+COMPASS_PAYLOAD = struct.Struct("<d")
+BUTTON_PAYLOAD = struct.Struct("<i")
+TRUTH_PAYLOAD = struct.Struct("<dd")
+
+
+class Session(NamedTuple):
+    # [(timestamp, JPEG bytes)]
+    frames: list
+    # (timestamps, headings) arrays
+    compass: tuple
+    # [(timestamp, index)]
+    buttons: list
+    # (timestamps, (n, 2) lat/lon) arrays
+    truth: tuple
+
+    def span(self):
+        """(first, last) timestamp of any record, or (0, 0) for an empty session."""
+        times = np.concatenate([
+            [t for t, _ in self.frames], self.compass[0], [t for t, _ in self.buttons], self.truth[0],
+        ])
+        return (float(times.min()), float(times.max())) if len(times) else (0.0, 0.0)
+
+
+class SessionRecorder:
+    """
+    Writes frames, compass samples, button presses and ground-truth labels to
+    one append-only file, in the order they are recorded.
+
+    Frames are JPEG-encoded and everything is written on a background thread,
+    so recording costs the caller a queue put. A recording cut short by a
+    crash is readable up to its last complete record.
+    """
+
+    def __init__(self, path, quality=80, max_side=1024):
+        """
+        :param path: Output file; overwritten.
+        :param quality: JPEG quality for frames.
+        :param max_side: Downscale frames so the longest side is at most this many pixels.
+        """
+        self.path = path
+        self.quality = quality
+        self.max_side = max_side
+        self.queue = queue.SimpleQueue()
+        self.counts = {FRAME: 0, COMPASS: 0, BUTTON: 0, TRUTH: 0}
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self.thread.start()
+
+    def frame(self, frame):
+        self.queue.put((FRAME, frame.timestamp, frame))
+
+    def compass(self, heading, timestamp=None):
+        self.queue.put((COMPASS, _now(timestamp), COMPASS_PAYLOAD.pack(heading)))
+
+    def button(self, index, timestamp=None):
+        self.queue.put((BUTTON, _now(timestamp), BUTTON_PAYLOAD.pack(int(index))))
+
+    def truth(self, latitude, longitude, timestamp=None):
+        """Label where the walker actually is at `timestamp`."""
+        self.queue.put((TRUTH, _now(timestamp), TRUTH_PAYLOAD.pack(latitude, longitude)))
+
+    def close(self):
+        """Write everything queued and close the file."""
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            kind, timestamp, payload = record
+            if kind == FRAME:
+                payload = payload.encode("JPEG", quality=self.quality, max_side=self.max_side)
+            self.file.write(RECORD.pack(kind, timestamp, len(payload)))
+            self.file.write(payload)
+            self.counts[kind] += 1
+
+
+def _now(timestamp):
+    return time.time() if timestamp is None else float(timestamp)
+
+
+def read_records(path):
+    """Yield (kind, timestamp, payload) for every complete record in a session file."""
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, timestamp, length = RECORD.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length:
+                return
+            yield kind, timestamp, payload
+
+
+def load_session(path):
+    """Read a whole session file into a Session."""
+    frames, compass, buttons, truth = [], [], [], []
+    for kind, timestamp, payload in read_records(path):
+        if kind == FRAME:
+            frames.append((timestamp, payload))
+        elif kind == COMPASS:
+            compass.append((timestamp, COMPASS_PAYLOAD.unpack(payload)[0]))
+        elif kind == BUTTON:
+            buttons.append((timestamp, BUTTON_PAYLOAD.unpack(payload)[0]))
+        elif kind == TRUTH:
+            truth.append((timestamp, *TRUTH_PAYLOAD.unpack(payload)))
+    compass = np.array(compass, dtype=np.float64).reshape(-1, 2)
+    truth = np.array(truth, dtype=np.float64).reshape(-1, 3)
+    return Session(frames, (compass[:, 0], compass[:, 1]), buttons, (truth[:, 0], truth[:, 1:]))
+
+
+def decode_frame(jpeg, seq=None, timestamp=None):
+    """Frame from a recorded JPEG."""
+    return Frame.from_image(Image.open(io.BytesIO(jpeg)), seq=seq, timestamp=timestamp)
+
+
+def _read_labels(recorder, nodes):
+    """
+    Read labels from stdin: a node id or name marks the walker as standing
+    on that node, "lat,lon" gives a position directly and "b <index>" records
+    a button press.
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("b "):
+            recorder.button(int(line[2:]))
+            print("button", line[2:])
+        elif "," in line:
+            latitude, longitude = map(float, line.split(","))
+            recorder.truth(latitude, longitude)
+            print("truth", latitude, longitude)
+        elif line.lower() in nodes:
+            latitude, longitude = nodes[line.lower()]
+            recorder.truth(latitude, longitude)
+            print("truth", line, latitude, longitude)
+        else:
+            print("Unknown node:", line)
+
+
+def record(path, fps=5.0, nodes_path="nodes.json"):
+    """Record the screen and compass headings until interrupted, with labels typed on stdin."""
+    from geo import load_nodes
+    from position_bus import HeadingListener
+
+    ids, names, coordinates = load_nodes(nodes_path)
+    nodes = {}
+    for node_id, name, position in zip(ids, names, coordinates):
+        nodes[str(node_id).lower()] = tuple(position)
+        nodes.setdefault(name.lower(), tuple(position))
+
+    recorder = SessionRecorder(path)
+    heading_listener = HeadingListener()
+    threading.Thread(target=_read_labels, args=(recorder, nodes), daemon=True).start()
+    last_compass = float("-inf")
+    print(f"Recording to {path}; type a node to label the current position, Ctrl-C to stop")
+    try:
+        seq = 0
+        while True:
+            started = time.monotonic()
+            recorder.frame(Frame.capture_middle(seq=seq))
+            seq += 1
+            timestamps, headings = heading_listener.compass.window(start=last_compass)
+            for timestamp, heading in zip(timestamps, headings):
+                if timestamp > last_compass:
+                    recorder.compass(heading, timestamp)
+            if len(timestamps):
+                last_compass = timestamps[-1]
+            time.sleep(max(0.0, 1.0 / fps - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        heading_listener.close()
+        recorder.close()
+        print("Recorded", recorder.counts)
+
+
+def info(path):
+    """Record counts and time span of a session file."""
+    session = load_session(path)
+    first, last = session.span()
+    return {
+        "frames": len(session.frames),
+        "compass_samples": len(session.compass[0]),
+        "buttons": len(session.buttons),
+        "labels": len(session.truth[0]),
+        "duration_s": last - first,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and inspect sessions for replay.py.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Record the screen and compass, with labels from stdin")
+    record_parser.add_argument("output", help="Session file to write")
+    record_parser.add_argument("--fps", type=float, default=5.0, help="Frames captured per second")
+    record_parser.add_argument("--nodes", default="nodes.json", help="Map nodes used for labels")
+
+    info_parser = commands.add_parser("info", help="Print record counts and duration of a session")
+    info_parser.add_argument("session", help="Session file to read")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.output, args.fps, args.nodes)
+    else:
+        for key, value in info(args.session).items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import numpy as np
+
+
+def point_segment_distances(point, starts, ends):
+    """
+    Distance from a point to each segment, the closest point on it, and where
+    that point lies along the segment (0 at start, 1 at end).
+    """
+    direction = ends - starts
+    length_squared = np.sum(direction ** 2, axis=1)
+    t = np.sum((point - starts) * direction, axis=1) / np.where(length_squared == 0, 1, length_squared)
+    t = np.clip(t, 0.0, 1.0)
+    closest = starts + t[:, None] * direction
+    return np.linalg.norm(closest - point, axis=1), closest, t
+
+
+class GridIndex:
+    """
+    Uniform grid over map nodes and edge segments in a metric frame.
+
+    Each cell lists the nodes inside it and the segments whose bounding box
+    touches it, stored CSR-style. A query scans rings of cells outward from
+    the query's cell and stops as soon as no unscanned ring can hold anything
+    closer, so it touches a handful of cells regardless of map size.
+    """
+
+    def __init__(self, points, segments=None, cell_size=None):
+        """
+        :param points: (n, 2) node positions in meters.
+        :param segments: (m, 2, 2) edge segments (start, end) in meters.
+        :param cell_size: Grid cell size in meters; by default about one node per cell.
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.segments = np.zeros((0, 2, 2)) if segments is None else np.asarray(segments, dtype=np.float64)
+        everything = np.concatenate([self.points, self.segments.reshape(-1, 2)])
+        self.origin = everything.min(axis=0)
+        extent = everything.max(axis=0) - self.origin
+        if cell_size is None:
+            cell_size = max(np.sqrt(max(extent[0], 1.0) * max(extent[1], 1.0) / max(len(self.points), 1)), 0.5)
+        self.cell_size = float(cell_size)
+        self.shape = (np.floor(extent / self.cell_size).astype(int) + 1)
+
+        node_cells = self._flat(self._cell(self.points))
+        self.node_order, self.node_start = self._csr(node_cells)
+
+        segment_cells, segment_ids = [], []
+        low = self._cell(self.segments.min(axis=1))
+        high = self._cell(self.segments.max(axis=1))
+        for i, ((x0, y0), (x1, y1)) in enumerate(zip(low, high)):
+            xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1), indexing="ij")
+            cells = self._flat(np.stack([xs.ravel(), ys.ravel()], axis=1))
+            segment_cells.append(cells)
+            segment_ids.append(np.full(len(cells), i))
+        if segment_cells:
+            cells = np.concatenate(segment_cells)
+            order, self.segment_start = self._csr(cells)
+            self.segment_order = np.concatenate(segment_ids)[order]
+        else:
+            self.segment_order, self.segment_start = self._csr(np.zeros(0, dtype=np.intp))
+
+    def _cell(self, points):
+        cells = np.floor((np.asarray(points) - self.origin) / self.cell_size).astype(int)
+        return np.clip(cells, 0, self.shape - 1)
+
+    def _flat(self, cells):
+        return cells[..., 0] * self.shape[1] + cells[..., 1]
+
+    def _csr(self, cells):
+        order = np.argsort(cells, kind="stable")
+        start = np.concatenate(([0], np.cumsum(np.bincount(cells, minlength=int(np.prod(self.shape))))))
+        return order, start
+
+    def _ring(self, center, radius, order, start):
+        """Item indices in the cells exactly `radius` rings away from `center`."""
+        cx, cy = center
+        nx, ny = self.shape
+        found = []
+        for x in range(max(cx - radius, 0), min(cx + radius, nx - 1) + 1):
+            on_edge = abs(x - cx) == radius
+            ys = range(max(cy - radius, 0), min(cy + radius, ny - 1) + 1) if on_edge else (cy - radius, cy + radius)
+            for y in ys:
+                if 0 <= y < ny:
+                    flat = x * ny + y
+                    if start[flat] != start[flat + 1]:
+                        found.append(order[start[flat]:start[flat + 1]])
+        return found
+
+    def _search(self, point, order, start, distances):
+        point = np.asarray(point, dtype=np.float64)
+        center = self._cell(point)
+        best, best_distance = None, np.inf
+        for radius in range(int(self.shape.max()) + 1):
+            found = self._ring(center, radius, order, start)
+            if found:
+                # Long segments span several cells and may be scored twice; that is harmless.
+                candidates = np.concatenate(found)
+                result = distances(point, candidates)
+                i = int(np.argmin(result[0]))
+                if result[0][i] < best_distance:
+                    best_distance = result[0][i]
+                    best = (int(candidates[i]),) + tuple(part[i] for part in result)
+            # Anything in ring radius + 1 is at least radius cells away.
+            if best is not None and best_distance <= radius * self.cell_size:
+                break
+        return best
+
+    def nearest_node(self, point):
+        """
+        Closest node to a point.
+
+        :return: (node index, distance in meters), or None for an empty index.
+        """
+        result = self._search(
+            point, self.node_order, self.node_start,
+            lambda p, candidates: (np.linalg.norm(self.points[candidates] - p, axis=1),),
+        )
+        return None if result is None else (result[0], float(result[1]))
+
+    def nearest_segment(self, point):
+        """
+        Closest edge segment to a point.
+
+        :return: (segment index, distance in meters, closest point (2,), position along the segment 0..1),
+                 or None for an index without segments.
+        """
+        result = self._search(
+            point, self.segment_order, self.segment_start,
+            lambda p, candidates: point_segment_distances(p, self.segments[candidates, 0], self.segments[candidates, 1]),
+        )
+        if result is None:
+            return None
+        index, distance, closest, t = result
+        return index, float(distance), closest, float(t)
+
+    def nearest_nodes(self, points):
+        """Batch nearest_node: (indices, distances) arrays for an (n, 2) array of points."""
+        results = [self.nearest_node(point) for point in np.asarray(points).reshape(-1, 2)]
+        return np.array([r[0] for r in results], dtype=np.intp), np.array([r[1] for r in results])
+
+    def nearest_segments(self, points):
+        """Batch nearest_segment: (indices, distances, closest points) arrays for an (n, 2) array of points."""
+        results = [self.nearest_segment(point) for point in np.asarray(points).reshape(-1, 2)]
+        return (
+            np.array([r[0] for r in results], dtype=np.intp),
+            np.array([r[1] for r in results]),
+            np.array([r[2] for r in results]).reshape(-1, 2),
+        )
@@ -0,0 +1,174 @@
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from geo import LocalFrame
+
+
+class TrackedPosition(NamedTuple):
+    latitude: float
+    longitude: float
+    # 2x2 covariance of (east, north) in square meters
+    covariance: np.ndarray
+    # sqrt of the covariance trace, a single accuracy figure in meters
+    std: float
+
+
+class ParticleTracker:
+    """
+    Particle filter over the walker's position (east/north meters in a
+    geo.LocalFrame) and walking speed.
+
+    predict() moves the particles along the compass heading at their speed,
+    update() reweights them by a visual retrieval fix. The fix likelihood mixes
+    a Gaussian with a uniform outlier term, so one bad fix barely moves the
+    estimate, and a small share of particles is re-seeded around every fix so
+    a run of consistent fixes can pull the estimate back after it went wrong.
+    """
+
+    def __init__(
+        self,
+        latitude,
+        longitude,
+        particles=2000,
+        initial_spread=3.0,
+        max_speed=2.0,
+        speed_std=0.5,
+        heading_std=20.0,
+        heading_offset=0.0,
+        diffusion=0.3,
+        fix_std=3.0,
+        outlier_probability=0.2,
+        outlier_area=2500.0,
+        reseed_fraction=0.02,
+        seed=None,
+        frame=None,
+    ):
+        """
+        :param latitude: Starting latitude; also the origin of the default frame.
+        :param longitude: Starting longitude.
+        :param particles: Number of particles.
+        :param initial_spread: Standard deviation of the starting cloud in meters.
+        :param max_speed: Fastest walking speed considered, in m/s.
+        :param speed_std: Speed random walk in m/s per sqrt(second).
+        :param heading_std: Compass noise in degrees.
+        :param heading_offset: Compass reading when facing true north.
+        :param diffusion: Position random walk in m per sqrt(second).
+        :param fix_std: Standard deviation of a visual fix in meters.
+        :param outlier_probability: Prior probability that a fix is wrong.
+        :param outlier_area: Area in square meters a wrong fix could land anywhere in.
+        :param reseed_fraction: Share of particles re-drawn around each fix.
+        :param seed: Random seed.
+        :param frame: geo.LocalFrame to track in; defaults to one centered on the start.
+        """
+        self.frame = LocalFrame(latitude, longitude) if frame is None else frame
+        self.count = particles
+        self.max_speed = max_speed
+        self.speed_std = speed_std
+        self.heading_std = np.radians(heading_std)
+        self.heading_offset = heading_offset
+        self.diffusion = diffusion
+        self.fix_std = fix_std
+        self.outlier_probability = outlier_probability
+        self.outlier_density = 1.0 / outlier_area
+        self.reseed_fraction = reseed_fraction
+
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.last_time = None
+        self.fixes = 0
+        self.reset(latitude, longitude, initial_spread)
+
+    def to_local(self, latitude, longitude):
+        """(east, north) meters in the tracker's frame."""
+        return self.frame.to_enu([latitude, longitude])
+
+    def to_geodetic(self, east, north):
+        """(lat, lon) of a point in the metric frame."""
+        latitude, longitude = self.frame.to_geodetic([east, north])
+        return float(latitude), float(longitude)
+
+    def reset(self, latitude, longitude, spread=3.0):
+        """Scatter every particle around a known position."""
+        with self.lock:
+            self.positions = self.to_local(latitude, longitude) + self.rng.normal(0, spread, (self.count, 2))
+            self.speeds = self.rng.uniform(0, self.max_speed, self.count)
+            self.weights = np.full(self.count, 1.0 / self.count)
+
+    def predict(self, heading=None, now=None):
+        """
+        Advance the particles to `now`.
+
+        :param heading: Compass heading in degrees, or None to spread in all directions.
+        :param now: time.monotonic() timestamp; defaults to now.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.last_time is None:
+                self.last_time = now
+                return
+            dt = min(max(now - self.last_time, 0.0), 1.0)
+            self.last_time = now
+            if dt == 0:
+                return
+
+            n = self.count
+            self.speeds = np.clip(self.speeds + self.rng.normal(0, self.speed_std * np.sqrt(dt), n), 0, self.max_speed)
+            if heading is None:
+                angles = self.rng.uniform(0, 2 * np.pi, n)
+            else:
+                angles = np.radians(heading - self.heading_offset) + self.rng.normal(0, self.heading_std, n)
+            step = self.speeds * dt
+            self.positions[:, 0] += step * np.sin(angles)
+            self.positions[:, 1] += step * np.cos(angles)
+            self.positions += self.rng.normal(0, self.diffusion * np.sqrt(dt), (n, 2))
+
+    def update(self, latitude, longitude, fix_std=None):
+        """
+        Weight the particles by a visual fix and resample when they degenerate.
+
+        :param latitude: Latitude of the fix.
+        :param longitude: Longitude of the fix.
+        :param fix_std: Standard deviation of this fix in meters; defaults to the tracker setting.
+        """
+        sigma = self.fix_std if fix_std is None else fix_std
+        fix = self.to_local(latitude, longitude)
+        with self.lock:
+            squared = np.sum((self.positions - fix) ** 2, axis=1)
+            gaussian = np.exp(-squared / (2 * sigma ** 2)) / (2 * np.pi * sigma ** 2)
+            likelihood = (1 - self.outlier_probability) * gaussian + self.outlier_probability * self.outlier_density
+            weights = self.weights * likelihood
+            self.weights = weights / weights.sum()
+
+            if 1.0 / np.sum(self.weights ** 2) < self.count / 2:
+                self._resample()
+
+            reseed = self.rng.random(self.count) < self.reseed_fraction
+            self.positions[reseed] = fix + self.rng.normal(0, sigma, (int(reseed.sum()), 2))
+            self.weights[reseed] = 1.0 / self.count
+            self.weights /= self.weights.sum()
+            self.fixes += 1
+
+    def _resample(self):
+        # Systematic resampling: one random offset, evenly spaced pointers.
+        pointers = (self.rng.random() + np.arange(self.count)) / self.count
+        indices = np.searchsorted(np.cumsum(self.weights), pointers)
+        indices = np.minimum(indices, self.count - 1)
+        self.positions = self.positions[indices]
+        self.speeds = self.speeds[indices]
+        self.weights = np.full(self.count, 1.0 / self.count)
+
+    def estimate(self):
+        """Weighted mean position and its covariance."""
+        with self.lock:
+            mean = self.weights @ self.positions
+            centered = self.positions - mean
+            covariance = (centered * self.weights[:, None]).T @ centered
+        latitude, longitude = self.to_geodetic(*mean)
+        return TrackedPosition(latitude, longitude, covariance, float(np.sqrt(np.trace(covariance))))
+
+    def needs_fix(self, max_std=2.0):
+        """True once the estimate has grown more uncertain than `max_std` meters."""
+        return self.estimate().std > max_std
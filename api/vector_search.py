@@ -0,0 +1,263 @@
+import os
+
+import numpy as np
+from typing import NamedTuple
+
+EMBEDDING_DIM = 512
+
+# Below this many images a brute-force matmul beats any ANN structure.
+EXACT_SEARCH_LIMIT = 20000
+
+
+class SearchHit(NamedTuple):
+    id: str
+    coordinate_x: float
+    coordinate_y: float
+    relevance: float
+
+
+def index_dtype(dim=EMBEDDING_DIM, embedding_dtype=np.float32):
+    """
+    Record layout of an index file; mirrors the fields of the Vespa `doc` schema.
+    int8 indexes carry a per-row `scale` to dequantize the embedding.
+    """
+    fields = [
+        ("id", "U64"),
+        ("coordinate_x", np.float64),
+        ("coordinate_y", np.float64),
+        ("embedding", embedding_dtype, (dim,)),
+    ]
+    if np.dtype(embedding_dtype) == np.int8:
+        fields.append(("scale", np.float32))
+    return np.dtype(fields)
+
+
+def normalize(vectors):
+    """L2-normalize the last axis, leaving zero vectors as they are."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def closeness(cosine):
+    """
+    Convert cosine similarity to Vespa's `closeness(field, embedding)` for the
+    angular metric, so local and Vespa relevance scores are interchangeable.
+    """
+    return 1.0 / (1.0 + np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+def quantize(embeddings, embedding_dtype):
+    """
+    Convert float embeddings to the on-disk dtype.
+
+    :return: (stored values, per-row scale or None)
+    """
+    embedding_dtype = np.dtype(embedding_dtype)
+    if embedding_dtype != np.int8:
+        return embeddings.astype(embedding_dtype), None
+    scale = np.abs(embeddings).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    return np.round(embeddings / scale[:, None]).astype(np.int8), scale
+
+
+def dequantize(records):
+    """Float32 embeddings of index records, whatever dtype they are stored in."""
+    embeddings = np.asarray(records["embedding"], dtype=np.float32)
+    if "scale" in records.dtype.names:
+        embeddings = embeddings * records["scale"][:, None]
+    return embeddings
+
+
+def save_index(path, ids, coordinate_x, coordinate_y, embeddings, embedding_dtype=np.float32):
+    """
+    Write an index file that load_index can memory-map.
+
+    :param path: Destination .npy file.
+    :param ids: Image ids.
+    :param coordinate_x: Latitudes.
+    :param coordinate_y: Longitudes.
+    :param embeddings: (n, dim) CLIP image embeddings; stored normalized.
+    :param embedding_dtype: float32, float16 or int8.
+    """
+    embeddings = normalize(embeddings).reshape(len(ids), -1)
+    stored, scale = quantize(embeddings, embedding_dtype)
+    records = np.zeros(len(ids), dtype=index_dtype(embeddings.shape[1], embedding_dtype))
+    records["id"] = ids
+    records["coordinate_x"] = coordinate_x
+    records["coordinate_y"] = coordinate_y
+    records["embedding"] = stored
+    if scale is not None:
+        records["scale"] = scale
+    # Write to a temporary file first so readers never map a half-written index.
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        np.save(file, records)
+    os.replace(temporary, path)
+
+
+class VectorSearch:
+    """Nearest-neighbour search over geotagged image embeddings."""
+
+    def search(self, embedding, top_k=3):
+        """
+        Return the `top_k` images closest to `embedding`, best first.
+
+        :param embedding: A 512-d query embedding (list or array).
+        :param top_k: Number of hits to return.
+        :return: A list of SearchHit.
+        """
+        raise NotImplementedError
+
+    def search_batch(self, embeddings, top_k=3):
+        """Run search() for each row of `embeddings`."""
+        return [self.search(embedding, top_k) for embedding in embeddings]
+
+
+class VespaSearch(VectorSearch):
+    """Queries the `doc` schema of a deployed Vespa application."""
+
+    def __init__(self, app, rank_profile="image_search"):
+        self.app = app
+        self.rank_profile = rank_profile
+
+    def search(self, embedding, top_k=3):
+        # [ {"targetHits": K} ] is an optional parameter to set how many neighbors to retrieve
+        yql = 'select * from doc where ([{"targetHits":' + str(top_k) + '}]nearestNeighbor(embedding, q));'
+        query_body = {
+            "yql": yql,
+            "hits": top_k,
+            "ranking": self.rank_profile,
+            "ranking.features.query(q)": list(map(float, embedding)),
+        }
+        result = self.app.query(body=query_body)
+        return [
+            SearchHit(
+                hit["fields"].get("id", hit.get("id")),
+                float(hit["fields"]["coordinate_x"]),
+                float(hit["fields"]["coordinate_y"]),
+                float(hit["relevance"]),
+            )
+            for hit in result.hits
+            if "fields" in hit
+        ]
+
+
+class _LocalIndex(VectorSearch):
+    def __init__(self, records):
+        self.records = records
+        self.ids = records["id"]
+        self.coordinate_x = records["coordinate_x"]
+        self.coordinate_y = records["coordinate_y"]
+        # Records are interleaved in the file; BLAS wants one contiguous float32 matrix.
+        self.embeddings = np.ascontiguousarray(dequantize(records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def _hits(self, rows, cosine):
+        relevance = closeness(cosine)
+        return [
+            SearchHit(str(self.ids[row]), float(self.coordinate_x[row]), float(self.coordinate_y[row]), float(score))
+            for row, score in zip(rows, relevance)
+        ]
+
+
+def _top_k(scores, top_k):
+    """Indices of the `top_k` largest scores along the last axis, sorted descending."""
+    top_k = min(top_k, scores.shape[-1])
+    if top_k == scores.shape[-1]:
+        part = np.broadcast_to(np.arange(top_k), scores.shape)
+    else:
+        part = np.argpartition(-scores, top_k - 1, axis=-1)[..., :top_k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class ExactIndex(_LocalIndex):
+    """Brute-force cosine search with a single matrix-vector product."""
+
+    def search(self, embedding, top_k=3):
+        return self.search_batch([embedding], top_k)[0]
+
+    def search_batch(self, embeddings, top_k=3):
+        queries = normalize(np.atleast_2d(embeddings))
+        scores = queries @ self.embeddings.T
+        rows = _top_k(scores, top_k)
+        return [
+            self._hits(row, np.take(score, row))
+            for row, score in zip(rows, scores)
+        ]
+
+
+class IVFIndex(_LocalIndex):
+    """
+    Inverted-file index: vectors are bucketed by their nearest k-means centroid
+    and a query only scores the `n_probe` closest buckets.
+    """
+
+    def __init__(self, records, n_lists=None, n_probe=8, iterations=10, seed=0):
+        super().__init__(records)
+        n = len(self.embeddings)
+        self.n_lists = n_lists or max(1, int(np.sqrt(n)))
+        self.n_probe = min(n_probe, self.n_lists)
+
+        rng = np.random.default_rng(seed)
+        self.centroids = self.embeddings[rng.choice(n, self.n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(self.embeddings @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, self.embeddings)
+            empty = np.bincount(assignment, minlength=self.n_lists) == 0
+            sums[empty] = self.centroids[empty]
+            self.centroids = normalize(sums)
+        assignment = np.argmax(self.embeddings @ self.centroids.T, axis=1)
+
+        # Inverted lists stored CSR-style: rows of list i are order[offsets[i]:offsets[i + 1]].
+        self.order = np.argsort(assignment, kind="stable")
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=self.n_lists))))
+
+    def search(self, embedding, top_k=3):
+        query = normalize(embedding)
+        lists = _top_k(self.centroids @ query, self.n_probe)
+        rows = np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+        scores = self.embeddings[rows] @ query
+        best = _top_k(scores, top_k)
+        return self._hits(rows[best], scores[best])
+
+
+class HNSWIndex(_LocalIndex):
+    """Graph-based ANN search backed by the optional `hnswlib` package."""
+
+    def __init__(self, records, m=16, ef_construction=200, ef=64):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("HNSWIndex requires hnswlib: pip install hnswlib") from e
+        super().__init__(records)
+        self.index = hnswlib.Index(space="cosine", dim=self.embeddings.shape[1])
+        self.index.init_index(max_elements=len(self.embeddings), M=m, ef_construction=ef_construction)
+        self.index.add_items(self.embeddings, np.arange(len(self.embeddings)))
+        self.index.set_ef(ef)
+
+    def search(self, embedding, top_k=3):
+        labels, distances = self.index.knn_query(normalize(embedding), k=min(top_k, len(self)))
+        return self._hits(labels[0], 1.0 - distances[0])
+
+
+def load_index(path, backend="auto", **kwargs):
+    """
+    Memory-map an index file written by save_index.
+
+    :param path: The .npy index file.
+    :param backend: "exact", "ivf", "hnsw", or "auto" (exact for small sets, IVF otherwise).
+    :param kwargs: Passed to the backend constructor.
+    :return: A VectorSearch.
+    """
+    records = np.load(path, mmap_mode="r")
+    if backend == "auto":
+        backend = "exact" if len(records) <= EXACT_SEARCH_LIMIT else "ivf"
+    backends = {"exact": ExactIndex, "ivf": IVFIndex, "hnsw": HNSWIndex}
+    if backend not in backends:
+        raise ValueError(f"Unknown vector search backend: {backend}")
+    return backends[backend](records, **kwargs)
@@ -0,0 +1,126 @@
+import json
+import struct
+import time
+
+import numpy as np
+
+# Offered by clients in Sec-WebSocket-Protocol to get binary frames instead of JSON.
+SUBPROTOCOL = "miru.bin.v1"
+VERSION = 1
+
+# version, sample count
+HEADER = struct.Struct("<BxH")
+
+# One fixed-layout record per sample, little-endian and unpadded (44 bytes).
+# Fields a sender does not know (e.g. position from the phone) are NaN.
+SAMPLE = np.dtype([
+    ("seq", "<u4"),
+    ("timestamp", "<f8"),
+    ("heading", "<f4"),
+    ("latitude", "<f8"),
+    ("longitude", "<f8"),
+    # (east variance, north variance, east-north covariance) in square meters
+    ("cov_ee", "<f4"),
+    ("cov_nn", "<f4"),
+    ("cov_en", "<f4"),
+])
+
+
+class WireError(ValueError):
+    """A binary frame that does not parse."""
+
+
+def samples(count):
+    """An empty array of `count` samples with every field NaN (seq 0), ready to fill in."""
+    array = np.zeros(count, dtype=SAMPLE)
+    for field in SAMPLE.names[1:]:
+        array[field] = np.nan
+    return array
+
+
+def encode(array):
+    """Pack a SAMPLE array into one frame: header followed by the raw records."""
+    array = np.ascontiguousarray(array, dtype=SAMPLE)
+    return HEADER.pack(VERSION, len(array)) + array.tobytes()
+
+
+def decode(data):
+    """
+    Unpack a frame into a read-only SAMPLE array viewing `data` (no copy).
+
+    :raises WireError: On an unknown version or a length that does not match the header.
+    """
+    if len(data) < HEADER.size:
+        raise WireError(f"Frame too short: {len(data)} bytes")
+    version, count = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise WireError(f"Unsupported wire version: {version}")
+    if len(data) != HEADER.size + count * SAMPLE.itemsize:
+        raise WireError(f"Frame of {len(data)} bytes does not hold {count} samples")
+    return np.frombuffer(data, dtype=SAMPLE, count=count, offset=HEADER.size)
+
+
+def state_sample(state, seq):
+    """A one-sample array from a frontend hub state dict (degrees, coordinates, covariance)."""
+    array = samples(1)
+    array["seq"] = seq
+    array["timestamp"] = state.get("timestamp", time.time())
+    array["heading"] = state.get("degrees", np.nan)
+    latitude, longitude = state.get("coordinates", (np.nan, np.nan))
+    array["latitude"], array["longitude"] = latitude, longitude
+    array["cov_ee"], array["cov_nn"], array["cov_en"] = state.get("covariance", (np.nan,) * 3)
+    return array
+
+
+def _json_record(sample):
+    return {
+        "seq": int(sample["seq"]),
+        "timestamp": float(sample["timestamp"]),
+        "degrees": float(sample["heading"]),
+        "coordinates": [float(sample["latitude"]), float(sample["longitude"])],
+        "covariance": [float(sample["cov_ee"]), float(sample["cov_nn"]), float(sample["cov_en"])],
+    }
+
+
+def benchmark(batch=8, frames=20000):
+    """
+    Compare JSON and binary frames carrying `batch` samples each.
+
+    :return: dict of bytes per frame and microseconds per encode/decode for each format.
+    """
+    array = samples(batch)
+    rng = np.random.default_rng(0)
+    array["seq"] = np.arange(batch)
+    array["timestamp"] = time.time() + np.arange(batch) * 0.05
+    array["heading"] = rng.uniform(0, 360, batch)
+    array["latitude"] = 37.428 + rng.normal(0, 1e-4, batch)
+    array["longitude"] = -122.174 + rng.normal(0, 1e-4, batch)
+    array["cov_ee"] = array["cov_nn"] = rng.uniform(0.5, 4, batch)
+    array["cov_en"] = 0.1
+
+    records = [_json_record(sample) for sample in array]
+
+    def timed(function, argument):
+        start = time.perf_counter()
+        for _ in range(frames):
+            result = function(argument)
+        return result, (time.perf_counter() - start) / frames * 1e6
+
+    json_frame, json_encode = timed(lambda r: json.dumps({"data": r}), records)
+    _, json_decode = timed(json.loads, json_frame)
+    binary_frame, binary_encode = timed(encode, array)
+    _, binary_decode = timed(decode, binary_frame)
+    return {
+        "samples_per_frame": batch,
+        "json": {"bytes": len(json_frame.encode()), "encode_us": json_encode, "decode_us": json_decode},
+        "binary": {"bytes": len(binary_frame), "encode_us": binary_encode, "decode_us": binary_decode},
+    }
+
+
+if __name__ == "__main__":
+    for batch in (1, 8, 32):
+        result = benchmark(batch)
+        print(f"{batch} samples/frame")
+        for name in ("json", "binary"):
+            r = result[name]
+            print(f"  {name:>6}: {r['bytes']:5d} B  encode {r['encode_us']:6.2f} us  decode {r['decode_us']:6.2f} us")
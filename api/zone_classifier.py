@@ -0,0 +1,350 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from embedder import perceptual_hash
+from metrics import span
+
+# Landmarks seen in each zone of the building, one "zone_<id>=phrase,phrase,..." line per zone.
+ZONE_DATA = """
+zone_2=terrace entrance,stairs,elevator,red wall,floor map,Terman Library,library
+zone_3=deans sign,deans portraits,Jensen Huang sign,hallway with red wall
+zone_4=red chairs,couches,tables,large space with yellow lights
+zone_5=recycling bins,trash cans,water fountain,hallway
+zone_6=posters on side of wall,white hallway
+zone_7=bathroom,bench,bathroom sign,man and female on sign, railing,white walls
+zone_8=stairwell sign,plants,glass walls,
+"""
+
+
+def parse_answer(content):
+    """
+    (zone, room_number) from a model reply of the form { zone: ..., room_number: ... },
+    with or without a ```json fence.
+    """
+    cleaned = re.sub(r"^```json\s*|```$", "", content, flags=re.MULTILINE)
+    parsed = json.loads(cleaned)
+    return parsed.get("zone", None), parsed.get("room_number", None)
+
+
+def parse_zone_data(zone_data):
+    """
+    {zone: [landmark phrases]} from lines like "zone_5=recycling bins,trash cans,hallway".
+    Zone names lose their "zone_" prefix to match the state machine's ids.
+    """
+    zones = {}
+    for line in zone_data.strip().splitlines():
+        if "=" not in line:
+            continue
+        name, phrases = line.split("=", 1)
+        name = name.strip().removeprefix("zone_")
+        zones[name] = [phrase.strip() for phrase in phrases.split(",") if phrase.strip()]
+    return zones
+
+
+class LocalZoneClassifier:
+    """
+    Zero-shot zone classification with CLIP, against landmark phrases
+    embedded once by the text encoder.
+
+    A zone scores its best-matching landmark's cosine similarity with the
+    frame embedding; scores are turned into probabilities with CLIP's logit
+    scale. Since the frame embedding is already computed (and cached) for
+    localization, a classification is one small matrix product. Answers whose
+    top-two probability margin is below `min_margin` are left to the remote
+    classifier.
+    """
+
+    def __init__(self, zones, phrase_embeddings, min_margin=0.3, logit_scale=100.0):
+        """
+        :param zones: {zone: [landmark phrases]}, e.g. from parse_zone_data().
+        :param phrase_embeddings: (total phrases, d) normalized text embeddings, in the order of `zones`.
+        :param min_margin: Smallest top-two probability margin answered locally.
+        :param logit_scale: Multiplier applied to cosine similarities before the softmax.
+        """
+        self.zones = list(zones)
+        self.phrase_embeddings = np.asarray(phrase_embeddings, dtype=np.float32)
+        counts = [len(phrases) for phrases in zones.values()]
+        if len(self.phrase_embeddings) != sum(counts) or 0 in counts:
+            raise ValueError("Every zone needs at least one phrase, with one embedding per phrase.")
+        # Start of each zone's rows, for a per-zone max with np.maximum.reduceat.
+        self.starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        self.min_margin = min_margin
+        self.logit_scale = logit_scale
+
+        # Counters
+        self.confident = 0
+        self.uncertain = 0
+
+    @classmethod
+    def from_service(cls, zones, embedding_service, template="a photo of {}", **kwargs):
+        """Embed every zone's phrases with an EmbeddingService's text encoder."""
+        phrases = [template.format(phrase) for zone_phrases in zones.values() for phrase in zone_phrases]
+        return cls(zones, embedding_service.embed_texts(phrases), **kwargs)
+
+    def probabilities(self, embedding):
+        """Probability per zone, in the order of `zones`."""
+        similarities = self.phrase_embeddings @ np.asarray(embedding, dtype=np.float32)
+        logits = self.logit_scale * np.maximum.reduceat(similarities, self.starts)
+        logits -= logits.max()
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum()
+
+    def classify(self, embedding):
+        """
+        :return: (zone, margin, confident); margin is the gap between the two most probable zones.
+        """
+        probabilities = self.probabilities(embedding)
+        if len(probabilities) == 1:
+            best, margin = 0, 1.0
+        else:
+            second, best = np.argpartition(probabilities, -2)[-2:]
+            margin = float(probabilities[best] - probabilities[second])
+        confident = margin >= self.min_margin
+        if confident:
+            self.confident += 1
+        else:
+            self.uncertain += 1
+        return self.zones[int(best)], margin, confident
+
+    def stats(self):
+        return {"confident": self.confident, "uncertain": self.uncertain}
+
+
+class ZoneClassifier:
+    """
+    Asks a vision model which zone a frame shows, without paying for
+    requests that cannot change the answer.
+
+    One OpenAI client is shared by every request and at most `max_in_flight`
+    run at once; frames arriving while all slots are busy are dropped rather
+    than queued. Before a frame is sent:
+
+    - an answer cached for the same perceptual hash is reused,
+    - a frame whose hash is already in flight is dropped,
+    - a frame whose embedding is within `min_change` cosine distance of the
+      last answered frame is skipped, since the view has not changed.
+
+    Frames go out downscaled to `max_side` pixels as JPEG.
+    """
+
+    def __init__(
+        self,
+        prompt,
+        model="gpt-4o-mini",
+        max_in_flight=2,
+        max_side=512,
+        quality=70,
+        embed=None,
+        min_change=0.02,
+        cache_size=128,
+        client=None,
+    ):
+        """
+        :param prompt: Instruction text sent with every frame; built once by the caller.
+        :param model: Chat model name.
+        :param max_in_flight: Maximum concurrent requests.
+        :param max_side: Longest image side sent, in pixels.
+        :param quality: JPEG quality.
+        :param embed: Callable frame -> normalized embedding, e.g. EmbeddingService.embed; None disables the change check.
+        :param min_change: Cosine distance to the last answered frame below which a frame is skipped.
+        :param cache_size: Number of answers kept by frame hash.
+        :param client: An OpenAI client; one is created on the first request by default.
+        """
+        self.prompt = prompt
+        self.model = model
+        self.max_side = max_side
+        self.quality = quality
+        self.embed = embed
+        self.min_change = min_change
+        self.cache_size = cache_size
+        self._client = client
+
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="zone-classifier")
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.in_flight = set()
+        self.last_embedding = None
+
+        # Counters
+        self.requests = 0
+        self.cache_hits = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.busy = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def client(self):
+        with self.lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                self._client = OpenAI()
+            return self._client
+
+    def submit(self, frame, on_answer, embedding=None):
+        """
+        Classify a frame in the background and call on_answer(zone, room_number)
+        when an answer is known; cached answers are delivered immediately.
+
+        :param embedding: The frame's CLIP embedding if the caller already has one; otherwise `embed` computes it.
+        :return: "cached", "duplicate", "unchanged", "busy" or "sent".
+        """
+        frame_hash = perceptual_hash(frame.downsampled())
+        with self.lock:
+            if frame_hash in self.cache:
+                self.cache.move_to_end(frame_hash)
+                self.cache_hits += 1
+                answer = self.cache[frame_hash]
+            elif frame_hash in self.in_flight:
+                self.duplicates += 1
+                return "duplicate"
+            else:
+                answer = None
+        if answer is not None:
+            on_answer(*answer)
+            return "cached"
+
+        if embedding is None and self.embed is not None:
+            embedding = self.embed(frame)
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            with self.lock:
+                last = self.last_embedding
+            if last is not None and 1.0 - float(embedding @ last) < self.min_change:
+                with self.lock:
+                    self.unchanged += 1
+                return "unchanged"
+
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.busy += 1
+            return "busy"
+        with self.lock:
+            self.in_flight.add(frame_hash)
+            self.requests += 1
+        self.executor.submit(self._classify, frame, frame_hash, embedding, on_answer)
+        return "sent"
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "unchanged": self.unchanged,
+                "duplicates": self.duplicates,
+                "busy": self.busy,
+                "failed": self.failed,
+                "in_flight": len(self.in_flight),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def _classify(self, frame, frame_hash, embedding, on_answer):
+        try:
+            with span("vlm_encode", frame.seq):
+                image = frame.to_base64("JPEG", quality=self.quality, max_side=self.max_side)
+            with span("vlm_request", frame.seq):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": self.prompt},
+                                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}},
+                            ],
+                        }
+                    ],
+                )
+            answer = parse_answer(response.choices[0].message.content)
+            with self.lock:
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    self.prompt_tokens += usage.prompt_tokens
+                    self.completion_tokens += usage.completion_tokens
+                self.cache[frame_hash] = answer
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+                if embedding is not None:
+                    self.last_embedding = embedding
+            on_answer(*answer)
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            print("Zone classification failed:", e)
+        finally:
+            with self.lock:
+                self.in_flight.discard(frame_hash)
+            self.slots.release()
+
+
+def classify_frame(frame, local, on_answer, remote=None, embedding=None, embed=None):
+    """
+    Answer a frame's zone from the local classifier when it is confident, and
+    hand it to the remote one otherwise.
+
+    :param local: A LocalZoneClassifier.
+    :param on_answer: Callable (zone, room_number); called now for a local answer, later for a remote one.
+    :param remote: A ZoneClassifier for uncertain frames, or None to leave them unanswered.
+    :param embedding: The frame's CLIP embedding if the caller already has one, e.g. from retrieval.
+    :param embed: Callable frame -> embedding, used only when no embedding is given.
+    :return: "local", or the remote classifier's submit() status, or "uncertain" without one.
+    """
+    if embedding is None:
+        embedding = embed(frame)
+    zone, margin, confident = local.classify(embedding)
+    if confident:
+        on_answer(zone, None)
+        return "local"
+    if remote is None:
+        return "uncertain"
+    return remote.submit(frame, on_answer, embedding=embedding)
+
+
+def check():
+    """
+    Check classify_frame's routing with a two-zone LocalZoneClassifier on
+    synthetic embeddings: a supplied embedding is answered locally without
+    embedding the frame again, and an ambiguous one goes to the remote
+    classifier together with that embedding.
+    """
+    class FakeRemote:
+        def __init__(self):
+            self.submitted = []
+
+        def submit(self, frame, on_answer, embedding=None):
+            self.submitted.append((frame, embedding))
+            return "sent"
+
+    def embed(frame):
+        raise AssertionError("classify_frame embedded a frame whose embedding was supplied")
+
+    local = LocalZoneClassifier({"2": ["elevator"], "3": ["deans sign"]}, np.eye(2, 8, dtype=np.float32))
+    remote = FakeRemote()
+    answers = []
+    on_answer = lambda zone, room_number: answers.append((zone, room_number))
+
+    status = classify_frame("frame a", local, on_answer, remote, embedding=np.eye(1, 8, 1)[0], embed=embed)
+    assert status == "local" and answers == [("3", None)] and not remote.submitted, (status, answers)
+
+    ambiguous = np.array([1, 1, 0, 0, 0, 0, 0, 0], dtype=np.float32) / np.sqrt(2)
+    status = classify_frame("frame b", local, on_answer, remote, embedding=ambiguous, embed=embed)
+    assert status == "sent" and len(answers) == 1, (status, answers)
+    assert remote.submitted[0][0] == "frame b" and remote.submitted[0][1] is ambiguous, remote.submitted
+    return local.stats()
+
+
+if __name__ == "__main__":
+    print("classify_frame OK:", check())
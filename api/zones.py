@@ -0,0 +1,171 @@
+import json
+import threading
+
+import numpy as np
+
+# Compass directions a zone can be left in, as degrees clockwise from the building's north.
+DIRECTIONS = {
+    "n": 0, "ne": 45, "e": 90, "se": 135, "s": 180, "sw": 225, "w": 270, "nw": 315,
+}
+# Transitions under this key (stairs, elevators, open plan) are allowed whatever the heading.
+ANY_DIRECTION = "any"
+
+
+class ZoneGraph:
+    """
+    A building's zones, which zones border each other, and which compass
+    headings a walker must be facing to cross each border.
+
+    Loaded from a config file (see zones.json) and compiled once into a
+    boolean table allowed[current zone, heading bucket, next zone], so a
+    transition check is a single lookup. The last heading bucket stands for
+    "heading unknown" and allows every neighbor. Zones may sit on different
+    floors; floors are joined by "any" transitions such as stairs.
+    """
+
+    def __init__(
+        self,
+        zones,
+        heading_offset=0.0,
+        heading_tolerance=60.0,
+        bucket_size=5.0,
+        name=None,
+        initial_zone=None,
+        room_numbers=None,
+    ):
+        """
+        :param zones: {zone id: {"floor": ..., "neighbors": {direction: zone id or [zone ids]}}},
+                      optionally with a per-zone "heading_tolerance".
+        :param heading_offset: Compass reading when facing the building's north.
+        :param heading_tolerance: Degrees either side of a direction within which it counts as faced.
+        :param bucket_size: Heading resolution of the table in degrees.
+        :param name: Building name.
+        :param initial_zone: Zone to start in; defaults to the first zone.
+        :param room_numbers: {room number: zone id} for rooms identifying a zone outright.
+        """
+        # Ids are strings throughout, whatever the config used.
+        self.ids = [str(zone) for zone in zones]
+        self.index = {zone: i for i, zone in enumerate(self.ids)}
+        self.floors = {str(zone): spec.get("floor") for zone, spec in zones.items()}
+        self.name = name
+        self.initial_zone = str(initial_zone) if initial_zone is not None else self.ids[0]
+        self.room_numbers = {str(room): str(zone) for room, zone in (room_numbers or {}).items()}
+        self.heading_offset = heading_offset
+        self.heading_tolerance = heading_tolerance
+        self.bucket_size = bucket_size
+        self.buckets = int(np.ceil(360 / bucket_size))
+
+        for zone in [self.initial_zone, *self.room_numbers.values()]:
+            if zone not in self.index:
+                raise ValueError(f"Unknown zone in zone config: {zone}")
+        self._compile(zones)
+
+    @classmethod
+    def load(cls, path="zones.json"):
+        with open(path) as file:
+            config = json.load(file)
+        return cls(
+            config["zones"],
+            heading_offset=config.get("heading_offset", 0.0),
+            heading_tolerance=config.get("heading_tolerance", 60.0),
+            bucket_size=config.get("bucket_size", 5.0),
+            name=config.get("name"),
+            initial_zone=config.get("initial_zone"),
+            room_numbers=config.get("room_numbers"),
+        )
+
+    def _compile(self, zones):
+        n = len(self.ids)
+        # Heading at the middle of each bucket, relative to the building's north.
+        centers = (np.arange(self.buckets) + 0.5) * self.bucket_size - self.heading_offset
+        self.table = np.zeros((n, self.buckets + 1, n), dtype=bool)
+        for zone, spec in zones.items():
+            i = self.index[str(zone)]
+            tolerance = spec.get("heading_tolerance", self.heading_tolerance)
+            for direction, targets in spec.get("neighbors", {}).items():
+                if direction != ANY_DIRECTION and direction not in DIRECTIONS:
+                    raise ValueError(f"Unknown direction {direction!r} for zone {zone}")
+                for target in targets if isinstance(targets, list) else [targets]:
+                    j = self.index.get(str(target))
+                    if j is None:
+                        raise ValueError(f"Zone {zone} borders unknown zone {target}")
+                    if direction == ANY_DIRECTION:
+                        self.table[i, :, j] = True
+                    else:
+                        off = np.abs((centers - DIRECTIONS[direction] + 180) % 360 - 180)
+                        self.table[i, :self.buckets, j] |= off <= tolerance
+                    self.table[i, self.buckets, j] = True
+
+    def bucket(self, heading):
+        """Table column for a compass heading in degrees; an unknown (None) heading gets the last column."""
+        if heading is None:
+            return self.buckets
+        return int(heading % 360 // self.bucket_size)
+
+    def allowed(self, current, next_zone, heading=None):
+        """Whether a walker in `current` facing `heading` can step into `next_zone`."""
+        i = self.index.get(str(current))
+        j = self.index.get(str(next_zone))
+        if i is None or j is None:
+            return False
+        return bool(self.table[i, self.bucket(heading), j])
+
+    def neighbors(self, current, heading=None):
+        """Zones reachable from `current` when facing `heading`."""
+        row = self.table[self.index[str(current)], self.bucket(heading)]
+        return [self.ids[j] for j in np.flatnonzero(row)]
+
+    def zone_for_room(self, room_number):
+        """Zone containing a room number, or None."""
+        return self.room_numbers.get(str(room_number))
+
+
+class AdjacentZoneStateMachine:
+    """
+    Tracks the current zone, only accepting moves the ZoneGraph allows for
+    the walker's live compass heading.
+    """
+
+    def __init__(self, graph, initial_zone=None, heading=None):
+        """
+        :param graph: A ZoneGraph.
+        :param initial_zone: The starting zone; defaults to the graph's initial zone.
+        :param heading: Callable returning the current compass heading in degrees, or None when unknown.
+        """
+        initial_zone = graph.initial_zone if initial_zone is None else str(initial_zone)
+        if initial_zone not in graph.index:
+            raise ValueError("Initial zone must be in the list of zones.")
+        self.graph = graph
+        self.zones = graph.ids
+        self.current_zone = initial_zone
+        self.heading = heading
+        self.lock = threading.RLock()  # Use a reentrant lock for thread safety
+
+    def allowed_transition(self, next_zone):
+        """
+        Check if transitioning to the next_zone is allowed from the current zone
+        at the current heading.
+
+        :param next_zone: The zone to transition to.
+        :return: True if allowed; False otherwise.
+        """
+        heading = self.heading() if self.heading is not None else None
+        with self.lock:
+            return self.graph.allowed(self.current_zone, next_zone, heading)
+
+    def transition(self, next_zone):
+        """
+        Transition to the next_zone if it's allowed.
+        """
+        with self.lock:
+            if self.allowed_transition(next_zone):
+                self.current_zone = str(next_zone)
+
+    def forced_transition(self, next_zone):
+        """
+        Force a transition to the next_zone in a thread-safe manner,
+        bypassing the usual allowed_transition checks.
+        """
+        with self.lock:
+            print(f"Forced transition from {self.current_zone} to {next_zone}.")
+            self.current_zone = str(next_zone)